@@ -1,12 +1,16 @@
 import os
+import json
 import logging
 import uuid
+import threading
 import importlib
-from typing import Optional
+import importlib.util
+from collections.abc import Mapping
+from typing import Callable, Optional
 from functools import partial
 
-from arklex.env.tools.tools import Tool
-from arklex.env.workers.worker import BaseWorker
+from arklex.env.tools.tools import Tool, tool_key
+from arklex.env.workers.worker import WorkerPool
 from arklex.env.planner.function_calling import FunctionCallingPlanner
 from arklex.utils.graph_state import Params, MessageState
 from arklex.orchestrator.NLU.nlu import SlotFilling
@@ -15,6 +19,102 @@ from arklex.orchestrator.NLU.nlu import SlotFilling
 logger = logging.getLogger(__name__)
 
 
+class ResourceRegistry:
+    """
+    Process-wide cache of the tool and worker modules and of their metadata, keyed by module path and name.
+    Modules are only located when an Env is created and imported the first time one of their resources is used,
+    every Env of the process shares the imports and the tool metadata.
+    """
+    def __init__(self):
+        self._specs = {}
+        self._modules = {}
+        self._tools = {}
+        self._worker_pools = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def module_name(package: str, path: str) -> str:
+        filepath = os.path.join(package, path)
+        return filepath.replace(os.sep, ".").replace("/", ".").removesuffix(".py")
+
+    def module_exists(self, module_name: str) -> bool:
+        with self._lock:
+            if module_name not in self._specs:
+                try:
+                    self._specs[module_name] = importlib.util.find_spec(module_name) is not None
+                except ImportError:
+                    self._specs[module_name] = False
+            return self._specs[module_name]
+
+    def get_attr(self, module_name: str, name: str):
+        with self._lock:
+            module = self._modules.get(module_name)
+            if module is None:
+                logger.info(f"Importing resource module {module_name}")
+                module = importlib.import_module(module_name)
+                self._modules[module_name] = module
+        return getattr(module, name)
+
+    def get_tool(self, module_name: str, name: str) -> dict:
+        """The tool factory with the metadata of the Tool it builds"""
+        key = (module_name, name)
+        with self._lock:
+            if key not in self._tools:
+                func = self.get_attr(module_name, name)
+                tool: Tool = func()
+                self._tools[key] = {
+                    "name": tool.name,
+                    "description": tool.description,
+                    "info": tool.info,
+                    "execute": func,
+                }
+            return self._tools[key]
+
+
+    def get_worker_pool(self, module_name: str, name: str, fixed_args: dict) -> WorkerPool:
+        """Pool of the worker instances built with the same fixed_args"""
+        key = (module_name, name, json.dumps(fixed_args, sort_keys=True, default=str))
+        with self._lock:
+            if key not in self._worker_pools:
+                func = self.get_attr(module_name, name)
+                self._worker_pools[key] = WorkerPool(partial(func, **fixed_args))
+            return self._worker_pools[key]
+
+
+resource_registry = ResourceRegistry()
+
+
+class LazyResource(Mapping):
+    """Tool or worker entry of an Env, the fields that need the resource module are loaded on first access"""
+    def __init__(self, fields: dict, loader: Callable[[], dict]):
+        self._fields = dict(fields)
+        self._loader = loader
+        self._loaded = False
+
+    def _load(self):
+        if self._loaded:
+            return
+        try:
+            self._fields = {**self._loader(), **self._fields}
+        except Exception as e:
+            logger.error(f"Resource {self._fields.get('name')} could not be loaded, error: {e}")
+            raise
+        self._loaded = True
+
+    def __getitem__(self, key):
+        if key not in self._fields:
+            self._load()
+        return self._fields[key]
+
+    def __iter__(self):
+        self._load()
+        return iter(self._fields)
+
+    def __len__(self):
+        self._load()
+        return len(self._fields)
+
+
 class BaseResourceInitializer:
     @staticmethod
     def init_tools(tools):
@@ -27,50 +127,54 @@ class BaseResourceInitializer:
 class DefaulResourceInitializer(BaseResourceInitializer):
     @staticmethod
     def init_tools(tools):
-        # return dict of valid tools with name and description
+        # return dict of valid tools with name and description, the tool modules are imported on first use
         tool_registry = {}
         for tool in tools:
             tool_id = tool["id"]
             name = tool["name"]
             path = tool["path"]
-            try: # try to import the tool to check its existance
-                filepath = os.path.join("arklex.env.tools", path)
-                module_name = filepath.replace(os.sep, ".").rstrip(".py")
-                module = importlib.import_module(module_name)
-                func = getattr(module, name)
-            except Exception as e:
-                logger.error(f"Tool {name} is not registered, error: {e}")
+            module_name = resource_registry.module_name("arklex.env.tools", path)
+            if not resource_registry.module_exists(module_name):
+                logger.error(f"Tool {name} is not registered, error: module {module_name} not found")
                 continue
-            tool_registry[tool_id] = {
-                "name": func().name,
-                "description": func().description,
-                "execute": func,
-                "fixed_args": tool.get("fixed_args", {}),
-            }
+            tool_registry[tool_id] = LazyResource(
+                {
+                    # same name register_tool gives to the tool defined in the module
+                    "name": tool_key(module_name.removeprefix("arklex.env.tools.").replace(".", "/"), name),
+                    "fixed_args": tool.get("fixed_args", {}),
+                    "timeout": tool.get("timeout"),
+                },
+                partial(resource_registry.get_tool, module_name, name)
+            )
         return tool_registry
     
     @staticmethod
     def init_workers(workers):
+        # return dict of valid workers with name and description, the worker modules are imported on first use
         worker_registry = {}
         for worker in workers:
             worker_id = worker["id"]
             name = worker["name"]
             path = worker["path"]
-            try: # try to import the worker to check its existance
-                filepath = os.path.join("arklex.env.workers", path)
-                module_name = filepath.replace(os.sep, ".").rstrip(".py")
-                module = importlib.import_module(module_name)
-                func = getattr(module, name)
-            except Exception as e:
-                logger.error(f"Worker {name} is not registered, error: {e}")
+            module_name = resource_registry.module_name("arklex.env.workers", path)
+            if not resource_registry.module_exists(module_name):
+                logger.error(f"Worker {name} is not registered, error: module {module_name} not found")
                 continue
-            worker_registry[worker_id] = {
-                "name": name,
-                "description": func.description,
-                "execute": partial(func, **worker.get("fixed_args", {}))
-            }
+            worker_registry[worker_id] = LazyResource(
+                {"name": name},
+                partial(DefaulResourceInitializer._load_worker, module_name, name, worker.get("fixed_args", {}))
+            )
         return worker_registry
 
+    @staticmethod
+    def _load_worker(module_name, name, fixed_args):
+        func = resource_registry.get_attr(module_name, name)
+        return {
+            "description": func.description,
+            "execute": partial(func, **fixed_args),
+            "pool": resource_registry.get_worker_pool(module_name, name, fixed_args),
+        }
+
 class Env():
     def __init__(self, tools, workers, slotsfillapi = "", resource_inizializer: Optional[BaseResourceInitializer] = None):
         if resource_inizializer is None:
@@ -79,51 +183,106 @@ class Env():
         self.workers = resource_inizializer.init_workers(workers)
         self.name2id = {resource["name"]: id for id, resource in {**self.tools, **self.workers}.items()}
         self.id2name = {id: resource["name"] for id, resource in {**self.tools, **self.workers}.items()}
+        self._worker_pools = {}
         self.slotfillapi = self.initialize_slotfillapi(slotsfillapi)
         self.planner = FunctionCallingPlanner(
             tools_map=self.tools,
             name2id=self.name2id
         )
 
+    def _worker_pool(self, id: str) -> WorkerPool:
+        # entries of custom resource initializers may only provide the worker factory
+        if "pool" not in self.workers[id]:
+            self._worker_pools.setdefault(id, WorkerPool(self.workers[id]["execute"]))
+            return self._worker_pools[id]
+        return self.workers[id]["pool"]
+
+    def _is_loadable(self, resources: dict, id: str) -> bool:
+        # a resource whose module fails to import falls through to the planner like an unregistered one
+        if id not in resources:
+            return False
+        try:
+            resources[id]["execute"]
+        except Exception:
+            return False
+        return True
+
     def initialize_slotfillapi(self, slotsfillapi):
         return SlotFilling(slotsfillapi)
 
+    def _update_tool_params(self, params: Params, response_state: MessageState):
+        params.memory.function_calling_trajectory = response_state.function_calling_trajectory
+        params.taskgraph.dialog_states = response_state.slots
+        params.taskgraph.node_status[params.taskgraph.curr_node] = response_state.status
+        return params
+
+    def _update_worker_params(self, id: str, params: Params, response_state: MessageState):
+        call_id = str(uuid.uuid4())
+        params.memory.function_calling_trajectory.append({
+            'content': None, 
+            'role': 'assistant', 
+            'tool_calls': [{'function': {'arguments': "{}", 'name': self.id2name[id]}, 'id': call_id, 'type': 'function'}], 
+            'function_call': None
+        })
+        params.memory.function_calling_trajectory.append({
+                    "role": "tool",
+                    "tool_call_id": call_id,
+                    "name": self.id2name[id],
+                    "content": response_state.response if response_state.response else response_state.message_flow,
+        })
+        params.taskgraph.node_status[params.taskgraph.curr_node] = response_state.status
+        return params
+
     def step(self, 
              id: str, 
              message_state: MessageState, 
              params: Params):
-        if id in self.tools:
+        if self._is_loadable(self.tools, id):
             logger.info(f"{self.tools[id]['name']} tool selected")
             tool: Tool = self.tools[id]["execute"]()
             # slotfilling is in the basetoool class
             tool.init_slotfilling(self.slotfillapi)
             response_state = tool.execute(message_state, **self.tools[id]["fixed_args"])
-            params.memory.function_calling_trajectory = response_state.function_calling_trajectory
-            params.taskgraph.dialog_states = response_state.slots
-            params.taskgraph.node_status[params.taskgraph.curr_node] = response_state.status
+            params = self._update_tool_params(params, response_state)
+                
+        elif self._is_loadable(self.workers, id):
+            logger.info(f"{self.workers[id]['name']} worker selected")
+            # reuse a pooled worker instance, its LLM client and compiled action graph
+            with self._worker_pool(id).acquire() as worker:
+                # If the worker need to do the slotfilling, then it should have this method
+                if hasattr(worker, "init_slotfilling"):
+                    worker.init_slotfilling(self.slotfillapi)
+                response_state = worker.execute(message_state)
+            params = self._update_worker_params(id, params, response_state)
+        else:
+            logger.info("planner selected")
+            action, response_state, msg_history = self.planner.execute(message_state, params.memory.function_calling_trajectory)
+        
+        
+        logger.info(f"Response state from {id}: {response_state}")
+        return response_state, params
 
+    async def astep(self, 
+             id: str, 
+             message_state: MessageState, 
+             params: Params):
+        if self._is_loadable(self.tools, id):
+            logger.info(f"{self.tools[id]['name']} tool selected")
+            tool: Tool = self.tools[id]["execute"]()
+            # slotfilling is in the basetoool class
+            tool.init_slotfilling(self.slotfillapi)
+            response_state = await tool.aexecute(message_state, **self.tools[id]["fixed_args"])
+            params = self._update_tool_params(params, response_state)
                 
-        elif id in self.workers:
+        elif self._is_loadable(self.workers, id):
             logger.info(f"{self.workers[id]['name']} worker selected")
-            worker: BaseWorker = self.workers[id]["execute"]()
-            # If the worker need to do the slotfilling, then it should have this method
-            if hasattr(worker, "init_slotfilling"):
-                worker.init_slotfilling(self.slotfillapi)
-            response_state = worker.execute(message_state)
-            call_id = str(uuid.uuid4())
-            params.memory.function_calling_trajectory.append({
-                'content': None, 
-                'role': 'assistant', 
-                'tool_calls': [{'function': {'arguments': "{}", 'name': self.id2name[id]}, 'id': call_id, 'type': 'function'}], 
-                'function_call': None
-            })
-            params.memory.function_calling_trajectory.append({
-                        "role": "tool",
-                        "tool_call_id": call_id,
-                        "name": self.id2name[id],
-                        "content": response_state.response if response_state.response else response_state.message_flow,
-            })
-            params.taskgraph.node_status[params.taskgraph.curr_node] = response_state.status
+            # reuse a pooled worker instance, its LLM client and compiled action graph
+            with self._worker_pool(id).acquire() as worker:
+                # If the worker need to do the slotfilling, then it should have this method
+                if hasattr(worker, "init_slotfilling"):
+                    worker.init_slotfilling(self.slotfillapi)
+                response_state = await worker.aexecute(message_state)
+            params = self._update_worker_params(id, params, response_state)
         else:
             logger.info("planner selected")
             action, response_state, msg_history = self.planner.execute(message_state, params.memory.function_calling_trajectory)
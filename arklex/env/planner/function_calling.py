@@ -1,24 +1,102 @@
 import logging
 import os
 import json
-from typing import Any, Dict, List
+import time
+import threading
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
 from pydantic import BaseModel
 import traceback
 
 from langchain.schema import AIMessage
-from langchain_openai import ChatOpenAI
 
 from litellm import completion
 import litellm
 
 from arklex.utils.graph_state import MessageState
 from arklex.utils.model_config import MODEL
-from arklex.utils.model_provider_config import PROVIDER_MAP
+from arklex.utils.model_provider_config import get_llm
 from arklex.orchestrator.prompts import RESPOND_ACTION_NAME
 
 
 logger = logging.getLogger(__name__)
 
+PLANNER_MAX_WORKERS = int(os.getenv("PLANNER_MAX_WORKERS", 8))
+PLANNER_TOOL_TIMEOUT = float(os.getenv("PLANNER_TOOL_TIMEOUT", 30))
+
+
+class ToolCall:
+    """One tool call run by the ToolCallRunner, its timeout counts from the moment it starts running"""
+    def __init__(self, func: Callable[[], Any], timeout: float):
+        self.func = func
+        self.timeout = timeout
+        self.started_at: Optional[float] = None
+        self.done = False
+        self.timed_out = False
+        self.result = None
+        self.error: Optional[Exception] = None
+
+
+class ToolCallRunner:
+    """
+    Runs tool calls on daemon threads, at most max_workers of them at once in the process.
+    A call that times out gives its slot back and is abandoned, its thread ends whenever the tool returns,
+    so hung tools don't starve the calls of other conversations.
+    """
+    def __init__(self, max_workers: int):
+        self._slots = threading.Semaphore(max_workers)
+        self._lock = threading.Lock()
+        self.abandoned = 0
+
+    def _run(self, call: ToolCall, cond: threading.Condition):
+        self._slots.acquire()
+        with cond:
+            call.started_at = time.monotonic()
+            cond.notify_all()
+        result, error = None, None
+        try:
+            result = call.func()
+        except Exception as e:
+            error = e
+        with cond:
+            call.result, call.error, call.done = result, error, True
+            if call.timed_out:
+                with self._lock:
+                    self.abandoned -= 1
+            else:
+                self._slots.release()
+            cond.notify_all()
+
+    def run(self, calls: List[ToolCall]) -> List[ToolCall]:
+        """Run the calls concurrently and wait until each one is done or timed out"""
+        cond = threading.Condition()
+        for call in calls:
+            threading.Thread(target=self._run, args=(call, cond), name="planner-tool", daemon=True).start()
+        with cond:
+            while True:
+                now = time.monotonic()
+                deadlines = []
+                for call in calls:
+                    if call.done or call.timed_out or call.started_at is None:
+                        continue
+                    deadline = call.started_at + call.timeout
+                    if now >= deadline:
+                        call.timed_out = True
+                        self._slots.release()
+                        with self._lock:
+                            self.abandoned += 1
+                            logger.warning(f"Abandoned a tool call after {call.timeout}s, {self.abandoned} abandoned calls still running")
+                    else:
+                        deadlines.append(deadline)
+                if all(call.done or call.timed_out for call in calls):
+                    return calls
+                # queued calls notify the condition when they start
+                cond.wait(min(deadlines) - now if deadlines else None)
+
+
+# shared by all planners, bounds the number of tool calls running at once in the process
+tool_runner = ToolCallRunner(PLANNER_MAX_WORKERS)
+
 class Action(BaseModel):
     name: str
     kwargs: Dict[str, Any]
@@ -37,9 +115,24 @@ class FunctionCallingPlanner:
         name2id: Dict[str, int]):
         super().__init__()
         self.tools_map = tools_map
-        self.tools_info = [tool["execute"]().info for tool in self.tools_map.values()]
+        self._tools_info = None
         self.name2id = name2id
 
+    @property
+    def tools_info(self):
+        # loading the tool info imports the tool modules, only do it when the planner is used
+        if self._tools_info is None:
+            tools_info = []
+            for tool in self.tools_map.values():
+                try:
+                    # entries of custom resource initializers may only provide the tool factory
+                    tools_info.append(tool["info"] if "info" in tool else tool["execute"]().info)
+                except Exception:
+                    # the error is logged by the resource, leave the tool out like an unregistered one
+                    continue
+            self._tools_info = tools_info
+        return self._tools_info
+
     def message_to_actions(
         self,
         message: Dict[str, Any],
@@ -63,16 +156,14 @@ class FunctionCallingPlanner:
             {"role": "system", "content": state.sys_instruct + "Your current task is: " + task},
         ]
         messages.extend(msg_history)
+        chat_id = state.metadata.chat_id if state.metadata is not None else None
 
         for _ in range(max_num_steps):
             logger.info(f"messages in function calling: {json.dumps(messages)}")
             logger.info(f"tools_info in function calling: {self.tools_info}")
             litellm.modify_params = True
             if not self.tools_info:
-                llm = PROVIDER_MAP.get(MODEL['llm_provider'], ChatOpenAI)(
-                    model=MODEL["model_type_or_path"],
-                    temperature = 0.0
-                )
+                llm = get_llm(temperature=0.0)
                 res = llm.invoke(messages)
                 next_message = aimessage_to_dict(res)             
             else:
@@ -89,8 +180,9 @@ class FunctionCallingPlanner:
             msg_history.append(next_message)
             logger.info("===============Function calling actions=====================")
             logger.info(actions)
-            for idx, action in enumerate(actions):
-                env_response = self.step(action)
+            # the tool calls of one message are independent, run them concurrently and keep their order
+            env_responses = self.step_many(actions, chat_id)
+            for idx, (action, env_response) in enumerate(zip(actions, env_responses)):
                 if action.name != RESPOND_ACTION_NAME:
                     messages.extend(
                         [
@@ -117,19 +209,22 @@ class FunctionCallingPlanner:
         return msg_history, action.name, env_response.observation
         
     
-    def step(self, action: Action) -> EnvResponse:
+    def step(self, action: Action, chat_id: str = None) -> EnvResponse:
         if action.name == RESPOND_ACTION_NAME:
             response = action.kwargs["content"]
             observation = response
-        elif self.name2id[action.name] in self.tools_map:
+        elif self.name2id.get(action.name) in self.tools_map:
             try:
                 calling_tool = self.tools_map[self.name2id[action.name]]
-                kwargs = action.kwargs
-                combined_kwargs = {**kwargs, **calling_tool["fixed_args"]}
-                observation = calling_tool["execute"]().func(**combined_kwargs)
+                # same path as the slot filling flow, so the planner shares the result cache and its invalidation
+                _, observation, tool_success = calling_tool["execute"]()._call_func(
+                    action.kwargs, chat_id, **calling_tool["fixed_args"]
+                )
                 if not isinstance(observation, str):
                     # Convert to string if not already
                     observation = str(observation)
+                if not tool_success:
+                    observation = f"Error: {observation}"
             except Exception as e:
                 logger.error(traceback.format_exc())
                 observation = f"Error: {e}"
@@ -138,6 +233,36 @@ class FunctionCallingPlanner:
 
         return EnvResponse(observation=observation)
     
+    def _tool_timeout(self, action: Action) -> float:
+        tool = self.tools_map.get(self.name2id.get(action.name))
+        if tool is None:
+            return PLANNER_TOOL_TIMEOUT
+        return tool.get("timeout") or PLANNER_TOOL_TIMEOUT
+
+    def step_many(self, actions: List[Action], chat_id: str = None) -> List[EnvResponse]:
+        """Run the tool actions on the shared tool runner, each with its own timeout, and return the responses in order"""
+        env_responses: List[Optional[EnvResponse]] = [None] * len(actions)
+        tool_actions = []
+        for idx, action in enumerate(actions):
+            if self.name2id.get(action.name) in self.tools_map:
+                tool_actions.append((idx, action))
+            else:
+                # responses and unknown actions don't call anything
+                env_responses[idx] = self.step(action, chat_id)
+        calls = tool_runner.run([
+            ToolCall(partial(self.step, action, chat_id), self._tool_timeout(action)) for _, action in tool_actions
+        ])
+        for (idx, action), call in zip(tool_actions, calls):
+            if call.timed_out:
+                logger.error(f"Tool {action.name} timed out after {call.timeout}s")
+                env_responses[idx] = EnvResponse(observation=f"Error: {action.name} timed out after {call.timeout}s")
+            elif call.error is not None:
+                logger.error(f"Tool {action.name} failed: {call.error}")
+                env_responses[idx] = EnvResponse(observation=f"Error: {call.error}")
+            else:
+                env_responses[idx] = call.result
+        return env_responses
+
     def execute(self, msg_state: MessageState, msg_history):
         # TODO: fix the logic for the planner
         # msg_history, action, response = self.plan(msg_state, msg_history)
@@ -0,0 +1,168 @@
+import os
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+import tiktoken
+from openai import OpenAI
+
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+# the embeddings endpoint accepts up to 2048 inputs and 300k tokens per request
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 512))
+EMBEDDING_MAX_BATCH_TOKENS = int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", 250000))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 10000))
+EMBEDDING_CACHE_DB = os.getenv("EMBEDDING_CACHE_DB", "")
+
+
+def content_hash(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\n{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Embeddings keyed by the hash of the model and the text: an in-memory LRU in front of an optional sqlite store,
+    so unchanged chunks are not embedded again when they are re-ingested or migrated, also by other processes.
+    """
+    def __init__(self, max_size: int = EMBEDDING_CACHE_SIZE, db_path: str = EMBEDDING_CACHE_DB):
+        self.max_size = max_size
+        self._cache: OrderedDict[str, np.ndarray] = OrderedDict()
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        if db_path:
+            directory_name = os.path.dirname(db_path)
+            if directory_name and not os.path.exists(directory_name):
+                os.makedirs(directory_name)
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        # ingestion runs in process pools, a sqlite connection must not be shared with forked processes
+        if not self.db_path:
+            return None
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embedding (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def _remember(self, key: str, vector: np.ndarray):
+        if self.max_size <= 0:
+            return
+        self._cache[key] = vector
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._cache.get(key)
+                if vector is not None:
+                    self._cache.move_to_end(key)
+                    found[key] = vector
+            missing = [key for key in keys if key not in found]
+            conn = self._connection()
+            if conn is not None and missing:
+                # stay below the sqlite limit of bound parameters
+                for i in range(0, len(missing), 500):
+                    batch = missing[i:i + 500]
+                    rows = conn.execute(
+                        f"SELECT key, vector FROM embedding WHERE key IN ({','.join('?' * len(batch))})", batch
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        found[key] = vector
+                        self._remember(key, vector)
+        return found
+
+    def set_many(self, vectors: Dict[str, np.ndarray]):
+        with self._lock:
+            for key, vector in vectors.items():
+                self._remember(key, vector)
+            conn = self._connection()
+            if conn is not None and vectors:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO embedding (key, vector) VALUES (?, ?)",
+                    [(key, vector.astype(np.float32).tobytes()) for key, vector in vectors.items()]
+                )
+                conn.commit()
+
+
+class EmbeddingService:
+    """Embeds texts in batches with one shared client, only the texts missing from the cache are sent"""
+    def __init__(self, model: str = EMBEDDING_MODEL, batch_size: int = EMBEDDING_BATCH_SIZE,
+                 max_batch_tokens: int = EMBEDDING_MAX_BATCH_TOKENS, cache: Optional[EmbeddingCache] = None):
+        self.model = model
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self._client = None
+        self._pid = None
+        self._encoding = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> OpenAI:
+        with self._lock:
+            if self._client is None or self._pid != os.getpid():
+                self._client = OpenAI()
+                self._pid = os.getpid()
+            return self._client
+
+    def _num_tokens(self, text: str) -> int:
+        if self._encoding is None:
+            self._encoding = tiktoken.get_encoding("cl100k_base")
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def _batches(self, texts: List[str]):
+        batch, batch_tokens = [], 0
+        for text in texts:
+            num_tokens = self._num_tokens(text)
+            if batch and (len(batch) >= self.batch_size or batch_tokens + num_tokens > self.max_batch_tokens):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += num_tokens
+        if batch:
+            yield batch
+
+    def _request(self, texts: List[str]) -> List[np.ndarray]:
+        try:
+            response = self.client.embeddings.create(input=texts, model=self.model)
+        except Exception as e:
+            logger.error(f"Error embedding {len(texts)} texts of total length {sum(len(text) for text in texts)}")
+            logger.error(texts[0][:1000])
+            logger.exception(e)
+            raise e
+        data = sorted(response.data, key=lambda item: item.index)
+        return [np.asarray(item.embedding, dtype=np.float32) for item in data]
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        keys = [content_hash(self.model, text) for text in texts]
+        vectors = self.cache.get_many(list(dict.fromkeys(keys)))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing[key] = text
+        if missing:
+            logger.info(f"Embedding {len(missing)} texts, {len(texts) - len(missing)} found in the embedding cache")
+            for batch in self._batches(list(missing.values())):
+                embedded = dict(zip([content_hash(self.model, text) for text in batch], self._request(batch)))
+                self.cache.set_many(embedded)
+                vectors.update(embedded)
+        return [vectors[key].tolist() for key in keys]
+
+    def embed(self, text: str) -> List[float]:
+        return self.embed_batch([text])[0]
+
+
+embedding_service = EmbeddingService()
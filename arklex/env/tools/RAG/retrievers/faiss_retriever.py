@@ -1,10 +1,11 @@
 import os
+import json
 import logging
-from typing import List
+import threading
+from typing import List, Optional
 import pickle
 
 from langchain.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.documents import Document
 from langchain_community.vectorstores.faiss import FAISS
@@ -14,12 +15,19 @@ from langchain_openai import OpenAIEmbeddings
 from arklex.utils.model_config import MODEL
 from arklex.env.prompts import load_prompts
 from arklex.utils.graph_state import MessageState
-from arklex.utils.model_provider_config import PROVIDER_MAP, PROVIDER_EMBEDDINGS, PROVIDER_EMBEDDING_MODELS
+from arklex.utils.model_provider_config import PROVIDER_EMBEDDINGS, PROVIDER_EMBEDDING_MODELS, get_llm
 from arklex.env.tools.utils import trace
 
 
 logger = logging.getLogger(__name__)
 
+# process-wide cache of retrievers keyed by the database path, each entry is (documents mtime, retriever)
+_retriever_cache = {}
+# guards _retriever_cache and _retriever_locks, a retriever is built under the lock of its own database path
+_retriever_cache_lock = threading.Lock()
+_retriever_locks = {}
+
+
 class RetrieveEngine():
     @staticmethod
     def faiss_retrieve(state: MessageState):
@@ -39,16 +47,16 @@ class RetrieveEngine():
 class FaissRetrieverExecutor:
     def __init__(
             self, 
-            texts: List[Document], 
+            texts: Optional[List[Document]], 
             index_path: str,
-            embedding_model_name: str =  PROVIDER_EMBEDDING_MODELS[MODEL['llm_provider']]
+            embedding_model_name: str =  PROVIDER_EMBEDDING_MODELS[MODEL['llm_provider']],
+            document_path: str = None
         ):
         self.texts = texts
         self.index_path = index_path
         self.embedding_model_name = embedding_model_name
-        self.llm = PROVIDER_MAP.get(MODEL['llm_provider'], ChatOpenAI)(
-            model=MODEL["model_type_or_path"], timeout=30000
-        )
+        self.document_path = document_path
+        self.llm = get_llm(timeout=30000)
         self.retriever = self._init_retriever()
 
     def _init_retriever(self, **kwargs):
@@ -56,9 +64,52 @@ class FaissRetrieverExecutor:
         embedding_model = PROVIDER_EMBEDDINGS.get(MODEL['llm_provider'], OpenAIEmbeddings)(
             **{ 'model': self.embedding_model_name } if MODEL['llm_provider'] != 'anthropic' else { 'model_name': self.embedding_model_name }
         )
-        docsearch = FAISS.from_documents(self.texts, embedding_model)
+        if self._is_index_fresh():
+            logger.info(f"Loading FAISS index from {self.index_path}")
+            docsearch = FAISS.load_local(self.index_path, embedding_model, allow_dangerous_deserialization=True)
+        else:
+            # the saved index holds its own docstore, the documents are only needed to build a new one
+            if self.texts is None:
+                self.texts = self._load_documents()
+            logger.info(f"Building FAISS index for {len(self.texts)} documents")
+            docsearch = FAISS.from_documents(self.texts, embedding_model)
+            self._save_index(docsearch)
         retriever = docsearch.as_retriever(**kwargs)
-        return retriever     
+        return retriever
+
+    def _load_documents(self) -> List[Document]:
+        with open(self.document_path, 'rb') as fread:
+            documents = pickle.load(fread)
+        logger.info(f"Loaded {len(documents)} documents from {self.document_path}")
+        return documents
+
+    def _index_info(self):
+        return {
+            "embedding_model": self.embedding_model_name,
+            "document_mtime": os.path.getmtime(self.document_path) if self.document_path else None,
+        }
+
+    def _is_index_fresh(self):
+        # the saved index is only reused if it was built from the same documents with the same embedding model
+        info_path = os.path.join(self.index_path, "index_info.json")
+        if not os.path.exists(os.path.join(self.index_path, "index.faiss")) or not os.path.exists(info_path):
+            return False
+        try:
+            with open(info_path, "r") as f:
+                saved_info = json.load(f)
+        except Exception as e:
+            logger.warning(f"Failed to read FAISS index info from {info_path}, error: {e}")
+            return False
+        return saved_info == self._index_info()
+
+    def _save_index(self, docsearch: FAISS):
+        try:
+            docsearch.save_local(self.index_path)
+            with open(os.path.join(self.index_path, "index_info.json"), "w") as f:
+                json.dump(self._index_info(), f)
+            logger.info(f"Saved FAISS index to {self.index_path}")
+        except Exception as e:
+            logger.warning(f"Failed to save FAISS index to {self.index_path}, error: {e}")
 
     def retrieve_w_score(self, query: str):
         k_value = 4 if not self.retriever.search_kwargs.get('k') else self.retriever.search_kwargs.get('k')
@@ -90,12 +141,24 @@ class FaissRetrieverExecutor:
     def load_docs(database_path: str, embeddings: str=None, index_path: str="./index"):
         document_path = os.path.join(database_path, "chunked_documents.pkl")
         index_path = os.path.join(database_path, "index")
-        logger.info(f"Loaded documents from {document_path}")
-        with open(document_path, 'rb') as fread:
-            documents = pickle.load(fread)
-        logger.info(f"Loaded {len(documents)} documents")
+        document_mtime = os.path.getmtime(document_path)
+        with _retriever_cache_lock:
+            cached = _retriever_cache.get(database_path)
+            if cached and cached[0] == document_mtime:
+                return cached[1]
+            path_lock = _retriever_locks.setdefault(database_path, threading.Lock())
 
-        return FaissRetrieverExecutor(
-            texts=documents,
-            index_path=index_path
-        )
+        # only the callers of the same database path wait for the index to be loaded or built
+        with path_lock:
+            with _retriever_cache_lock:
+                cached = _retriever_cache.get(database_path)
+            if cached and cached[0] == document_mtime:
+                return cached[1]
+            retriever = FaissRetrieverExecutor(
+                texts=None,
+                index_path=index_path,
+                document_path=document_path
+            )
+            with _retriever_cache_lock:
+                _retriever_cache[database_path] = (document_mtime, retriever)
+        return retriever
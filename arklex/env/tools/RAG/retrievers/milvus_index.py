@@ -0,0 +1,54 @@
+import os
+import json
+from typing import Any, Dict, Literal, Optional
+
+from pydantic import BaseModel
+
+
+# json, or path to a json file, of {"default": {...}, "<collection_name>": {...}} with IndexConfig fields
+MILVUS_INDEX_CONFIG = os.getenv("MILVUS_INDEX_CONFIG", "")
+
+DEFAULT_INDEX_PARAMS = {
+    "FLAT": {},
+    "HNSW": {"M": 16, "efConstruction": 200},
+    "IVF_FLAT": {"nlist": 1024},
+    # m has to divide the embedding dimension
+    "IVF_PQ": {"nlist": 1024, "m": 48, "nbits": 8},
+}
+DEFAULT_SEARCH_PARAMS = {
+    "FLAT": {},
+    "HNSW": {"ef": 64},
+    "IVF_FLAT": {"nprobe": 16},
+    "IVF_PQ": {"nprobe": 32},
+}
+
+
+class IndexConfig(BaseModel):
+    """ANN index of the embedding field, FLAT is exact search and the others trade recall for latency"""
+    index_type: Literal["FLAT", "HNSW", "IVF_FLAT", "IVF_PQ"] = "FLAT"
+    # the confidence scores of MilvusRetrieverExecutor are a gaussian of L2 distances
+    metric_type: Literal["L2"] = "L2"
+    params: Optional[Dict[str, Any]] = None
+    search_params: Optional[Dict[str, Any]] = None
+
+    def get_params(self) -> Dict[str, Any]:
+        return self.params if self.params is not None else DEFAULT_INDEX_PARAMS[self.index_type]
+
+    def get_search_params(self) -> Dict[str, Any]:
+        return self.search_params if self.search_params is not None else DEFAULT_SEARCH_PARAMS[self.index_type]
+
+
+def load_index_configs(config: str = MILVUS_INDEX_CONFIG) -> Dict[str, IndexConfig]:
+    if not config:
+        return {}
+    if os.path.exists(config):
+        with open(config) as f:
+            config = f.read()
+    return {name: IndexConfig.model_validate(value) for name, value in json.loads(config).items()}
+
+
+index_configs = load_index_configs()
+
+
+def get_index_config(collection_name: str) -> IndexConfig:
+    return index_configs.get(collection_name) or index_configs.get("default") or IndexConfig()
@@ -1,31 +1,184 @@
+import json
 import logging
 import time
 import os
-from typing import List
+import threading
+from typing import Callable, Iterator, List, Optional, Set, Tuple
 import numpy as np
 from collections import defaultdict
 from multiprocessing.pool import Pool
-from pymilvus import Collection, DataType, MilvusClient, connections
+from pymilvus import Collection, DataType, MilvusClient, MilvusException, connections
+from pymilvus.exceptions import CollectionNotExistException, ErrorCode
 
 from langchain.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_openai.chat_models import ChatOpenAI
 
 from arklex.env.prompts import load_prompts
 from arklex.utils.mysql import mysql_pool
 from arklex.utils.model_config import MODEL
+from arklex.utils.model_provider_config import get_llm
 from arklex.utils.graph_state import MessageState
-from arklex.env.tools.RAG.retrievers.retriever_document import RetrieverDocument, RetrieverDocumentType, RetrieverResult, embed, embed_retriever_document
+from arklex.env.tools.RAG.retrievers.retriever_document import RetrieverDocument, RetrieverDocumentType, RetrieverResult, embed, embed_retriever_documents
+from arklex.env.tools.RAG.retrievers.embedding_service import EMBEDDING_BATCH_SIZE
+from arklex.env.tools.RAG.retrievers.milvus_index import DEFAULT_SEARCH_PARAMS, IndexConfig, get_index_config
 from arklex.env.tools.utils import trace
 
 EMBED_DIMENSION = 1536
 MAX_TEXT_LENGTH = 65535
 CHUNK_NEIGHBOURS = 3
+MILVUS_HEALTH_CHECK_INTERVAL = float(os.getenv("MILVUS_HEALTH_CHECK_INTERVAL", 30))
+MILVUS_COLLECTION_CACHE_TTL = float(os.getenv("MILVUS_COLLECTION_CACHE_TTL", 300))
+MILVUS_EXISTS_BATCH_SIZE = int(os.getenv("MILVUS_EXISTS_BATCH_SIZE", 1000))
+MILVUS_UPSERT_BATCH_SIZE = int(os.getenv("MILVUS_UPSERT_BATCH_SIZE", 100))
+# vectors per page when exporting, every vector holds an EMBED_DIMENSION float embedding
+MILVUS_EXPORT_BATCH_SIZE = int(os.getenv("MILVUS_EXPORT_BATCH_SIZE", 1000))
+VECTOR_FIELDS = [
+    "id",
+    "qa_doc_id",
+    "chunk_id",
+    "qa_doc_type",
+    "num_tokens",
+    "metadata",
+    "text",
+    "embedding",
+    "timestamp",
+]
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+
+class MilvusClientManager:
+    """
+    Process-wide MilvusClient shared by the retrievals of every turn instead of a new connection per search.
+    The connection is health checked when it has been idle for a while and replaced when the check or a call fails.
+    """
+    def __init__(self, health_check_interval: float = MILVUS_HEALTH_CHECK_INTERVAL):
+        self.health_check_interval = health_check_interval
+        self._client = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> MilvusClient:
+        logger.info("Connecting the shared Milvus client")
+        return MilvusClient(uri=os.getenv("MILVUS_URI", ""), token=os.getenv("MILVUS_TOKEN", ""))
+
+    def get(self) -> MilvusClient:
+        with self._lock:
+            now = time.monotonic()
+            if self._client is not None and now - self._last_check > self.health_check_interval:
+                try:
+                    self._client.list_collections()
+                except Exception as e:
+                    logger.warning(f"Milvus health check failed, reconnecting: {e}")
+                    self._close()
+            if self._client is None:
+                self._client = self._connect()
+            self._last_check = now
+            return self._client
+
+    def _close(self):
+        try:
+            self._client.close()
+        except Exception:
+            pass
+        self._client = None
+
+    def reset(self):
+        """Drop the connection after a failed call, the next get reconnects"""
+        with self._lock:
+            if self._client is not None:
+                self._close()
+
+
+milvus_client_manager = MilvusClientManager()
+
+
+# collection name -> search params of its index, refreshed with the collection name of the bots using it
+_collection_search_params = {}
+
+
+class CollectionNameCache:
+    """
+    TTL cache of the Milvus collection of each bot version, read from the qa_bot table.
+    Refreshing or invalidating an entry also drops the cached search params of the collection,
+    its index may have been rebuilt by another process.
+    """
+    def __init__(self, ttl: float = MILVUS_COLLECTION_CACHE_TTL):
+        self.ttl = ttl
+        # (bot_id, version) -> (expires_at, collection name, when the name last changed)
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get(self, bot_id: str, version: str) -> Tuple[str, bool]:
+        """Return (collection name, whether it came from the cache)"""
+        key = (bot_id, version)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1], True
+        milvus_db = mysql_pool.fetchone("SELECT collection_name FROM qa_bot WHERE id=%s AND version=%s", (bot_id, version))
+        collection_name = milvus_db["collection_name"]
+        now = time.monotonic()
+        with self._lock:
+            changed_at = entry[2] if entry is not None else None
+            if entry is not None and entry[1] != collection_name:
+                logger.info(f"Collection of bot {bot_id} version {version} changed from {entry[1]} to {collection_name}")
+                changed_at = now
+            self._cache[key] = (now + self.ttl, collection_name, changed_at)
+            _collection_search_params.pop(collection_name, None)
+        return collection_name, False
+
+    def recently_changed(self, bot_id: str, version: str) -> bool:
+        """Whether the collection of the bot changed within the last ttl, e.g. by a migration still moving vectors"""
+        with self._lock:
+            entry = self._cache.get((bot_id, version))
+        return entry is not None and entry[2] is not None and time.monotonic() - entry[2] < self.ttl
+
+    def invalidate(self, bot_id: str, version: str):
+        with self._lock:
+            entry = self._cache.get((bot_id, version))
+            if entry is not None:
+                # keep the name to notice when it changes
+                self._cache[(bot_id, version)] = (0, entry[1], entry[2])
+                _collection_search_params.pop(entry[1], None)
+
+
+collection_name_cache = CollectionNameCache()
+
+
+class IngestionProgress:
+    """Counters of a document ingestion, logged and reported to the optional callback after every upserted batch"""
+    def __init__(self, collection_name: str, total: int, progress_callback: Optional[Callable[[dict], None]] = None):
+        self.collection_name = collection_name
+        self.total = total
+        self.progress_callback = progress_callback
+        self.checked = 0
+        self.existing = 0
+        self.upserted = 0
+        self.existence_queries = 0
+        self.upsert_calls = 0
+        self.started_at = time.time()
+
+    def to_dict(self) -> dict:
+        return {
+            "collection_name": self.collection_name,
+            "total": self.total,
+            "checked": self.checked,
+            "existing": self.existing,
+            "upserted": self.upserted,
+            "existence_queries": self.existence_queries,
+            "upsert_calls": self.upsert_calls,
+            "elapsed": round(time.time() - self.started_at, 2),
+        }
+
+    def report(self):
+        progress = self.to_dict()
+        logger.info(f"Ingestion progress: {progress}")
+        if self.progress_callback is not None:
+            self.progress_callback(progress)
+
 class RetrieveEngine():
     @staticmethod
     def milvus_retrieve(state: MessageState):
@@ -41,19 +194,27 @@ class RetrieveEngine():
         return state
 
 class MilvusRetriever:
+    def __init__(self, shared: bool = False):
+        # shared retrievers use the process-wide client and leave it open on exit
+        self.shared = shared
+
     def __enter__(self):
         self.uri = os.getenv("MILVUS_URI", "")
         self.token = os.getenv("MILVUS_TOKEN", "")
-        self.client = MilvusClient(uri=self.uri, token=self.token)
+        if self.shared:
+            self.client = milvus_client_manager.get()
+        else:
+            self.client = MilvusClient(uri=self.uri, token=self.token)
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.client.close()
+        if not self.shared:
+            self.client.close()
 
     def get_bot_uid(self, bot_id: str, version: str):
         return f"{bot_id}__{version}"
 
-    def create_collection_with_partition_key(self, collection_name: str):
+    def create_collection_with_partition_key(self, collection_name: str, index_config: Optional[IndexConfig] = None):
         schema = MilvusClient.create_schema(
             auto_id=False,
             enable_dynamic_field=True,
@@ -86,14 +247,42 @@ class MilvusRetriever:
         index_params.add_index(field_name="id")
         index_params.add_index(field_name="qa_doc_id")
         index_params.add_index(field_name="bot_uid")
+        if index_config is None:
+            index_config = get_index_config(collection_name)
+        logger.info(f"Creating collection {collection_name} with index {index_config}")
         index_params.add_index(
-            field_name="embedding", index_type="FLAT", metric_type="L2"
+            field_name="embedding",
+            index_type=index_config.index_type,
+            metric_type=index_config.metric_type,
+            params=index_config.get_params(),
         )
 
         self.client.create_collection(
             collection_name=collection_name, schema=schema, index_params=index_params
         )
 
+    def get_search_params(self, collection_name: str) -> dict:
+        """Search params of the index the collection was built with, which may predate the configured index"""
+        if collection_name not in _collection_search_params:
+            index_config = get_index_config(collection_name)
+            try:
+                index = self.client.describe_index(collection_name=collection_name, index_name="embedding")
+                index_type = index.get("index_type")
+                if index_type != index_config.index_type:
+                    metric_type = index.get("metric_type", "L2")
+                    if index_type in DEFAULT_SEARCH_PARAMS:
+                        index_config = IndexConfig(index_type=index_type, metric_type=metric_type)
+                    else:
+                        # let milvus pick the search params of other index types
+                        index_config = IndexConfig(metric_type=metric_type, search_params={})
+            except Exception as e:
+                logger.warning(f"Could not describe the index of collection {collection_name}, using the configured one: {e}")
+            _collection_search_params[collection_name] = {
+                "metric_type": index_config.metric_type,
+                "params": index_config.get_search_params(),
+            }
+        return _collection_search_params[collection_name]
+
     def delete_documents_by_qa_doc_id(self, collection_name: str, qa_doc_id: str):
         logger.info(
             f"Deleting vector db documents by qa_doc_id: {qa_doc_id} from collection: {collection_name}"
@@ -103,33 +292,51 @@ class MilvusRetriever:
         )
         return res
     
+    def existing_ids(self, collection_name: str, ids: List[str]) -> Set[str]:
+        """Ids already in the collection, checked with one query per MILVUS_EXISTS_BATCH_SIZE ids"""
+        found = set()
+        for i in range(0, len(ids), MILVUS_EXISTS_BATCH_SIZE):
+            batch_ids = ids[i:i+MILVUS_EXISTS_BATCH_SIZE]
+            res = self.client.query(
+                collection_name=collection_name,
+                filter=f"id in {json.dumps(batch_ids)}",
+                output_fields=["id"],
+            )
+            found.update(r["id"] for r in res)
+        return found
+
     def add_documents_dicts(
-        self, documents: List[dict], collection_name: str, upsert: bool = False
+        self, documents: List[dict], collection_name: str, upsert: bool = False,
+        progress_callback: Optional[Callable[[dict], None]] = None
     ):
         logger.info(f"Celery sub task for adding {len(documents)} documents to collection: {collection_name}.")
-        retriever_documents = [RetrieverDocument.from_dict(doc) for doc in documents]
-        documents_to_insert = []
-
-        if not upsert:
-            # check if the document already exists in the collection
-            for doc in retriever_documents:
-                res = self.client.get(collection_name=collection_name, ids=doc.id)
-                if len(res) == 0:
-                    documents_to_insert.append(doc)
-            logger.info(f"Exisiting documents: {len(documents_to_insert)}")
-        else:
-            documents_to_insert = retriever_documents
+        self.progress = IngestionProgress(collection_name, len(documents), progress_callback)
 
         res = []
-        for doc in documents_to_insert:
-            data = doc.to_milvus_schema_dict_and_embed()
-            try:
-                res.append(
-                    self.client.upsert(collection_name=collection_name, data=[data])
-                )
-            except Exception as e:
-                logger.error(f"Error adding document id: {data['id']} error: {e}")
-                raise e
+        # stream the documents page by page: one existence query per page, then embed and upsert it in bounded batches
+        for i in range(0, len(documents), MILVUS_EXISTS_BATCH_SIZE):
+            page = [RetrieverDocument.from_dict(doc) for doc in documents[i:i+MILVUS_EXISTS_BATCH_SIZE]]
+            self.progress.checked += len(page)
+            if not upsert:
+                existing = self.existing_ids(collection_name, [doc.id for doc in page])
+                self.progress.existence_queries += 1
+                self.progress.existing += len(existing)
+                page = [doc for doc in page if doc.id not in existing]
+
+            for j in range(0, len(page), MILVUS_UPSERT_BATCH_SIZE):
+                batch_data = embed_retriever_documents(page[j:j+MILVUS_UPSERT_BATCH_SIZE])
+                try:
+                    res.append(
+                        self.client.upsert(collection_name=collection_name, data=batch_data)
+                    )
+                except Exception as e:
+                    logger.error(f"Error adding document ids: {[data['id'] for data in batch_data]} error: {e}")
+                    raise e
+                self.progress.upserted += len(batch_data)
+                self.progress.upsert_calls += 1
+                self.progress.report()
+        if not self.progress.upsert_calls:
+            self.progress.report()
         return res
     
     def add_documents_parallel(
@@ -145,26 +352,23 @@ class MilvusRetriever:
         documents_to_insert = []
 
         if not upsert:
-            # check if the document already exists in the collection
-            for doc in documents:
-                res = self.client.get(collection_name=collection_name, ids=doc.id)
-                if len(res) == 0:
-                    documents_to_insert.append(doc)
-            logger.info(f"Exisiting documents: {len(documents_to_insert)}")
+            # check which documents already exist in the collection in bulk
+            existing = self.existing_ids(collection_name, [doc.id for doc in documents])
+            documents_to_insert = [doc for doc in documents if doc.id not in existing]
+            logger.info(f"Exisiting documents: {len(existing)}, new documents: {len(documents_to_insert)}")
         else:
             documents_to_insert = documents
 
         res = []
-        # process 100 documents at a time
         count = 0
-        for i in range(0, len(documents_to_insert), 100):
-            batch_docs = documents_to_insert[i:i+100]
-            embedded_batch_docs = process_pool.map(embed_retriever_document, batch_docs)
-
-            res.extend(
-                self.client.upsert(collection_name=collection_name, data=embedded_batch_docs)
-            )
-            count += len(batch_docs)
+        # every process of the pool embeds a whole batch in batched requests, upsert 100 documents at a time
+        batches = [documents_to_insert[i:i+EMBEDDING_BATCH_SIZE] for i in range(0, len(documents_to_insert), EMBEDDING_BATCH_SIZE)]
+        for embedded_batch_docs in process_pool.imap(embed_retriever_documents, batches):
+            for j in range(0, len(embedded_batch_docs), 100):
+                res.extend(
+                    self.client.upsert(collection_name=collection_name, data=embedded_batch_docs[j:j+100])
+                )
+            count += len(embedded_batch_docs)
             logger.info(f"Added {count}/{len(documents_to_insert)} docs")
 
         return res
@@ -182,39 +386,41 @@ class MilvusRetriever:
         documents_to_insert = []
 
         if not upsert:
-            # check if the document already exists in the collection
-            for doc in documents:
-                res = self.client.get(collection_name=collection_name, ids=doc.id)
-                if len(res) == 0:
-                    documents_to_insert.append(doc)
-            logger.info(f"Exisiting documents: {len(documents_to_insert)}")
+            # check which documents already exist in the collection in bulk
+            existing = self.existing_ids(collection_name, [doc.id for doc in documents])
+            documents_to_insert = [doc for doc in documents if doc.id not in existing]
+            logger.info(f"Exisiting documents: {len(existing)}, new documents: {len(documents_to_insert)}")
         else:
             documents_to_insert = documents
 
         res = []
-        for doc in documents_to_insert:
-            data = doc.to_milvus_schema_dict_and_embed()
+        # embed and upsert 100 documents at a time
+        for i in range(0, len(documents_to_insert), 100):
+            batch_data = embed_retriever_documents(documents_to_insert[i:i+100])
             try:
                 res.append(
-                    self.client.upsert(collection_name=collection_name, data=[data])
+                    self.client.upsert(collection_name=collection_name, data=batch_data)
                 )
             except Exception as e:
-                logger.error(f"Error adding document id: {data['id']} error: {e}")
+                logger.error(f"Error adding document ids: {[data['id'] for data in batch_data]} error: {e}")
                 raise e
         return res
 
-    def search(self, collection_name: str, bot_id: str, version: str, query: str, top_k: int = 4) -> List[RetrieverResult]:
+    def search(self, collection_name: str, bot_id: str, version: str, query: str, top_k: int = 4,
+               query_embedding: Optional[List[float]] = None) -> List[RetrieverResult]:
         logger.info(
             f"Retreiver search for query: {query} on collection {collection_name} for bot_id: {bot_id} version: {version}"
         )
         
         partition_key = self.get_bot_uid(bot_id, version)
-        query_embedding = embed(query)
+        if query_embedding is None:
+            query_embedding = embed(query)
         res = self.client.search(
             collection_name=collection_name,
             data=[query_embedding],
             limit=top_k,
             filter=f"bot_uid == '{partition_key}'",
+            search_params=self.get_search_params(collection_name),
             output_fields=["qa_doc_id", "chunk_id", "qa_doc_type", "metadata", "text"],
         )
 
@@ -395,43 +601,49 @@ class MilvusRetriever:
         return self.client.release_collection(collection_name)
     
     def drop_collection(self, collection_name: str):
+        _collection_search_params.pop(collection_name, None)
         return self.client.drop_collection(collection_name)
     
-    def get_all_vectors(self, collection_name: str):
+    def iter_vectors(
+        self, collection_name: str, expr: Optional[str] = None, output_fields: List[str] = VECTOR_FIELDS,
+        batch_size: int = MILVUS_EXPORT_BATCH_SIZE, start_after: Optional[str] = None
+    ) -> Iterator[List[dict]]:
+        """
+        Stream the vectors page by page in primary key order, only one page is held in memory.
+        start_after resumes the export after the last id of a previous page.
+        """
         connections.connect(
             uri=self.uri,
             token=self.token,
         )
         collection = Collection(collection_name)
 
+        filters = [expr] if expr else []
+        if start_after is not None:
+            filters.append(f"id > {json.dumps(start_after)}")
         iterator = collection.query_iterator(
-            batch_size=16000,
-            output_fields=[
-                'id',
-                'qa_doc_id',
-                "chunk_id",
-                "qa_doc_type",
-                "num_tokens",
-                "metadata", 
-                "text",
-                "embedding",
-                "timestamp",
-            ],
+            batch_size=batch_size,
+            expr=" and ".join(f"({f})" for f in filters) if filters else None,
+            output_fields=output_fields,
         )
-
-        vectors = []
-        count = 0
-        while True:
-            result = iterator.next()
-            if len(result) == 0:
-                iterator.close()
-                break
-
-            for r in result:
-                vectors.append(r)
-                count += 1
-        
-        logger.info(f"collection {collection_name} Total vectors: {count}")
+        try:
+            while True:
+                result = iterator.next()
+                if len(result) == 0:
+                    break
+                yield result
+        finally:
+            iterator.close()
+
+    def iter_all_vectors(self, collection_name: str) -> Iterator[dict]:
+        """Stream every vector of the collection one at a time, only one page is held in memory"""
+        for page in self.iter_vectors(collection_name):
+            yield from page
+
+    def get_all_vectors(self, collection_name: str) -> List[dict]:
+        # loads the whole collection, use iter_all_vectors for large collections
+        vectors = list(self.iter_all_vectors(collection_name))
+        logger.info(f"collection {collection_name} Total vectors: {len(vectors)}")
         return vectors
 
     def add_vectors_parallel(
@@ -448,13 +660,8 @@ class MilvusRetriever:
 
         if not upsert:
             # check if the document already exists in the collection
-            for vec in vectors:
-                res = self.client.query(
-                    collection_name=collection_name, 
-                    ids=vec["id"], 
-                )
-                if len(res) == 0:
-                    vectors_to_insert.append(vec)
+            existing = self.existing_ids(collection_name, [vec["id"] for vec in vectors])
+            vectors_to_insert = [vec for vec in vectors if vec["id"] not in existing]
             logger.info(f"New vectors to insert: {len(vectors_to_insert)}")
         else:
             vectors_to_insert = vectors
@@ -516,53 +723,40 @@ class MilvusRetriever:
         # real time vector count for the collection
         return self.client.query(collection_name=collection_name, output_fields=["count(*)"])[0]["count(*)"]
     
-    def migrate_vectors(self, old_collection_name: str, bot_id: str, version: str, new_collection_name: str):
+    def migrate_vectors(
+        self, old_collection_name: str, bot_id: str, version: str, new_collection_name: str,
+        resume_from: Optional[str] = None, checkpoint_callback: Optional[Callable[[dict], None]] = None
+    ):
+        """
+        Stream the vectors of the bot version page by page into the new collection, then delete them from the old one.
+        The pages are upserted, so an interrupted migration is resumed by passing the last_id of its last checkpoint
+        as resume_from. Return the number of vectors moved by this call.
+        """
         partition_key = self.get_bot_uid(bot_id, version)
-        connections.connect(
-            uri=self.uri,
-            token=self.token,
-        )
-        collection = Collection(old_collection_name)
+        collection_name_cache.invalidate(bot_id, version)
 
-        iterator = collection.query_iterator(
-            batch_size=16000,
-            expr=f"bot_uid=='{partition_key}'",
-            output_fields=[
-                'id',
-                'bot_uid',
-                'qa_doc_id',
-                "chunk_id",
-                "num_tokens",
-                "qa_doc_type",
-                "metadata", 
-                "text",
-                "embedding",
-                "timestamp",
-            ],
-        )
-
-        vectors = []
-        count = 0
-        while True:
-            result = iterator.next()
-            if len(result) == 0:
-                iterator.close()
-                break
-
-            for r in result:
-                vectors.append(r)
-                count += 1
-
-        logger.info(f"migrating {count} vectors for bot {bot_id} version {version}")
-        
-        # add vectors to new collection
         if not self.has_collection(new_collection_name):
             logger.info(f"No collection found hence creating collection: {new_collection_name}")
             self.create_collection_with_partition_key(new_collection_name)
-        self.add_vectors_parallel(new_collection_name, bot_id, version, vectors)
+
+        logger.info(f"migrating vectors for bot {bot_id} version {version}" + (f" after id {resume_from}" if resume_from is not None else ""))
+        count = 0
+        for page in self.iter_vectors(
+            old_collection_name, expr=f"bot_uid=='{partition_key}'", output_fields=["bot_uid", *VECTOR_FIELDS], start_after=resume_from
+        ):
+            for vec in page:
+                vec["bot_uid"] = partition_key
+            for i in range(0, len(page), MILVUS_UPSERT_BATCH_SIZE):
+                self.client.upsert(collection_name=new_collection_name, data=page[i:i+MILVUS_UPSERT_BATCH_SIZE])
+            count += len(page)
+            checkpoint = {"last_id": page[-1]["id"], "count": count}
+            logger.info(f"{new_collection_name}: migrated {count} vectors for bot {bot_id} version {version}, checkpoint: {checkpoint}")
+            if checkpoint_callback is not None:
+                checkpoint_callback(checkpoint)
 
         # delete vectors from old collection
         self.delete_vectors_by_partition_key(old_collection_name, bot_id, version)
+        collection_name_cache.invalidate(bot_id, version)
         
         logger.info(f"moved {count} vectors from {old_collection_name} to {new_collection_name}")
         return count
@@ -571,10 +765,14 @@ class MilvusRetriever:
         return self.client.list_collections()
 
 
+def _is_collection_not_found(e: Exception) -> bool:
+    return isinstance(e, CollectionNotExistException) or getattr(e, "code", None) == ErrorCode.COLLECTION_NOT_FOUND
+
+
 class MilvusRetrieverExecutor:
     def __init__(self, bot_config):
         self.bot_config = bot_config
-        self.llm = ChatOpenAI(model=MODEL["model_type_or_path"], timeout=30000)
+        self.llm = get_llm(llm_provider="openai", timeout=30000)
 
     def generate_thought(self, retriever_results: List[RetrieverResult]) -> str:
         # post process list of documents into str
@@ -607,6 +805,33 @@ class MilvusRetrieverExecutor:
             retriever_returns.append(item)
         return {"retriever": retriever_returns}
 
+    def search(self, query: str) -> List[RetrieverResult]:
+        bot_id, version = self.bot_config.bot_id, self.bot_config.version
+        collection_name, cached = collection_name_cache.get(bot_id, version)
+        # embedding errors are not connection problems, they are raised before the retry below
+        query_embedding = embed(query)
+        try:
+            with MilvusRetriever(shared=True) as retriever:
+                ret_results = retriever.search(collection_name, bot_id, version, query, query_embedding=query_embedding)
+        except (MilvusException, ConnectionError) as e:
+            if _is_collection_not_found(e):
+                logger.warning(f"Collection {collection_name} not found, looking up the collection of bot {bot_id} version {version} again")
+            else:
+                logger.warning(f"Milvus search failed, retrying with a new connection: {e}")
+                milvus_client_manager.reset()
+            collection_name_cache.invalidate(bot_id, version)
+            collection_name, cached = collection_name_cache.get(bot_id, version)
+            with MilvusRetriever(shared=True) as retriever:
+                return retriever.search(collection_name, bot_id, version, query, query_embedding=query_embedding)
+        # empty results are normal, only look the collection up again while the bot is being moved to another one
+        if not ret_results and cached and collection_name_cache.recently_changed(bot_id, version):
+            collection_name_cache.invalidate(bot_id, version)
+            fresh_collection_name, _ = collection_name_cache.get(bot_id, version)
+            if fresh_collection_name != collection_name:
+                with MilvusRetriever(shared=True) as retriever:
+                    ret_results = retriever.search(fresh_collection_name, bot_id, version, query, query_embedding=query_embedding)
+        return ret_results
+
     def retrieve(self, chat_history_str):
         """Given a chat history, retrieve relevant information from the database."""
         st = time.time()
@@ -620,9 +845,7 @@ class MilvusRetrieverExecutor:
 
         ret_results: List[RetrieverResult] = []
         st = time.time()
-        milvus_db = mysql_pool.fetchone("SELECT collection_name FROM qa_bot WHERE id=%s AND version=%s", (self.bot_config.bot_id, self.bot_config.version))
-        with MilvusRetriever() as retriever:
-            ret_results = retriever.search(milvus_db["collection_name"], self.bot_config.bot_id, self.bot_config.version, ret_input)
+        ret_results = self.search(ret_input)
         rt = time.time() - st
         logger.info(f"MilvusRetriever search took {rt} seconds")
         retriever_params = self.postprocess(ret_results)
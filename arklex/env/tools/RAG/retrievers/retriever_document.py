@@ -1,11 +1,11 @@
 import json
 from enum import Enum
 from typing import List, Dict
-from openai import OpenAI
 import logging
 
 import tiktoken
 from arklex.utils.mysql import mysql_pool
+from arklex.env.tools.RAG.retrievers.embedding_service import embedding_service
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 DEFAULT_CHUNK_ENCODING = "cl100k_base"
@@ -13,15 +13,7 @@ DEFAULT_CHUNK_ENCODING = "cl100k_base"
 logger = logging.getLogger(__name__)
 
 def embed(text: str):
-    client = OpenAI()
-    try:
-        response = client.embeddings.create(input=text, model="text-embedding-ada-002")
-    except Exception as e:
-        logger.error(f"Error embedding text of length {len(text)}")
-        logger.error(text[:1000])
-        logger.exception(e)
-        raise e
-    return response.data[0].embedding    
+    return embedding_service.embed(text)
 
 class RetrieverDocumentType(Enum):
     WEBSITE = "website"
@@ -127,7 +119,7 @@ class RetrieverDocument:
             "bot_uid": self.bot_uid,
         }
     
-    def to_milvus_schema_dict_and_embed(self) -> Dict:
+    def to_milvus_schema_dict_and_embed(self, embedding: List[float] = None) -> Dict:
         # check if values exists
         if (
             self.id is None
@@ -151,7 +143,7 @@ class RetrieverDocument:
             "metadata": self.metadata,
             "timestamp": self.timestamp,
             # "num_tokens": self.num_tokens,
-            "embedding": embed(self.text),
+            "embedding": embedding if embedding is not None else embed(self.text),
             "bot_uid": self.bot_uid,
         }
     
@@ -276,5 +268,10 @@ class RetrieverDocument:
 def embed_retriever_document(retriever_document: RetrieverDocument):
     return retriever_document.to_milvus_schema_dict_and_embed()
 
+def embed_retriever_documents(retriever_documents: List[RetrieverDocument]) -> List[Dict]:
+    """Embed the documents in batched requests, the chunks already embedded before come from the embedding cache"""
+    embeddings = embedding_service.embed_batch([doc.text for doc in retriever_documents])
+    return [doc.to_milvus_schema_dict_and_embed(embedding) for doc, embedding in zip(retriever_documents, embeddings)]
+
 def get_bot_uid(bot_id: str, version: str):
     return f"{bot_id}__{version}"
\ No newline at end of file
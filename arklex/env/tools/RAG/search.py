@@ -1,12 +1,11 @@
 import logging
 
 from arklex.utils.model_config import MODEL
-from arklex.utils.model_provider_config import PROVIDER_MAP
+from arklex.utils.model_provider_config import get_llm
 from arklex.env.prompts import load_prompts
 from arklex.utils.graph_state import MessageState
 
 from langchain.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
 from langchain_community.tools import TavilySearchResults
 
@@ -16,9 +15,7 @@ logger = logging.getLogger(__name__)
 
 class SearchEngine():
     def __init__(self):
-        self.llm = PROVIDER_MAP.get(MODEL['llm_provider'], ChatOpenAI)(
-            model=MODEL["model_type_or_path"], timeout=30000
-        )
+        self.llm = get_llm(timeout=30000)
         self.search_tool = TavilySearchResults(
             max_results=5,
             search_depth="advanced",
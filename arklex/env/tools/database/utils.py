@@ -6,11 +6,11 @@ import logging
 import pandas as pd
 
 from langchain.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
 
 from arklex.utils.utils import chunk_string
 from arklex.utils.model_config import MODEL
+from arklex.utils.model_provider_config import get_llm
 from arklex.utils.graph_state import Slot, SlotDetail, MessageState
 from arklex.env.prompts import load_prompts
 from arklex.utils.graph_state import StatusEnum
@@ -61,7 +61,7 @@ NO_BOOKING_MESSAGE = "You have not booked any show."
 class DatabaseActions:
     def __init__(self, user_id: str=USER_ID):
         self.db_path = os.path.join(os.environ.get("DATA_DIR"), DBNAME)
-        self.llm = ChatOpenAI(model=MODEL["model_type_or_path"], timeout=30000)
+        self.llm = get_llm(llm_provider="openai", timeout=30000)
         self.user_id = user_id
 
     def log_in(self):
@@ -21,6 +21,7 @@ slots = [
         "description": "The email of the user, such as 'something@example.com'.",
         "prompt": "In order to proceed, please provide the email for setting up the meeting",
         "required": True,
+        "extractor": "email",
     },
     {
         "name": "event",
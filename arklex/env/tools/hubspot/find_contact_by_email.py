@@ -19,6 +19,7 @@ slots = [
         "description": "The email of the user, such as 'something@example.com'.",
         "prompt": "Thanks for your interest in our products! Could you please provide your email or phone number?",
         "required": True,
+        "extractor": "email",
     },
     {
         "name": "chat",
@@ -20,7 +20,7 @@ outputs = [
 ]
 
 
-@register_tool(description, slots, outputs)
+@register_tool(description, slots, outputs, invalidates={"order": "cancel_order_id", "user": None})
 def cancel_order(cancel_order_id: str, **kwargs) -> str:
     func_name = inspect.currentframe().f_code.co_name
     auth = authorify_admin(kwargs)
@@ -13,7 +13,7 @@ outputs = [
 ]
 
 
-@register_tool(description, slots, outputs)
+@register_tool(description, slots, outputs, invalidates={"cart": "cart_id"})
 def cart_add_items(cart_id: str, product_variant_ids: list[str], **kwargs):
     func_name = inspect.currentframe().f_code.co_name
     auth = authorify_storefront(kwargs)
@@ -26,7 +26,7 @@ outputs = []
 CART_REMOVE_ITEM_ERROR = "error: products could not be removed from cart"
 errors = [CART_REMOVE_ITEM_ERROR]
 
-@register_tool(description, slots, outputs, lambda x: x not in errors)
+@register_tool(description, slots, outputs, lambda x: x not in errors, invalidates={"cart": "cart_id"})
 def cart_remove_items(cart_id, line_ids):
     try:
         query = '''
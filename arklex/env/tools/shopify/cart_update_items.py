@@ -28,7 +28,7 @@ outputs = []
 CART_UPDATE_ITEM_ERROR = "error: products could not be updated to cart"
 errors = [CART_UPDATE_ITEM_ERROR]
 
-@register_tool(description, slots, outputs, lambda x: x not in errors)
+@register_tool(description, slots, outputs, lambda x: x not in errors, invalidates={"cart": "cart_id"})
 def cart_update_items(cart_id, items):
     try:
         query = '''
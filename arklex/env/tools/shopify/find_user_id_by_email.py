@@ -16,7 +16,7 @@ outputs = [
 ]
 
 
-@register_tool(description, slots, outputs)
+@register_tool(description, slots, outputs, cache={"ttl": 600, "scope": "global"})
 def find_user_id_by_email(user_email: str, **kwargs) -> str:
     func_name = inspect.currentframe().f_code.co_name
     auth = authorify_admin(kwargs)
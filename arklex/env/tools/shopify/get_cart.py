@@ -17,7 +17,7 @@ outputs = [
 ]
 
 
-@register_tool(description, slots, outputs)
+@register_tool(description, slots, outputs, cache={"ttl": 60, "entities": {"cart": "cart_id"}})
 def get_cart(cart_id, **kwargs):
     func_name = inspect.currentframe().f_code.co_name
     nav = cursorify(kwargs)
@@ -17,7 +17,7 @@ outputs = [
 ]
 
 
-@register_tool(description, slots, outputs)
+@register_tool(description, slots, outputs, cache={"ttl": 60, "entities": {"order": "order_ids", "user": "user_id"}})
 def get_order_details(order_ids: list, order_names: list, user_id: str, limit=10, **kwargs) -> str:
     func_name = inspect.currentframe().f_code.co_name
     limit = int(limit) if limit else 10
@@ -23,7 +23,7 @@ outputs = [
 ]
 
 
-@register_tool(description, slots, outputs)
+@register_tool(description, slots, outputs, cache={"ttl": 300, "scope": "global", "entities": {"product": "product_ids"}})
 def get_products(product_ids: list, **kwargs) -> str:
     func_name = inspect.currentframe().f_code.co_name
     nav = cursorify(kwargs)
@@ -22,7 +22,7 @@ outputs = [
 ]
 
 
-@register_tool(description, slots, outputs)
+@register_tool(description, slots, outputs, cache={"ttl": 60, "entities": {"user": "user_id"}})
 def get_user_details_admin(user_id: str, **kwargs) -> str:
     func_name = inspect.currentframe().f_code.co_name
     nav = cursorify(kwargs)
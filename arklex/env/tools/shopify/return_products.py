@@ -21,7 +21,7 @@ outputs = [
 ]
 
 
-@register_tool(description, slots, outputs)
+@register_tool(description, slots, outputs, invalidates={"order": "return_order_id", "user": None})
 def return_products(return_order_id: str, **kwargs) -> str:
     func_name = inspect.currentframe().f_code.co_name
     auth = authorify_admin(kwargs)
@@ -91,7 +91,8 @@ class ShopifyFindUserByEmailSlots(ShopifySlots):
         "description": "The email of the user, such as 'something@example.com'.",
         "prompt": "In order to proceed, please provide the email for identity verification.",
         "required": True,
-        "verified": True
+        "verified": True,
+        "extractor": "email"
     }
 
 class ShopifyGetCartSlots(ShopifySlots):
@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Literal, Optional
+
+from pydantic import BaseModel
+
+
+logger = logging.getLogger(__name__)
+
+TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE_ENABLED", "1") != "0"
+
+
+class CachePolicy(BaseModel):
+    """
+    Result cache settings of a read-only tool, passed as register_tool(..., cache={...})
+    key_fields: slot names the result depends on, all the slots by default. The fixed_args are always part of the key.
+    scope: "conversation" keeps the results of each chat_id apart, "global" shares them across conversations.
+    entities: entity type -> slot name holding the entity id(s), used to invalidate the result when a mutating tool
+    changes the entity, e.g. {"order": "order_ids"}
+    """
+    ttl: float = 300
+    max_entries: int = 1000
+    key_fields: Optional[List[str]] = None
+    scope: Literal["conversation", "global"] = "conversation"
+    entities: Dict[str, str] = {}
+
+
+def _entity_ids(value) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return [str(v) for v in value]
+    return [str(value)]
+
+
+class ToolResultCache:
+    """
+    Process-wide LRU + TTL cache of successful tool responses, one bounded partition per tool.
+    Mutating tools declare the entities they change with register_tool(..., invalidates={entity type: slot name}),
+    their successful calls drop the cached results tagged with the same entity ids. A slot name of None drops every
+    cached result of the entity type.
+    """
+    def __init__(self):
+        # tool name -> OrderedDict of key -> (expires_at, response, tags)
+        self._entries: Dict[str, OrderedDict] = {}
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.invalidations = Counter()
+
+    @staticmethod
+    def make_key(tool_name: str, policy: CachePolicy, kwargs: dict, fixed_args: dict, chat_id: Optional[str]) -> Optional[str]:
+        if policy.scope == "conversation":
+            if not chat_id:
+                return None
+        else:
+            chat_id = None
+        fields = policy.key_fields if policy.key_fields is not None else sorted(kwargs)
+        # hash the key, the fixed_args usually hold credentials
+        raw = json.dumps([tool_name, chat_id, {k: kwargs.get(k) for k in fields}, fixed_args], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, tool_name: str, key: str):
+        """Return (hit, response)"""
+        with self._lock:
+            entries = self._entries.get(tool_name)
+            entry = entries.get(key) if entries is not None else None
+            if entry is not None and entry[0] > time.monotonic():
+                entries.move_to_end(key)
+                self.hits[tool_name] += 1
+                return True, entry[1]
+            if entry is not None:
+                del entries[key]
+            self.misses[tool_name] += 1
+            return False, None
+
+    def set(self, tool_name: str, key: str, response: Any, policy: CachePolicy, kwargs: dict):
+        tags = frozenset(
+            (entity, entity_id)
+            for entity, field in policy.entities.items()
+            for entity_id in _entity_ids(kwargs.get(field))
+        ) | frozenset((entity, None) for entity in policy.entities)
+        with self._lock:
+            entries = self._entries.setdefault(tool_name, OrderedDict())
+            entries[key] = (time.monotonic() + policy.ttl, response, tags)
+            entries.move_to_end(key)
+            while len(entries) > policy.max_entries:
+                entries.popitem(last=False)
+
+    def invalidate(self, invalidates: Dict[str, Optional[str]], kwargs: dict, source: str = ""):
+        tags = set()
+        for entity, field in invalidates.items():
+            if field is None:
+                tags.add((entity, None))
+            else:
+                tags.update((entity, entity_id) for entity_id in _entity_ids(kwargs.get(field)))
+        if not tags:
+            return
+        with self._lock:
+            for tool_name, entries in self._entries.items():
+                stale = [key for key, (_, _, entry_tags) in entries.items() if entry_tags & tags]
+                for key in stale:
+                    del entries[key]
+                self.invalidations[tool_name] += len(stale)
+        logger.info(f"Tool {source} invalidated cached results of {sorted(tags, key=str)}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                tool_name: {
+                    "hits": self.hits[tool_name],
+                    "misses": self.misses[tool_name],
+                    "invalidations": self.invalidations[tool_name],
+                    "size": len(self._entries.get(tool_name, {})),
+                }
+                for tool_name in set(self.hits) | set(self.misses) | set(self._entries)
+            }
+
+    def log_stats(self):
+        for tool_name, stats in self.stats().items():
+            logger.info(f"Tool cache {tool_name}: {stats}")
+
+
+tool_cache = ToolResultCache()
@@ -1,4 +1,6 @@
 import os
+import copy
+import asyncio
 import logging
 import json
 import uuid
@@ -10,33 +12,66 @@ from arklex.utils.slot import Slot
 from arklex.orchestrator.NLU.nlu import SlotFilling
 from arklex.utils.utils import format_chat_history
 from arklex.exceptions import ToolExecutionError, AuthenticationError
+from arklex.env.tools.tool_cache import CachePolicy, TOOL_CACHE_ENABLED, tool_cache
 
 logger = logging.getLogger(__name__)
 
     
-def register_tool(desc, slots=[], outputs=[], isResponse=False):
+def tool_key(relative_path: str, func_name: str) -> str:
+    """Name of the tool defined as func_name in the file at relative_path under arklex/env/tools"""
+    # reformat the relative path to replace / and \\ with -, and remove .py, because the function calling in openai only allow the function name match the patter the pattern '^[a-zA-Z0-9_-]+$'
+    # different file paths format in Windows and linux systems
+    relative_path = relative_path.replace("/", "-").replace("\\", "-").replace(".py", "")
+    return f"{relative_path}-{func_name}"
+
+
+def register_tool(desc, slots=[], outputs=[], isResponse=False, cache=None, invalidates=None):
+    """
+    cache: CachePolicy settings of a read-only tool, its successful responses are reused until they expire
+    invalidates: entity type -> slot name of the entities a mutating tool changes, see ToolResultCache
+    """
     current_file_dir = os.path.dirname(__file__)
     def inner(func):
         file_path = inspect.getfile(func)
         relative_path = os.path.relpath(file_path, current_file_dir)
-        # reformat the relative path to replace / and \\ with -, and remove .py, because the function calling in openai only allow the function name match the patter the pattern '^[a-zA-Z0-9_-]+$'
-        # different file paths format in Windows and linux systems
-        relative_path = relative_path.replace("/", "-").replace("\\", "-").replace(".py", "")
-        key = f"{relative_path}-{func.__name__}"
-        tool = lambda : Tool(func, key, desc, slots, outputs, isResponse)
+        key = tool_key(relative_path, func.__name__)
+        # the Tool is built once per process, each call returns a cheap per invocation copy of it
+        prototype = Tool(func, key, desc, slots, outputs, isResponse, cache, invalidates)
+        tool = lambda : prototype.copy()
         return tool
     return inner
 
 class Tool:
-    def __init__(self, func, name, description, slots, outputs, isResponse):
+    def __init__(self, func, name, description, slots, outputs, isResponse, cache=None, invalidates=None):
         self.func = func
         self.name = name
         self.description = description
         self.output = outputs
         self.slotfillapi: SlotFilling = None
         self.info = self.get_info(slots)
-        self.slots = [Slot.model_validate(slot) for slot in slots]
+        self._prototype_slots = tuple(Slot.model_validate(slot) for slot in slots)
+        self._slots = None
         self.isResponse = isResponse
+        self.cache_policy = CachePolicy.model_validate(cache) if cache is not None else None
+        self.invalidates = invalidates or {}
+
+    @property
+    def slots(self) -> list[Slot]:
+        # copy on write, the prototype slots are only copied if the conversation has no slot state for the tool yet
+        if self._slots is None:
+            self._slots = [slot.model_copy(deep=True) for slot in self._prototype_slots]
+        return self._slots
+
+    @slots.setter
+    def slots(self, slots: list[Slot]):
+        self._slots = slots
+
+    def copy(self) -> "Tool":
+        """Execution context of the tool, shares the function, schema and prototype slots but keeps its own slot state"""
+        tool = copy.copy(self)
+        tool._slots = None
+        tool.slotfillapi = None
+        return tool
 
     def get_info(self, slots):
         self.properties = {}
@@ -80,7 +115,7 @@ class Tool:
         
         logger.info(f'Slots after initialization are: {self.slots}')
         
-    def _execute(self, state: MessageState, **fixed_args):
+    def _load_slots(self, state: MessageState):
         # if this tool has been called before, then load the previous slots status
         if state.slots.get(self.name):
             self.slots = state.slots[self.name]
@@ -88,16 +123,169 @@ class Tool:
             state.slots[self.name] = self.slots
         # init slot values saved in default slots
         self._init_slots(state)
-        # do slotfilling
+
+    def _call_func(self, kwargs: dict, chat_id: str = None, **fixed_args):
+        """Call the tool function through the result cache, used by the slot filling flow and by the planner"""
+        combined_kwargs = {**kwargs, **fixed_args}
+        cache_key = None
+        if self.cache_policy is not None and TOOL_CACHE_ENABLED:
+            cache_key = tool_cache.make_key(self.name, self.cache_policy, kwargs, fixed_args, chat_id)
+        if cache_key is not None:
+            hit, response = tool_cache.get(self.name, cache_key)
+            if hit:
+                logger.info(f"Tool {self.name} response from cache: {response}")
+                return kwargs, response, True
+        tool_success = False
+        try:
+            response = self.func(**combined_kwargs)
+            tool_success = True
+        except ToolExecutionError as tee:
+            logger.error(traceback.format_exc())
+            response = tee.extra_message
+        except AuthenticationError as ae:
+            logger.error(traceback.format_exc())
+            response = str(ae)
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            response = str(e)
+        logger.info(f"Tool {self.name} response: {response}")
+        if tool_success:
+            if cache_key is not None:
+                tool_cache.set(self.name, cache_key, response, self.cache_policy, kwargs)
+            if self.invalidates:
+                tool_cache.invalidate(self.invalidates, kwargs, source=self.name)
+        return kwargs, response, tool_success
+
+    @staticmethod
+    def _chat_id(state: MessageState):
+        return state.metadata.chat_id if state.metadata is not None else None
+
+    def _record_call(self, state: MessageState, kwargs: dict, response, tool_success: bool):
+        call_id = str(uuid.uuid4())
+        state.function_calling_trajectory.append({
+            'content': None, 
+            'role': 'assistant', 
+            'tool_calls': [
+                {
+                    'function': {
+                        'arguments': json.dumps(kwargs), 
+                        'name': self.name
+                    }, 
+                    'id': call_id, 
+                    'type': 'function'
+                }
+            ], 
+            'function_call': None
+        })
+        state.function_calling_trajectory.append({
+            "role": "tool",
+            "tool_call_id": call_id,
+            "name": self.name,
+            "content": response
+        })
+        state.status = StatusEnum.COMPLETE if tool_success else StatusEnum.INCOMPLETE
+
+    def _finish(self, state: MessageState, slots: list[Slot], response, tool_success: bool):
+        state.trajectory[-1][-1].input = slots
+        state.trajectory[-1][-1].output = response
+
+        if self.isResponse and tool_success:
+            logger.info("Tool output is stored in response instead of message flow")
+            state.response = response
+        else:
+            state.message_flow = state.message_flow + f"Context from {self.name} tool execution: {response}\n"
+        state.slots[self.name] = slots
+        return state
+
+    def _slotfilling_context(self, state: MessageState, full_slotfilling: bool = False) -> str:
+        """
+        Only the dialogue since the slots were last filled is sent, the current slot values are already part of the slot filling input.
+        full_slotfilling refills the slots from the whole trajectory.
+        """
+        trajectory = state.function_calling_trajectory
+        offset = 0
+        if not full_slotfilling and self.slots:
+            offset = min(slot.filled_offset for slot in self.slots)
+            # the trajectory was reset or truncated since the last fill
+            if offset > len(trajectory):
+                offset = 0
+        return format_chat_history(trajectory[offset:])
+
+    def _pending_verification(self, slots: list[Slot]) -> list[Slot]:
+        """Slots with extracted but unverified values, up to the first slot without a value where the user is prompted"""
+        pending = []
+        for slot in slots:
+            if not slot.value:
+                break
+            if not slot.verified:
+                pending.append(slot)
+        return pending
+
+    def _execute(self, state: MessageState, full_slotfilling: bool = False, **fixed_args):
+        self._load_slots(state)
+        # do slotfilling on the new dialogue only
+        slotfilling_context = self._slotfilling_context(state, full_slotfilling)
+        slots : list[Slot] = self.slotfillapi.execute(self.slots, slotfilling_context, incremental=not full_slotfilling)
+        for slot in slots:
+            slot.filled_offset = len(state.function_calling_trajectory)
+        logger.info(f'{slots=}')
+        # verification looks at the whole conversation, the value may have been extracted in an earlier turn
         chat_history_str = format_chat_history(state.function_calling_trajectory)
-        slots : list[Slot] = self.slotfillapi.execute(self.slots, chat_history_str)
+        if not all([slot.value and slot.verified for slot in slots if slot.required]):
+            # verify all the extracted but unverified slots in one batch
+            pending_slots = self._pending_verification(slots)
+            verifications = dict(zip(
+                [slot.name for slot in pending_slots],
+                self.slotfillapi.verify_needed_batch(pending_slots, chat_history_str)
+            ))
+            for slot in slots:
+                # if there is extracted slots values but haven't been verified
+                if slot.value and not slot.verified:
+                    # check whether it verified or not
+                    verification_needed, thought = verifications[slot.name]
+                    if verification_needed:
+                        response = slot.prompt + "The reason is: " + thought
+                        break
+                    else:
+                        slot.verified = True
+                # if there is no extracted slots values, then should prompt the user to fill the slot
+                if not slot.value:
+                    response = slot.prompt
+                    break
+            
+            state.status = StatusEnum.INCOMPLETE
+
+        # if slot.value is not empty for all slots, and all the slots has been verified, then execute the function
+        tool_success = False
+        if all([slot.value and slot.verified for slot in slots if slot.required]):
+            logger.info("all slots filled")
+            kwargs, response, tool_success = self._call_func({slot.name: slot.value for slot in slots}, self._chat_id(state), **fixed_args)
+            self._record_call(state, kwargs, response, tool_success)
+
+        return self._finish(state, slots, response, tool_success)
+
+    async def _aexecute(self, state: MessageState, full_slotfilling: bool = False, **fixed_args):
+        self._load_slots(state)
+        # do slotfilling on the new dialogue only
+        slotfilling_context = self._slotfilling_context(state, full_slotfilling)
+        slots : list[Slot] = await self.slotfillapi.aexecute(self.slots, slotfilling_context, incremental=not full_slotfilling)
+        for slot in slots:
+            slot.filled_offset = len(state.function_calling_trajectory)
         logger.info(f'{slots=}')
+        # verification looks at the whole conversation, the value may have been extracted in an earlier turn
+        chat_history_str = format_chat_history(state.function_calling_trajectory)
         if not all([slot.value and slot.verified for slot in slots if slot.required]):
+            # verify all the extracted but unverified slots in one batch
+            pending_slots = self._pending_verification(slots)
+            verifications = dict(zip(
+                [slot.name for slot in pending_slots],
+                await self.slotfillapi.averify_needed_batch(pending_slots, chat_history_str)
+            ))
             for slot in slots:
                 # if there is extracted slots values but haven't been verified
                 if slot.value and not slot.verified:
                     # check whether it verified or not
-                    verification_needed, thought = self.slotfillapi.verify_needed(slot, chat_history_str)
+                    verification_needed, thought = verifications[slot.name]
                     if verification_needed:
                         response = slot.prompt + "The reason is: " + thought
                         break
@@ -114,58 +302,18 @@ class Tool:
         tool_success = False
         if all([slot.value and slot.verified for slot in slots if slot.required]):
             logger.info("all slots filled")
-            kwargs = {slot.name: slot.value for slot in slots}
-            combined_kwargs = {**kwargs, **fixed_args}
-            try:
-                response = self.func(**combined_kwargs)
-                tool_success = True
-            except ToolExecutionError as tee:
-                logger.error(traceback.format_exc())
-                response = tee.extra_message
-            except AuthenticationError as ae:
-                logger.error(traceback.format_exc())
-                response = str(ae)
-            except Exception as e:
-                logger.error(traceback.format_exc())
-                response = str(e)
-            logger.info(f"Tool {self.name} response: {response}")
-            call_id = str(uuid.uuid4())
-            state.function_calling_trajectory.append({
-                'content': None, 
-                'role': 'assistant', 
-                'tool_calls': [
-                    {
-                        'function': {
-                            'arguments': json.dumps(kwargs), 
-                            'name': self.name
-                        }, 
-                        'id': call_id, 
-                        'type': 'function'
-                    }
-                ], 
-                'function_call': None
-            })
-            state.function_calling_trajectory.append({
-                "role": "tool",
-                "tool_call_id": call_id,
-                "name": self.name,
-                "content": response
-            })
-            state.status = StatusEnum.COMPLETE if tool_success else StatusEnum.INCOMPLETE
+            # tool functions are blocking (e.g. HTTP calls to Shopify), so run them in a worker thread
+            kwargs, response, tool_success = await asyncio.to_thread(self._call_func, {slot.name: slot.value for slot in slots}, self._chat_id(state), **fixed_args)
+            self._record_call(state, kwargs, response, tool_success)
 
-        state.trajectory[-1][-1].input = slots
-        state.trajectory[-1][-1].output = response
+        return self._finish(state, slots, response, tool_success)
 
-        if self.isResponse and tool_success:
-            logger.info("Tool output is stored in response instead of message flow")
-            state.response = response
-        else:
-            state.message_flow = state.message_flow + f"Context from {self.name} tool execution: {response}\n"
-        state.slots[self.name] = slots
+    def execute(self, state: MessageState, full_slotfilling: bool = False, **fixed_args):
+        state = self._execute(state, full_slotfilling, **fixed_args)
         return state
 
-    def execute(self, state: MessageState, **fixed_args):
-        state = self._execute(state, **fixed_args)
+    async def aexecute(self, state: MessageState, full_slotfilling: bool = False, **fixed_args):
+        state = await self._aexecute(state, full_slotfilling, **fixed_args)
         return state
     
     def __str__(self):
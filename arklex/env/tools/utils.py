@@ -1,8 +1,9 @@
+import queue
+import asyncio
 import logging
 import inspect
 
 from langchain.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
 
 from arklex.env.prompts import load_prompts
@@ -10,10 +11,18 @@ from arklex.types import EventType
 from arklex.utils.utils import chunk_string
 from arklex.utils.graph_state import MessageState
 from arklex.utils.model_config import MODEL
-from arklex.utils.model_provider_config import PROVIDER_MAP
+from arklex.utils.model_provider_config import get_llm
 
 
 logger = logging.getLogger(__name__)
+
+
+async def aput_message(message_queue, message: dict):
+    """Put a stream message from async code, the message queue is a sync queue and a blocking put would stall the event loop"""
+    try:
+        message_queue.put_nowait(message)
+    except queue.Full:
+        await asyncio.to_thread(message_queue.put, message)
     
 
 class ToolGenerator():
@@ -22,9 +31,7 @@ class ToolGenerator():
         user_message = state.user_message
         
         prompts = load_prompts(state.bot_config)
-        llm = PROVIDER_MAP.get(MODEL['llm_provider'], ChatOpenAI)(
-            model=MODEL["model_type_or_path"], timeout=30000, temperature=0.1
-        )
+        llm = get_llm(timeout=30000, temperature=0.1)
         prompt = PromptTemplate.from_template(prompts["generator_prompt"])
         input_prompt = prompt.invoke({"sys_instruct": state.sys_instruct, "formatted_chat": user_message.history})
         chunked_prompt = chunk_string(input_prompt.text, tokenizer=MODEL["tokenizer"], max_length=MODEL["context"])
@@ -36,9 +43,7 @@ class ToolGenerator():
 
     @staticmethod
     def context_generate(state: MessageState):
-        llm = PROVIDER_MAP.get(MODEL['llm_provider'], ChatOpenAI)(
-            model=MODEL["model_type_or_path"], timeout=30000, temperature=0.1
-        )
+        llm = get_llm(timeout=30000, temperature=0.1)
         # get the input message
         user_message = state.user_message
         message_flow = state.message_flow
@@ -59,9 +64,7 @@ class ToolGenerator():
     
     @staticmethod
     def stream_context_generate(state: MessageState):
-        llm = PROVIDER_MAP.get(MODEL['llm_provider'], ChatOpenAI)(
-            model=MODEL["model_type_or_path"], timeout=30000, temperature=0.1
-        )
+        llm = get_llm(timeout=30000, temperature=0.1)
         # get the input message
         user_message = state.user_message
         message_flow = state.message_flow
@@ -84,14 +87,58 @@ class ToolGenerator():
         state = trace(input=answer, state=state)
         return state
     
+    @staticmethod
+    async def acontext_generate(state: MessageState):
+        llm = get_llm(timeout=30000, temperature=0.1)
+        # get the input message
+        user_message = state.user_message
+        message_flow = state.message_flow
+        logger.info(f"Retrieved texts (from retriever/search engine to generator): {message_flow[:50]} ...")
+        
+        # generate answer based on the retrieved texts
+        prompts = load_prompts(state.bot_config)
+        prompt = PromptTemplate.from_template(prompts["context_generator_prompt"])
+        input_prompt = prompt.invoke({"sys_instruct": state.sys_instruct, "formatted_chat": user_message.history, "context": message_flow})
+        chunked_prompt = chunk_string(input_prompt.text, tokenizer=MODEL["tokenizer"], max_length=MODEL["context"])
+        final_chain = llm | StrOutputParser()
+        logger.info(f"Prompt: {input_prompt.text}")
+        answer = await final_chain.ainvoke(chunked_prompt)
+        state.message_flow = ""
+        state.response = answer
+        state = trace(input=answer, state=state)
+        return state
+
+    @staticmethod
+    async def astream_context_generate(state: MessageState):
+        llm = get_llm(timeout=30000, temperature=0.1)
+        # get the input message
+        user_message = state.user_message
+        message_flow = state.message_flow
+        logger.info(f"Retrieved texts (from retriever/search engine to generator): {message_flow[:50]} ...")
+        
+        # generate answer based on the retrieved texts
+        prompts = load_prompts(state.bot_config)
+        prompt = PromptTemplate.from_template(prompts["context_generator_prompt"])
+        input_prompt = prompt.invoke({"sys_instruct": state.sys_instruct, "formatted_chat": user_message.history, "context": message_flow})
+        chunked_prompt = chunk_string(input_prompt.text, tokenizer=MODEL["tokenizer"], max_length=MODEL["context"])
+        final_chain = llm | StrOutputParser()
+        logger.info(f"Prompt: {input_prompt.text}")
+        answer = ""
+        async for chunk in final_chain.astream(chunked_prompt):
+            answer += chunk
+            await aput_message(state.message_queue, {"event": EventType.CHUNK.value, "message_chunk": chunk})
+
+        state.message_flow = ""
+        state.response = answer
+        state = trace(input=answer, state=state)
+        return state
+    
     @staticmethod
     def stream_generate(state: MessageState):
         user_message = state.user_message
         
         prompts = load_prompts(state.bot_config)
-        llm = PROVIDER_MAP.get(MODEL['llm_provider'], ChatOpenAI)(
-            model=MODEL["model_type_or_path"], timeout=30000, temperature=0.1
-        )
+        llm = get_llm(timeout=30000, temperature=0.1)
         prompt = PromptTemplate.from_template(prompts["generator_prompt"])
         input_prompt = prompt.invoke({"sys_instruct": state.sys_instruct, "formatted_chat": user_message.history})
         chunked_prompt = chunk_string(input_prompt.text, tokenizer=MODEL["tokenizer"], max_length=MODEL["context"])
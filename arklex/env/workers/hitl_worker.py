@@ -132,7 +132,7 @@ class HITLWorker(BaseWorker):
         if not self.verify(state):
             return self.error(state)
         
-        graph = self.action_graph.compile()
+        graph = self.compiled_graph
         result = graph.invoke(state)
         return result
     
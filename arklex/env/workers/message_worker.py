@@ -3,17 +3,17 @@ from typing import Any, Iterator, Union
 
 from langgraph.graph import StateGraph, START
 from langchain.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
 
 from arklex.env.workers.worker import BaseWorker, register_worker
 from arklex.env.prompts import load_prompts
-from arklex.env.tools.utils import trace
+from arklex.env.tools.utils import trace, aput_message
 from arklex.types import EventType
 from arklex.utils.utils import chunk_string
 from arklex.utils.graph_state import MessageState
 from arklex.utils.model_config import MODEL
-from arklex.utils.model_provider_config import PROVIDER_MAP
+from arklex.utils.model_provider_config import get_llm
 
 
 logger = logging.getLogger(__name__)
@@ -26,12 +26,11 @@ class MessageWorker(BaseWorker):
 
     def __init__(self):
         super().__init__()
-        self.llm = PROVIDER_MAP.get(MODEL['llm_provider'], ChatOpenAI)(
-            model=MODEL["model_type_or_path"], timeout=30000
-        )
+        self.llm = get_llm(timeout=30000)
         self.action_graph = self._create_action_graph()
 
-    def generator(self, state: MessageState) -> MessageState:
+    def _prepare_prompt(self, state: MessageState):
+        """Build the generator prompt, returns None if the orchestrator message is delivered directly"""
         # get the input message
         user_message = state.user_message
         orchestrator_message = state.orchestrator_message
@@ -44,7 +43,7 @@ class MessageWorker(BaseWorker):
         if direct_response:
             state.message_flow = ""
             state.response = orch_msg_content
-            return state
+            return None
         
         prompts = load_prompts(state.bot_config)
         if message_flow and message_flow != "\n":
@@ -55,6 +54,12 @@ class MessageWorker(BaseWorker):
             input_prompt = prompt.invoke({"sys_instruct": state.sys_instruct, "message": orch_msg_content, "formatted_chat": user_message.history})
         logger.info(f"Prompt: {input_prompt.text}")
         chunked_prompt = chunk_string(input_prompt.text, tokenizer=MODEL["tokenizer"], max_length=MODEL["context"])
+        return chunked_prompt
+
+    def generator(self, state: MessageState) -> MessageState:
+        chunked_prompt = self._prepare_prompt(state)
+        if chunked_prompt is None:
+            return state
         final_chain = self.llm | StrOutputParser()
         answer = final_chain.invoke(chunked_prompt)
 
@@ -62,6 +67,18 @@ class MessageWorker(BaseWorker):
         state.response = answer
         state = trace(input=answer, state=state)
         return state
+
+    async def agenerator(self, state: MessageState) -> MessageState:
+        chunked_prompt = self._prepare_prompt(state)
+        if chunked_prompt is None:
+            return state
+        final_chain = self.llm | StrOutputParser()
+        answer = await final_chain.ainvoke(chunked_prompt)
+
+        state.message_flow = ""
+        state.response = answer
+        state = trace(input=answer, state=state)
+        return state
     
     def choose_generator(self, state: MessageState):
         if state.is_stream:
@@ -69,29 +86,9 @@ class MessageWorker(BaseWorker):
         return "generator"
     
     def stream_generator(self, state: MessageState) -> MessageState:
-        # get the input message
-        user_message = state.user_message
-        orchestrator_message = state.orchestrator_message
-        message_flow = state.response + "\n" + state.message_flow
-
-        # get the orchestrator message content
-        orch_msg_content = "None" if not orchestrator_message.message else orchestrator_message.message
-        orch_msg_attr = orchestrator_message.attribute
-        direct_response = orch_msg_attr.get('direct_response', False)
-        if direct_response:
-            state.message_flow = ""
-            state.response = orch_msg_content
+        chunked_prompt = self._prepare_prompt(state)
+        if chunked_prompt is None:
             return state
-        
-        prompts = load_prompts(state.bot_config)
-        if message_flow and message_flow != "\n":
-            prompt = PromptTemplate.from_template(prompts["message_flow_generator_prompt"])
-            input_prompt = prompt.invoke({"sys_instruct": state.sys_instruct, "message": orch_msg_content, "formatted_chat": user_message.history, "context": message_flow})
-        else:
-            prompt = PromptTemplate.from_template(prompts["message_generator_prompt"])
-            input_prompt = prompt.invoke({"sys_instruct": state.sys_instruct, "message": orch_msg_content, "formatted_chat": user_message.history})
-        logger.info(f"Prompt: {input_prompt.text}")
-        chunked_prompt = chunk_string(input_prompt.text, tokenizer=MODEL["tokenizer"], max_length=MODEL["context"])
         final_chain = self.llm | StrOutputParser()
         answer = ""
         for chunk in final_chain.stream(chunked_prompt):
@@ -102,18 +99,37 @@ class MessageWorker(BaseWorker):
         state.response = answer
         return state
 
+    async def astream_generator(self, state: MessageState) -> MessageState:
+        chunked_prompt = self._prepare_prompt(state)
+        if chunked_prompt is None:
+            return state
+        final_chain = self.llm | StrOutputParser()
+        answer = ""
+        async for chunk in final_chain.astream(chunked_prompt):
+            answer += chunk
+            await aput_message(state.message_queue, {"event": EventType.CHUNK.value, "message_chunk": chunk})
+
+        state.message_flow = ""
+        state.response = answer
+        return state
+
     def _create_action_graph(self):
         workflow = StateGraph(MessageState)
         # Add nodes for each worker
-        workflow.add_node("generator", self.generator)
-        workflow.add_node("stream_generator", self.stream_generator)
+        workflow.add_node("generator", RunnableLambda(self.generator, afunc=self.agenerator))
+        workflow.add_node("stream_generator", RunnableLambda(self.stream_generator, afunc=self.astream_generator))
         # Add edges
         # workflow.add_edge(START, "generator")
         workflow.add_conditional_edges(START, self.choose_generator)
         return workflow
 
     def _execute(self, msg_state: MessageState):
-        graph = self.action_graph.compile()
+        graph = self.compiled_graph
         result = graph.invoke(msg_state)
         return result
 
+    async def _aexecute(self, msg_state: MessageState):
+        graph = self.compiled_graph
+        result = await graph.ainvoke(msg_state)
+        return result
+
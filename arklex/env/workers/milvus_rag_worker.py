@@ -2,13 +2,14 @@ import logging
 import os
 
 from langgraph.graph import StateGraph, START
-from langchain_openai import ChatOpenAI
+from langchain_core.runnables import RunnableLambda
 
-from arklex.env.workers.worker import BaseWorker, register_worker
+from arklex.env.workers.worker import BaseWorker, register_worker, threaded_node
 from arklex.utils.graph_state import MessageState
 from arklex.env.tools.utils import ToolGenerator
 from arklex.env.tools.RAG.retrievers.milvus_retriever import RetrieveEngine
 from arklex.utils.model_config import MODEL
+from arklex.utils.model_provider_config import get_llm
 
 
 logger = logging.getLogger(__name__)
@@ -25,7 +26,7 @@ class MilvusRAGWorker(BaseWorker):
                  stream_response: bool = True):
         super().__init__()
         self.action_graph = self._create_action_graph()
-        self.llm = ChatOpenAI(model=MODEL["model_type_or_path"], timeout=30000)
+        self.llm = get_llm(llm_provider="openai", timeout=30000)
         self.stream_response = stream_response
 
     def choose_tool_generator(self, state: MessageState):
@@ -36,9 +37,9 @@ class MilvusRAGWorker(BaseWorker):
     def _create_action_graph(self):
         workflow = StateGraph(MessageState)
         # Add nodes for each worker
-        workflow.add_node("retriever", RetrieveEngine.milvus_retrieve)
-        workflow.add_node("tool_generator", ToolGenerator.context_generate)
-        workflow.add_node("stream_tool_generator", ToolGenerator.stream_context_generate)
+        workflow.add_node("retriever", threaded_node(RetrieveEngine.milvus_retrieve))
+        workflow.add_node("tool_generator", RunnableLambda(ToolGenerator.context_generate, afunc=ToolGenerator.acontext_generate))
+        workflow.add_node("stream_tool_generator", RunnableLambda(ToolGenerator.stream_context_generate, afunc=ToolGenerator.astream_context_generate))
         # Add edges
         workflow.add_edge(START, "retriever")
         workflow.add_conditional_edges(
@@ -46,6 +47,11 @@ class MilvusRAGWorker(BaseWorker):
         return workflow
 
     def _execute(self, msg_state: MessageState):
-        graph = self.action_graph.compile()
+        graph = self.compiled_graph
         result = graph.invoke(msg_state)
         return result
+
+    async def _aexecute(self, msg_state: MessageState):
+        graph = self.compiled_graph
+        result = await graph.ainvoke(msg_state)
+        return result
@@ -2,11 +2,11 @@ import logging
 from typing import Any, Iterator, Union
 
 from langgraph.graph import StateGraph, START
-from langchain_openai import ChatOpenAI
+from langchain_core.runnables import RunnableLambda
 from langchain.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
-from arklex.env.workers.worker import BaseWorker, register_worker
+from arklex.env.workers.worker import BaseWorker, register_worker, threaded_node
 from arklex.env.tools.RAG.retrievers.milvus_retriever import RetrieveEngine
 from arklex.env.prompts import load_prompts
 from arklex.env.workers.message_worker import MessageWorker
@@ -14,6 +14,7 @@ from arklex.env.workers.milvus_rag_worker import MilvusRAGWorker
 from arklex.utils.utils import chunk_string
 from arklex.utils.graph_state import MessageState
 from arklex.utils.model_config import MODEL
+from arklex.utils.model_provider_config import get_llm
 
 
 logger = logging.getLogger(__name__)
@@ -27,7 +28,7 @@ class RagMsgWorker(BaseWorker):
     def __init__(self):
         super().__init__()
         self.action_graph = self._create_action_graph()
-        self.llm = ChatOpenAI(model=MODEL["model_type_or_path"], timeout=30000)
+        self.llm = get_llm(llm_provider="openai", timeout=30000)
 
     def _choose_retriever(self, state: MessageState):
         prompts = load_prompts(state.bot_config)
@@ -46,15 +47,20 @@ class RagMsgWorker(BaseWorker):
         workflow = StateGraph(MessageState)
         # Add nodes for each worker
         msg_wkr = MessageWorker()
-        workflow.add_node("retriever", RetrieveEngine.milvus_retrieve)
-        workflow.add_node("message_worker", msg_wkr.execute)
+        workflow.add_node("retriever", threaded_node(RetrieveEngine.milvus_retrieve))
+        workflow.add_node("message_worker", RunnableLambda(msg_wkr.execute, afunc=msg_wkr.aexecute))
         # Add edges
         workflow.add_conditional_edges(
-            START, self._choose_retriever)
+            START, threaded_node(self._choose_retriever))
         workflow.add_edge("retriever", "message_worker")
         return workflow
 
     def _execute(self, msg_state: MessageState):
-        graph = self.action_graph.compile()
+        graph = self.compiled_graph
         result = graph.invoke(msg_state)
         return result
+
+    async def _aexecute(self, msg_state: MessageState):
+        graph = self.compiled_graph
+        result = await graph.ainvoke(msg_state)
+        return result
@@ -1,15 +1,15 @@
 import logging
 
 from langgraph.graph import StateGraph, START
-from langchain_openai import ChatOpenAI
+from langchain_core.runnables import RunnableLambda
 
 
-from arklex.env.workers.worker import BaseWorker, register_worker
+from arklex.env.workers.worker import BaseWorker, register_worker, threaded_node
 from arklex.utils.graph_state import MessageState
 from arklex.env.tools.utils import ToolGenerator
 from arklex.env.tools.RAG.search import SearchEngine
 from arklex.utils.model_config import MODEL
-from arklex.utils.model_provider_config import PROVIDER_MAP
+from arklex.utils.model_provider_config import get_llm
 
 
 logger = logging.getLogger(__name__)
@@ -23,22 +23,25 @@ class SearchWorker(BaseWorker):
     def __init__(self):
         super().__init__()
         self.action_graph = self._create_action_graph()
-        self.llm = PROVIDER_MAP.get(MODEL['llm_provider'], ChatOpenAI)(
-            model=MODEL["model_type_or_path"], timeout=30000
-        )
+        self.llm = get_llm(timeout=30000)
      
     def _create_action_graph(self):
         workflow = StateGraph(MessageState)
         # Add nodes for each worker
         search_engine = SearchEngine()
-        workflow.add_node("search_engine", search_engine.search)
-        workflow.add_node("tool_generator", ToolGenerator.context_generate)
+        workflow.add_node("search_engine", threaded_node(search_engine.search))
+        workflow.add_node("tool_generator", RunnableLambda(ToolGenerator.context_generate, afunc=ToolGenerator.acontext_generate))
         # Add edges
         workflow.add_edge(START, "search_engine")
         workflow.add_edge("search_engine", "tool_generator")
         return workflow
 
     def _execute(self, msg_state: MessageState):
-        graph = self.action_graph.compile()
+        graph = self.compiled_graph
         result = graph.invoke(msg_state)
         return result
+
+    async def _aexecute(self, msg_state: MessageState):
+        graph = self.compiled_graph
+        result = await graph.ainvoke(msg_state)
+        return result
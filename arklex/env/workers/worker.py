@@ -1,16 +1,36 @@
+import os
+import asyncio
+import threading
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from functools import cached_property
+
+from langchain_core.runnables import RunnableLambda
+
 from arklex.utils.graph_state import MessageState, StatusEnum
 import logging
 import traceback
 
 logger = logging.getLogger(__name__)
 
+WORKER_POOL_SIZE = int(os.getenv("WORKER_POOL_SIZE", 8))
+
 def register_worker(cls):
     """Decorator to register a worker."""
     cls.name = cls.__name__  # Automatically set name to the class name
     return cls
 
 
+def threaded_node(func) -> RunnableLambda:
+    """
+    Wrap a blocking action graph node or conditional edge, graph.ainvoke runs it in a worker thread
+    instead of calling it on the event loop
+    """
+    async def afunc(state):
+        return await asyncio.to_thread(func, state)
+    return RunnableLambda(func, afunc=afunc)
+
+
 class BaseWorker(ABC):
     
     description = None
@@ -20,20 +40,73 @@ class BaseWorker(ABC):
 
     def __repr__(self):
         return f"{self.__class__.__name__}"
+
+    @cached_property
+    def compiled_graph(self):
+        # the action graph nodes are bound to the instance, compile it once per worker instance
+        return self.action_graph.compile()
     
     @abstractmethod
     def _execute(self, msg_state: MessageState):
         pass
 
+    async def _aexecute(self, msg_state: MessageState):
+        """Override this method with a native async implementation, by default the sync one runs in a worker thread"""
+        return await asyncio.to_thread(self._execute, msg_state)
+
+    def _postprocess(self, response_return) -> MessageState:
+        response_state = MessageState.model_validate(response_return)
+        response_state.trajectory[-1][-1].output = response_state.response if response_state.response else response_state.message_flow
+        if response_state.status == StatusEnum.INCOMPLETE:
+            response_state.status = StatusEnum.COMPLETE
+        return response_state
+
     def execute(self, msg_state: MessageState):
         try:
             response_return = self._execute(msg_state)
-            response_state = MessageState.model_validate(response_return)
-            response_state.trajectory[-1][-1].output = response_state.response if response_state.response else response_state.message_flow
-            if response_state.status == StatusEnum.INCOMPLETE:
-                response_state.status = StatusEnum.COMPLETE
-            return response_state
+            return self._postprocess(response_return)
         except Exception as e:
             logger.error(traceback.format_exc())
             msg_state.status = StatusEnum.INCOMPLETE
-            return msg_state
\ No newline at end of file
+            return msg_state
+
+    async def aexecute(self, msg_state: MessageState):
+        try:
+            response_return = await self._aexecute(msg_state)
+            return self._postprocess(response_return)
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            msg_state.status = StatusEnum.INCOMPLETE
+            return msg_state
+
+
+class WorkerPool:
+    """
+    Reusable instances of a worker class built with the same fixed_args, so the LLM client and the compiled
+    action graph are created once instead of on every step. An instance serves one step at a time,
+    workers may keep per-call state on the instance (e.g. DataBaseWorker).
+    """
+    def __init__(self, factory, max_idle: int = WORKER_POOL_SIZE):
+        self.factory = factory
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def get(self) -> BaseWorker:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self.factory()
+
+    def put(self, worker: BaseWorker):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(worker)
+
+    @contextmanager
+    def acquire(self):
+        worker = self.get()
+        try:
+            yield worker
+        finally:
+            self.put(worker)
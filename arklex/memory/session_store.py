@@ -0,0 +1,109 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from arklex.utils.graph_state import Params, Metadata
+
+
+logger = logging.getLogger(__name__)
+
+
+class Session(BaseModel):
+    chat_id: str
+    chat_history: List[Dict[str, Any]] = Field(default_factory=list)
+    params: Params = Field(default_factory=Params)
+
+    @classmethod
+    def new(cls, chat_id: str):
+        return cls(chat_id=chat_id, params=Params(metadata=Metadata(chat_id=chat_id)))
+
+
+class BaseSessionStore:
+    """Server-side storage of conversation sessions keyed by Metadata.chat_id"""
+    def get(self, chat_id: str) -> Optional[Session]:
+        raise NotImplementedError
+
+    def save(self, session: Session):
+        raise NotImplementedError
+
+    def delete(self, chat_id: str):
+        raise NotImplementedError
+
+
+class InMemorySessionStore(BaseSessionStore):
+    """
+    Keeps Session objects in process memory, evicting the least recently used ones beyond max_size.
+    get returns a copy, a turn that fails before save leaves the stored session untouched and concurrent
+    turns of the same chat_id don't mutate one object.
+    """
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chat_id: str) -> Optional[Session]:
+        with self._lock:
+            session = self._sessions.get(chat_id)
+            if session is None:
+                return None
+            self._sessions.move_to_end(chat_id)
+        return session.model_copy(deep=True)
+
+    def save(self, session: Session):
+        with self._lock:
+            self._sessions[session.chat_id] = session
+            self._sessions.move_to_end(session.chat_id)
+            while len(self._sessions) > self.max_size:
+                evicted_chat_id, _ = self._sessions.popitem(last=False)
+                logger.info(f"Evicted session {evicted_chat_id} from the in-memory session store")
+
+    def delete(self, chat_id: str):
+        with self._lock:
+            self._sessions.pop(chat_id, None)
+
+
+class SQLiteSessionStore(BaseSessionStore):
+    """Persists sessions as JSON in a sqlite database so they survive restarts and can be shared by processes"""
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory_name = os.path.dirname(db_path)
+        if directory_name and not os.path.exists(directory_name):
+            os.makedirs(directory_name)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS session (chat_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, chat_id: str) -> Optional[Session]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM session WHERE chat_id = ?", (chat_id,)).fetchone()
+        if row is None:
+            return None
+        return Session.model_validate_json(row[0])
+
+    def save(self, session: Session):
+        data = session.model_dump_json()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO session (chat_id, data, updated_at) VALUES (?, ?, ?)",
+                (session.chat_id, data, time.time())
+            )
+            self._conn.commit()
+
+    def delete(self, chat_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM session WHERE chat_id = ?", (chat_id,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -2,23 +2,36 @@ import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parents[3]))
 
+import os
+import json
+import time
+import asyncio
 import logging
 import string
+from collections import deque
 
 from fastapi import FastAPI, Response
 
-from arklex.utils.slot import Verification, SlotInputList, structured_input_output, format_slotfilling_output, Slot
+from arklex.utils.slot import Verification, VerificationList, SlotInputList, structured_input_output, format_slotfilling_output, Slot
 from dotenv import load_dotenv
 load_dotenv()
 
 from arklex.utils.model_config import MODEL
-from arklex.utils.model_provider_config import PROVIDER_MAP
-from langchain_openai import ChatOpenAI
+from arklex.utils.model_provider_config import get_llm
 from pydantic_ai import Agent
 
 
 logger = logging.getLogger(__name__)
 
+# sample at temperature 0 so the NLU and slot filling results are reproducible, e.g. when they are cached
+NLU_DETERMINISTIC = os.getenv("NLU_DETERMINISTIC", "").lower() in ("1", "true", "yes")
+NLU_TEMPERATURE = 0.0 if NLU_DETERMINISTIC else 0.7
+
+# micro-batching of the NLU / slot filling service
+NLU_BATCH_WINDOW = float(os.getenv("NLU_BATCH_WINDOW", 0.01))
+NLU_MAX_BATCH_SIZE = int(os.getenv("NLU_MAX_BATCH_SIZE", 32))
+NLU_MAX_CONCURRENCY = int(os.getenv("NLU_MAX_CONCURRENCY", 16))
+
 
 class NLUModelAPI ():
     def __init__(self):
@@ -28,10 +41,10 @@ class NLUModelAPI ():
     def get_response(self, sys_prompt, model, response_format="text", note="intent detection"):
         logger.info(f"Prompt for {note}: {sys_prompt}")
         dialog_history = [{"role": "system", "content": sys_prompt}]
-        kwargs = {'model': MODEL["model_type_or_path"], 'temperature': 0.7}
+        kwargs = {'temperature': NLU_TEMPERATURE}
         
         if MODEL['llm_provider'] != 'anthropic': kwargs['n'] = 1
-        llm = PROVIDER_MAP.get(MODEL['llm_provider'], ChatOpenAI)(**kwargs)
+        llm = get_llm(**kwargs)
 
         if MODEL['llm_provider'] == 'openai':
             llm = llm.bind(response_format={"type": "json_object"} if response_format == "json" else {"type": "text"})
@@ -42,6 +55,23 @@ class NLUModelAPI ():
         
         return res.content
 
+    async def aget_response(self, sys_prompt, model, response_format="text", note="intent detection"):
+        logger.info(f"Prompt for {note}: {sys_prompt}")
+        dialog_history = [{"role": "system", "content": sys_prompt}]
+        kwargs = {'temperature': NLU_TEMPERATURE}
+        
+        if MODEL['llm_provider'] != 'anthropic': kwargs['n'] = 1
+        llm = get_llm(**kwargs)
+
+        if MODEL['llm_provider'] == 'openai':
+            llm = llm.bind(response_format={"type": "json_object"} if response_format == "json" else {"type": "text"})
+            res = await llm.ainvoke(dialog_history)
+        else:
+            messages = [("user", f"{dialog_history[0]['content']} Only choose the option letter, no explanation.")]
+            res = await llm.ainvoke(messages)
+        
+        return res.content
+
     def format_input(self, intents, chat_history_str) -> str:
         """Format input text before feeding it to the model."""
         intents_choice, definition_str, exemplars_str = "", "", ""
@@ -123,6 +153,25 @@ class NLUModelAPI ():
         response = self.get_response(
             system_prompt, model, note="intent detection"
         )
+        return self.postprocess_response(response, idx2intents_mapping)
+
+    async def apredict(
+        self,
+        text,
+        intents,
+        chat_history_str,
+        model
+    ) -> str:
+
+        system_prompt, idx2intents_mapping = self.format_input(
+            intents, chat_history_str
+        )
+        response = await self.aget_response(
+            system_prompt, model, note="intent detection"
+        )
+        return self.postprocess_response(response, idx2intents_mapping)
+
+    def postprocess_response(self, response, idx2intents_mapping) -> str:
         logger.info(f"postprocessed intent response: {response}")
         try:
             pred_intent_idx = response.split(")")[0]
@@ -151,10 +200,10 @@ class SlotFillModelAPI():
     def get_response(self, sys_prompt, format, note="slot filling"):
         logger.info(f"Prompt for {note}: {sys_prompt}")
         dialog_history = [{"role": "system", "content": sys_prompt}]
-        kwargs = {'model': MODEL["model_type_or_path"], 'temperature': 0.7}
+        kwargs = {'temperature': NLU_TEMPERATURE}
         # set number of chat completions to generate, isn't supported by Anthropic
         if MODEL['llm_provider'] != 'anthropic': kwargs['n'] = 1
-        llm = PROVIDER_MAP.get(MODEL['llm_provider'], ChatOpenAI)(**kwargs)
+        llm = get_llm(**kwargs)
         
         if MODEL['llm_provider'] == 'openai':
             llm = llm.with_structured_output(schema=format)
@@ -180,19 +229,68 @@ class SlotFillModelAPI():
             response = format(**res.tool_calls[0]['args'])
         return response
 
+    async def aget_response(self, sys_prompt, format, note="slot filling"):
+        logger.info(f"Prompt for {note}: {sys_prompt}")
+        dialog_history = [{"role": "system", "content": sys_prompt}]
+        kwargs = {'temperature': NLU_TEMPERATURE}
+        # set number of chat completions to generate, isn't supported by Anthropic
+        if MODEL['llm_provider'] != 'anthropic': kwargs['n'] = 1
+        llm = get_llm(**kwargs)
+        
+        if MODEL['llm_provider'] == 'openai':
+            llm = llm.with_structured_output(schema=format)
+            response = await llm.ainvoke(dialog_history)
+
+        elif MODEL['llm_provider']=='huggingface':
+            raise NotImplementedError("Slotfilling for Huggingface is not implemented")
+
+        elif MODEL['llm_provider'] == 'gemini':
+            agent = Agent(f"google-gla:{MODEL['model_type_or_path']}", result_type=format)
+            result = await agent.run(dialog_history[0]['content'])
+            response = result.data
+
+        #for claude 
+        else:
+            messages = [{"role": "user", "content": dialog_history[0]['content']}]
+            llm = llm.bind_tools([format])
+            res = await llm.ainvoke(messages)
+            response = format(**res.tool_calls[0]['args'])
+        return response
+
     # endpoint for slot filling
     def predict(
         self,
         slots: list[Slot],
         input: str,
-        type: str = "chat"
+        type: str = "chat",
+        incremental: bool = False
     ):
         input_slots, output_slots = structured_input_output(slots)
         system_prompt = self.format_input(input_slots, input, type)
         response = self.get_response(system_prompt, output_slots, note="slot filling")
-        filled_slots = format_slotfilling_output(slots, response)
+        filled_slots = format_slotfilling_output(slots, response, incremental)
         logger.info(f"Updated dialogue states: {filled_slots}")
         return filled_slots
+
+    async def apredict(
+        self,
+        slots: list[Slot],
+        input: str,
+        type: str = "chat",
+        incremental: bool = False
+    ):
+        input_slots, output_slots = structured_input_output(slots)
+        system_prompt = self.format_input(input_slots, input, type)
+        response = await self.aget_response(system_prompt, output_slots, note="slot filling")
+        filled_slots = format_slotfilling_output(slots, response, incremental)
+        logger.info(f"Updated dialogue states: {filled_slots}")
+        return filled_slots
+
+    # System prompt for slot verification
+    def format_verification_input(self, slot: dict, chat_history_str) -> str:
+        reformat_slot = {key: value for key, value in slot.items() if key in ["name", "type", "value", "enum", "description", "required"]}
+        system_prompt = f"Given the conversation, definition and extracted value of each dialog state, decide whether the following dialog states values need further verification from the user. Verification is needed for expressions which may cause confusion. If it is an accurate information extracted, no verification is needed. If there is a list of enum value, which means the value has to be chosen from the enum list. Only Return boolean value: True or False. \nDialogue Statues:\n{reformat_slot}\nConversation:\n{chat_history_str}\n\n"
+        return system_prompt
     
     # endpoint for slot verification
     def verify(
@@ -200,11 +298,63 @@ class SlotFillModelAPI():
         slot: dict,
         chat_history_str,
     ) -> Verification:
-        reformat_slot = {key: value for key, value in slot.items() if key in ["name", "type", "value", "enum", "description", "required"]}
-        system_prompt = f"Given the conversation, definition and extracted value of each dialog state, decide whether the following dialog states values need further verification from the user. Verification is needed for expressions which may cause confusion. If it is an accurate information extracted, no verification is needed. If there is a list of enum value, which means the value has to be chosen from the enum list. Only Return boolean value: True or False. \nDialogue Statues:\n{reformat_slot}\nConversation:\n{chat_history_str}\n\n"
+        system_prompt = self.format_verification_input(slot, chat_history_str)
         response = self.get_response(
             system_prompt, format=Verification, note="slot verification"
         )
+        return self.postprocess_verification(response)
+
+    async def averify(
+        self,
+        slot: dict,
+        chat_history_str,
+    ) -> Verification:
+        system_prompt = self.format_verification_input(slot, chat_history_str)
+        response = await self.aget_response(
+            system_prompt, format=Verification, note="slot verification"
+        )
+        return self.postprocess_verification(response)
+
+    # System prompt for verifying several slots at once
+    def format_batch_verification_input(self, slots: list[dict], chat_history_str) -> str:
+        reformat_slots = [{key: value for key, value in slot.items() if key in ["name", "type", "value", "enum", "description", "required"]} for slot in slots]
+        system_prompt = f"Given the conversation, definition and extracted value of each dialog state, decide for each of the following dialog states whether its value needs further verification from the user. Verification is needed for expressions which may cause confusion. If it is an accurate information extracted, no verification is needed. If there is a list of enum value, which means the value has to be chosen from the enum list. Return one result for every dialog state with its name, the thought and a boolean value: True or False. \nDialogue Statues:\n{reformat_slots}\nConversation:\n{chat_history_str}\n\n"
+        return system_prompt
+
+    # endpoint for batched slot verification, checks all the slots in one call
+    def verify_batch(
+        self,
+        slots: list[dict],
+        chat_history_str,
+    ) -> list[Verification]:
+        system_prompt = self.format_batch_verification_input(slots, chat_history_str)
+        response = self.get_response(
+            system_prompt, format=VerificationList, note="batch slot verification"
+        )
+        return self.postprocess_batch_verification(slots, response)
+
+    async def averify_batch(
+        self,
+        slots: list[dict],
+        chat_history_str,
+    ) -> list[Verification]:
+        system_prompt = self.format_batch_verification_input(slots, chat_history_str)
+        response = await self.aget_response(
+            system_prompt, format=VerificationList, note="batch slot verification"
+        )
+        return self.postprocess_batch_verification(slots, response)
+
+    def postprocess_batch_verification(self, slots: list[dict], response) -> list[Verification]:
+        verifications = {item.name: item for item in response.verification_list} if response else {}
+        results = []
+        for slot in slots:
+            verification = verifications.get(slot["name"])
+            results.append(self.postprocess_verification(
+                Verification(verification_needed=verification.verification_needed, thought=verification.thought) if verification else None
+            ))
+        return results
+
+    def postprocess_verification(self, response) -> Verification:
         if not response: # no need to verification, we want to make sure it is really confident that we need to ask the question again
             logger.info(f"Failed to verify dialogue states")
             return Verification(verification_needed=False, thought="No need to verify")
@@ -212,30 +362,212 @@ class SlotFillModelAPI():
         return response
 
 
+class EndpointMetrics:
+    """Request, batch, queue depth and latency counters of one endpoint"""
+    def __init__(self, max_samples: int = 1000):
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.in_flight = 0
+        self.latencies = deque(maxlen=max_samples)
+
+    def snapshot(self) -> dict:
+        latencies = sorted(self.latencies)
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "batches": self.batches,
+            "avg_batch_size": self.batched_requests / self.batches if self.batches else 0.0,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "in_flight": self.in_flight,
+            "latency_p50": percentile(0.5),
+            "latency_p99": percentile(0.99),
+        }
+
+
+class MicroBatcher:
+    """
+    Collects the requests of an endpoint that arrive within a small time window and hands them to handle_batch together.
+    Batches are dispatched without waiting for the previous ones, the provider concurrency is bounded by llm_semaphore.
+    """
+    def __init__(self, handle_batch, window: float = NLU_BATCH_WINDOW, max_batch_size: int = NLU_MAX_BATCH_SIZE):
+        self.handle_batch = handle_batch
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.metrics = EndpointMetrics()
+        self._queue = None
+        self._worker = None
+
+    async def submit(self, data: dict):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        start_time = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        self.metrics.requests += 1
+        self.metrics.queue_depth += 1
+        self.metrics.max_queue_depth = max(self.metrics.max_queue_depth, self.metrics.queue_depth)
+        await self._queue.put((data, future))
+        try:
+            return await future
+        finally:
+            self.metrics.latencies.append(time.perf_counter() - start_time)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.metrics.queue_depth -= len(batch)
+            asyncio.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        self.metrics.batches += 1
+        self.metrics.batched_requests += len(batch)
+        self.metrics.in_flight += len(batch)
+        try:
+            results = await self.handle_batch([data for data, _ in batch])
+            # handle_batch returns the exception of a failed request in its place, only that caller gets it
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    logger.error(f"Error when handling a batched request: {result}")
+                    self.metrics.errors += 1
+                    if not future.done():
+                        future.set_exception(result)
+                elif not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            logger.error(f"Error when handling a batch of {len(batch)} requests: {e}")
+            self.metrics.errors += len(batch)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self.metrics.in_flight -= len(batch)
+
+
 app = FastAPI()
 nlu_api = NLUModelAPI()
 slotfilling_api = SlotFillModelAPI()
+llm_semaphore = asyncio.Semaphore(NLU_MAX_CONCURRENCY)
+
+
+def _request_key(data: dict) -> str:
+    return json.dumps(data, sort_keys=True, default=str)
+
+
+async def _dedup_gather(batch: list[dict], handle) -> list:
+    """Run handle once per distinct request of the batch, identical requests share the result or the exception"""
+    unique = {}
+    for data in batch:
+        unique.setdefault(_request_key(data), data)
+    keys = list(unique)
+    results = await asyncio.gather(*[handle(unique[key]) for key in keys], return_exceptions=True)
+    results = dict(zip(keys, results))
+    return [results[_request_key(data)] for data in batch]
+
+
+async def _predict_intent(data: dict):
+    async with llm_semaphore:
+        return await nlu_api.apredict(**data)
+
+
+async def _predict_slots(data: dict):
+    slots = [Slot.model_validate(slot) for slot in data["slots"]]
+    async with llm_semaphore:
+        return await slotfilling_api.apredict(**{**data, "slots": slots})
+
+
+async def _verify_slots(chat_history_str: str, slots: list[dict]) -> list[Verification]:
+    async with llm_semaphore:
+        if len(slots) == 1:
+            return [await slotfilling_api.averify(slots[0], chat_history_str)]
+        return await slotfilling_api.averify_batch(slots, chat_history_str)
+
+
+async def handle_nlu_batch(batch: list[dict]) -> list:
+    return await _dedup_gather(batch, _predict_intent)
+
+
+async def handle_slotfill_batch(batch: list[dict]) -> list:
+    return await _dedup_gather(batch, _predict_slots)
+
+
+async def handle_verify_batch(batch: list[dict]) -> list:
+    """Slots verified against the same conversation are checked together in one call"""
+    groups = {}
+    for data in batch:
+        slots = groups.setdefault(data["chat_history_str"], {})
+        slots.setdefault(_request_key(data["slot"]), data["slot"])
+    group_results = await asyncio.gather(
+        *[_verify_slots(chat_history_str, list(slots.values())) for chat_history_str, slots in groups.items()],
+        return_exceptions=True
+    )
+    results = {}
+    for (chat_history_str, slots), verifications in zip(groups.items(), group_results):
+        if isinstance(verifications, BaseException):
+            # a failed group only fails the requests of its own conversation
+            verifications = [verifications] * len(slots)
+        for key, verification in zip(slots, verifications):
+            results[(chat_history_str, key)] = verification
+    return [results[(data["chat_history_str"], _request_key(data["slot"]))] for data in batch]
+
+
+nlu_batcher = MicroBatcher(handle_nlu_batch)
+slotfill_batcher = MicroBatcher(handle_slotfill_batch)
+verify_batcher = MicroBatcher(handle_verify_batch)
 
 
 @app.post("/nlu/predict")
-def predict(data: dict, res: Response):
+async def predict(data: dict, res: Response):
     logger.info(f"Received data: {data}")
-    pred_intent = nlu_api.predict(**data)
+    pred_intent = await nlu_batcher.submit(data)
 
     logger.info(f"pred_intent: {pred_intent}")
     return {"intent": pred_intent}
 
 @app.post("/slotfill/predict")
-def predict(data: dict, res: Response):
+async def predict(data: dict, res: Response):
     logger.info(f"Received data: {data}")
-    results = slotfilling_api.predict(**data)
+    results = await slotfill_batcher.submit(data)
     logger.info(f"pred_slots: {results}")
     return results
 
 @app.post("/slotfill/verify")
-def verify(data: dict, res: Response):
+async def verify(data: dict, res: Response):
     logger.info(f"Received data: {data}")
-    verify_needed = slotfilling_api.verify(**data)
+    verify_needed = await verify_batcher.submit(data)
 
     logger.info(f"verify_needed: {verify_needed}")
-    return verify_needed
\ No newline at end of file
+    return verify_needed
+
+@app.post("/slotfill/verify_batch")
+async def verify_batch(data: dict, res: Response):
+    logger.info(f"Received data: {data}")
+    async with llm_semaphore:
+        verifications = await slotfilling_api.averify_batch(**data)
+
+    logger.info(f"verifications: {verifications}")
+    return verifications
+
+@app.get("/metrics")
+def metrics():
+    return {
+        "nlu/predict": nlu_batcher.metrics.snapshot(),
+        "slotfill/predict": slotfill_batcher.metrics.snapshot(),
+        "slotfill/verify": verify_batcher.metrics.snapshot(),
+    }
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+NLU_CONNECT_TIMEOUT = float(os.getenv("NLU_CONNECT_TIMEOUT", 3))
+NLU_READ_TIMEOUT = float(os.getenv("NLU_READ_TIMEOUT", 30))
+NLU_MAX_RETRIES = int(os.getenv("NLU_MAX_RETRIES", 2))
+NLU_RETRY_BACKOFF = float(os.getenv("NLU_RETRY_BACKOFF", 0.2))
+NLU_POOL_SIZE = int(os.getenv("NLU_POOL_SIZE", 20))
+NLU_BREAKER_THRESHOLD = int(os.getenv("NLU_BREAKER_THRESHOLD", 5))
+NLU_BREAKER_COOLDOWN = float(os.getenv("NLU_BREAKER_COOLDOWN", 30))
+
+
+class RemoteCallError(Exception):
+    """The remote NLU / slot filling server could not answer the request"""
+
+
+class CircuitOpenError(RemoteCallError):
+    """The remote server failed repeatedly, calls are skipped until the cooldown is over"""
+
+
+class CircuitBreaker:
+    """
+    Closed until threshold calls in a row fail, then open for cooldown seconds. After the cooldown it is half open,
+    a single probe call is let through while the other callers keep failing fast until the probe succeeds.
+    """
+    def __init__(self, threshold: int = NLU_BREAKER_THRESHOLD, cooldown: float = NLU_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started_at = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.cooldown:
+                return False
+            # a probe that never reported back doesn't keep the circuit open forever
+            if self.probe_started_at is not None and now - self.probe_started_at < self.cooldown:
+                return False
+            self.probe_started_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("Remote NLU server answered the probe call, close the circuit")
+            self.failures = 0
+            self.opened_at = None
+            self.probe_started_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.error(f"Remote NLU server failed {self.failures} times in a row, open the circuit for {self.cooldown}s")
+                self.opened_at = time.monotonic()
+                self.probe_started_at = None
+
+
+def _to_jsonable(obj):
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    return str(obj)
+
+
+class RemoteClient:
+    """
+    Shared client of the remote NLU and slot filling servers: pooled keep-alive connections, connect/read timeouts,
+    retries with jittered exponential backoff on connection errors and 5xx, and a circuit breaker per server.
+    Callers fall back to the in-process model APIs when a RemoteCallError is raised.
+    """
+    def __init__(self, connect_timeout: float = NLU_CONNECT_TIMEOUT, read_timeout: float = NLU_READ_TIMEOUT,
+                 max_retries: int = NLU_MAX_RETRIES, backoff: float = NLU_RETRY_BACKOFF, pool_size: int = NLU_POOL_SIZE):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # event loop -> httpx.AsyncClient, dropped with their loop
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def _breaker(self, url: str) -> CircuitBreaker:
+        server = urlsplit(url).netloc
+        with self._lock:
+            if server not in self._breakers:
+                self._breakers[server] = CircuitBreaker()
+            return self._breakers[server]
+
+    def _async_client(self) -> httpx.AsyncClient:
+        # httpx clients are bound to the event loop they are used in
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(
+                    timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                    limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+                )
+                self._async_clients[loop] = client
+        return client
+
+    async def aclose(self):
+        """Close the async client of the running event loop, call it before the loop shuts down"""
+        with self._lock:
+            client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def close(self):
+        self.session.close()
+
+    def _delay(self, attempt: int) -> float:
+        return self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def _parse(self, url: str, status_code: int, response_json, breaker: CircuitBreaker):
+        """Return (retryable failure, result)"""
+        if status_code >= 500:
+            return True, None
+        # the server answered, a client error is not a sign of an unhealthy server
+        breaker.record_success()
+        if status_code >= 400:
+            raise RemoteCallError(f"{url} returned {status_code}")
+        return False, response_json()
+
+    def post(self, url: str, data: dict):
+        breaker = self._breaker(url)
+        if not breaker.allow():
+            raise CircuitOpenError(f"circuit open for {url}")
+        body = json.dumps(data, default=_to_jsonable)
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self._delay(attempt - 1))
+            try:
+                response = self.session.post(url, data=body, headers={"Content-Type": "application/json"},
+                                             timeout=(self.connect_timeout, self.read_timeout))
+                failed, result = self._parse(url, response.status_code, response.json, breaker)
+                if not failed:
+                    return result
+                error = f"{url} returned {response.status_code}"
+            except (requests.RequestException, ValueError) as e:
+                error = str(e)
+            logger.warning(f"Remote call to {url} failed (attempt {attempt + 1}): {error}")
+        breaker.record_failure()
+        raise RemoteCallError(error)
+
+    async def apost(self, url: str, data: dict):
+        breaker = self._breaker(url)
+        if not breaker.allow():
+            raise CircuitOpenError(f"circuit open for {url}")
+        body = json.dumps(data, default=_to_jsonable)
+        client = self._async_client()
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self._delay(attempt - 1))
+            try:
+                response = await client.post(url, content=body, headers={"Content-Type": "application/json"})
+                failed, result = self._parse(url, response.status_code, response.json, breaker)
+                if not failed:
+                    return result
+                error = f"{url} returned {response.status_code}"
+            except (httpx.HTTPError, ValueError) as e:
+                error = str(e)
+            logger.warning(f"Remote call to {url} failed (attempt {attempt + 1}): {error}")
+        breaker.record_failure()
+        raise RemoteCallError(error)
+
+
+remote_client = RemoteClient()
@@ -0,0 +1,130 @@
+import re
+import math
+import logging
+import threading
+from collections import Counter
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+
+logger = logging.getLogger(__name__)
+
+
+class CharNgramVectorizer:
+    """TF-IDF vectorizer over character n-grams, the rows it returns are l2 normalized"""
+    def __init__(self, ngram_range: Tuple[int, int] = (2, 4)):
+        self.ngram_range = ngram_range
+        self.vocabulary = {}
+        self.idf = None
+
+    def _ngrams(self, text: str):
+        text = " " + re.sub(r"\s+", " ", text.lower()).strip() + " "
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            for i in range(len(text) - n + 1):
+                yield text[i:i + n]
+
+    def fit(self, texts: Iterable[str]):
+        document_frequency = Counter()
+        num_docs = 0
+        for text in texts:
+            document_frequency.update(set(self._ngrams(text)))
+            num_docs += 1
+        self.vocabulary = {ngram: idx for idx, ngram in enumerate(document_frequency)}
+        self.idf = np.array(
+            [math.log((1 + num_docs) / (1 + document_frequency[ngram])) + 1 for ngram in self.vocabulary],
+            dtype=np.float32
+        )
+        return self
+
+    def transform(self, texts: Iterable[str]) -> sparse.csr_matrix:
+        rows, cols, values = [], [], []
+        num_rows = 0
+        for row, text in enumerate(texts):
+            counts = Counter(ngram for ngram in self._ngrams(text) if ngram in self.vocabulary)
+            if counts:
+                idx = np.fromiter((self.vocabulary[ngram] for ngram in counts), dtype=np.int64, count=len(counts))
+                weights = (1 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))) * self.idf[idx]
+                weights /= np.linalg.norm(weights)
+                rows.extend([row] * len(idx))
+                cols.extend(idx.tolist())
+                values.extend(weights.tolist())
+            num_rows = row + 1
+        return sparse.csr_matrix((values, (rows, cols)), shape=(num_rows, len(self.vocabulary)), dtype=np.float32)
+
+
+class IntentClassifier:
+    """
+    Local intent classifier trained from the intent names, definitions and sample utterances on the taskgraph edges.
+    Each candidate option is scored by the best cosine similarity between the user utterance and the option's texts,
+    the prediction is only used when the best score and its margin over the runner-up pass the thresholds.
+    """
+    def __init__(self, edges: Iterable[dict], threshold: float = 0.8, margin: float = 0.1):
+        self.threshold = threshold
+        self.margin = margin
+        self.vectorizer = CharNgramVectorizer()
+        self._option_vectors = {}
+        self._lock = threading.Lock()
+        self.num_predictions = 0
+        self.num_bypassed = 0
+        self.num_fallbacks = 0
+        self.num_disagreements = 0
+
+        option_texts = [self._option_texts(edge.get("intent", ""), edge) for edge in edges]
+        self.vectorizer.fit(text for texts in option_texts for text in texts)
+        for texts in option_texts:
+            self._get_option_vectors(texts)
+
+    @staticmethod
+    def _option_texts(intent: str, edge_info: dict) -> Tuple[str, ...]:
+        attribute = edge_info.get("attribute", {})
+        texts = [intent, attribute.get("definition", ""), *attribute.get("sample_utterances", [])]
+        return tuple(text for text in texts if text)
+
+    def _get_option_vectors(self, texts: Tuple[str, ...]) -> sparse.csr_matrix:
+        vectors = self._option_vectors.get(texts)
+        if vectors is None:
+            vectors = self.vectorizer.transform(texts)
+            self._option_vectors[texts] = vectors
+        return vectors
+
+    def predict(self, text: str, intents: dict) -> Tuple[Optional[str], float, Optional[str]]:
+        """
+        Score the candidate intents in the same naming scheme as the NLU prompt (intent or intent__<idx>)
+        Return (confident prediction or None, best score, best guess)
+        """
+        query = self.vectorizer.transform([text])
+        if not query.nnz:
+            return None, 0.0, None
+        scores = []
+        for intent_k, intent_v in intents.items():
+            for idx, edge_info in enumerate(intent_v):
+                texts = self._option_texts(intent_k, edge_info)
+                intent_name = intent_k if len(intent_v) == 1 else f"{intent_k}__<{idx}>"
+                score = float((self._get_option_vectors(texts) @ query.T).max()) if texts else 0.0
+                scores.append((score, intent_name))
+        if not scores:
+            return None, 0.0, None
+        scores.sort(reverse=True)
+        best_score, best_guess = scores[0]
+        runner_up = scores[1][0] if len(scores) > 1 else 0.0
+        confident = best_score >= self.threshold and best_score - runner_up >= self.margin
+        with self._lock:
+            self.num_predictions += 1
+            if confident:
+                self.num_bypassed += 1
+        return (best_guess if confident else None), best_score, best_guess
+
+    def record_fallback(self, best_guess: Optional[str], pred_intent: str):
+        """Compare the classifier's best guess with the LLM prediction on turns it didn't answer"""
+        with self._lock:
+            self.num_fallbacks += 1
+            if best_guess is not None and best_guess != pred_intent:
+                self.num_disagreements += 1
+
+    def log_stats(self):
+        logger.info(
+            f"Intent classifier bypassed the LLM on {self.num_bypassed}/{self.num_predictions} predictions, "
+            f"disagreed with the LLM on {self.num_disagreements}/{self.num_fallbacks} fallbacks"
+        )
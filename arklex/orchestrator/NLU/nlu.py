@@ -1,21 +1,164 @@
-import requests
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
 import logging
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from pydantic import BaseModel
 
 from arklex.utils.model_config import MODEL
 from arklex.utils.slot import Slot
-from arklex.orchestrator.NLU.api import nlu_api, slotfilling_api
+from arklex.utils.slot_extractors import apply_extractors
+from arklex.orchestrator.NLU.api import nlu_api, slotfilling_api, NLU_DETERMINISTIC
+from arklex.orchestrator.NLU.intent_classifier import IntentClassifier
+from arklex.orchestrator.NLU.http_client import remote_client, RemoteCallError
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# prediction cache, disabled unless NLU_CACHE_SIZE > 0
+NLU_CACHE_SIZE = int(os.getenv("NLU_CACHE_SIZE", 0))
+NLU_CACHE_TTL = float(os.getenv("NLU_CACHE_TTL", 3600))
+NLU_CACHE_HISTORY_TURNS = int(os.getenv("NLU_CACHE_HISTORY_TURNS", 4))
+NLU_CACHE_DB = os.getenv("NLU_CACHE_DB", "")
+
+
+class PredictionCache:
+    """
+    LRU + TTL cache of NLU and slot filling predictions, values are stored as JSON strings.
+    With a db_path the entries are also persisted in sqlite and read through on a memory miss,
+    expired rows are pruned at startup and then at most once per ttl on set.
+    """
+    def __init__(self, max_size: int, ttl: float, db_path: str = ""):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pruned_at = time.time()
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS prediction (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)")
+            self._conn.commit()
+            with self._lock:
+                self._prune(self._pruned_at)
+        self.hits = 0
+        self.misses = 0
+
+    def _put(self, key: str, entry):
+        # callers hold the lock
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _prune(self, now: float):
+        # callers hold the lock
+        deleted = self._conn.execute("DELETE FROM prediction WHERE created_at < ?", (now - self.ttl,)).rowcount
+        self._conn.commit()
+        self._pruned_at = now
+        if deleted:
+            logger.info(f"Pruned {deleted} expired predictions from the cache db")
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._conn is not None:
+                row = self._conn.execute("SELECT value, created_at FROM prediction WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self._put(key, entry)
+            if entry is not None and now - entry[1] > self.ttl:
+                self._entries.pop(key, None)
+                if self._conn is not None:
+                    self._conn.execute("DELETE FROM prediction WHERE key = ?", (key,))
+                    self._conn.commit()
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        logger.info(f"Prediction cache hit, hits: {self.hits}, misses: {self.misses}")
+        return json.loads(entry[0])
+
+    def set(self, key: str, value):
+        entry = (json.dumps(value), time.time())
+        with self._lock:
+            self._put(key, entry)
+            if self._conn is not None:
+                self._conn.execute("INSERT OR REPLACE INTO prediction (key, value, created_at) VALUES (?, ?, ?)", (key, *entry))
+                self._conn.commit()
+                if entry[1] - self._pruned_at > self.ttl:
+                    self._prune(entry[1])
+
+
+prediction_cache = PredictionCache(NLU_CACHE_SIZE, NLU_CACHE_TTL, NLU_CACHE_DB) if NLU_CACHE_SIZE > 0 else None
+if prediction_cache is not None and not NLU_DETERMINISTIC:
+    logger.warning("NLU prediction cache is enabled without NLU_DETERMINISTIC, cached results are samples at temperature 0.7")
+
+
+def _to_jsonable(obj):
+    if isinstance(obj, Slot):
+        # the trajectory offset is bookkeeping of the caller, it doesn't change the prediction
+        return obj.model_dump(exclude={"filled_offset"})
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    return str(obj)
+
+
+def _cache_key(kind: str, **inputs) -> str:
+    payload = json.dumps({"kind": kind, "model": MODEL, "deterministic": NLU_DETERMINISTIC, **inputs}, sort_keys=True, default=_to_jsonable)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def last_turns(chat_history_str: str, num_turns: int) -> str:
+    """Keep the last num_turns turns of a chat history formatted by format_chat_history"""
+    turns = re.split(r"\n(?=(?:user|assistant): )", chat_history_str)
+    return "\n".join(turns[-num_turns:])
+
 
 class NLU:
-    def __init__(self, url):
+    def __init__(self, url, classifier: IntentClassifier = None):
         self.url = url
+        # optional local classifier, answers directly on confident turns instead of calling the LLM
+        self.classifier = classifier
+
+    def classify(self, text:str, intents:dict):
+        """Return the local classifier's confident prediction (None otherwise) and its best guess"""
+        if self.classifier is None:
+            return None, None
+        pred_intent, score, best_guess = self.classifier.predict(text, intents)
+        if pred_intent is not None:
+            logger.info(f"Intent classifier predicted {pred_intent} with score {score}, skip the LLM")
+            self.classifier.log_stats()
+        return pred_intent, best_guess
+
+    def record_fallback(self, best_guess, pred_intent:str):
+        if self.classifier is None:
+            return
+        self.classifier.record_fallback(best_guess, pred_intent)
+        self.classifier.log_stats()
 
     def execute(self, text:str, intents:dict, chat_history_str:str) -> str:
         logger.info(f"candidates intents of NLU: {intents}")
+        cache_key = None
+        if prediction_cache is not None:
+            cache_key = _cache_key("nlu", intents=intents, chat_history=last_turns(chat_history_str, NLU_CACHE_HISTORY_TURNS))
+            pred_intent = prediction_cache.get(cache_key)
+            if pred_intent is not None:
+                logger.info(f"pred_intent from cache is {pred_intent}")
+                return pred_intent
+        pred_intent, best_guess = self.classify(text, intents)
+        if pred_intent is not None:
+            return pred_intent
         data = {
             "text": text,
             "intents": intents,
@@ -24,19 +167,58 @@ class NLU:
         }
         if self.url:
             logger.info(f"Using NLU API to predict the intent")
-            response = requests.post(self.url + "/predict", json=data)
-            if response.status_code == 200:
-                results = response.json()
+            try:
+                results = remote_client.post(self.url + "/predict", data)
                 pred_intent = results['intent']
                 logger.info(f"pred_intent is {pred_intent}")
-            else:
-                pred_intent = "others"
-                logger.error('Remote Server Error when predicting NLU')
+            except RemoteCallError as e:
+                logger.error(f'Remote Server Error when predicting NLU, use the NLU function instead: {e}')
+                pred_intent = nlu_api.predict(**data)
         else:
             logger.info(f"Using NLU function to predict the intent")
             pred_intent = nlu_api.predict(**data)
             logger.info(f"pred_intent is {pred_intent}")
 
+        if cache_key is not None:
+            prediction_cache.set(cache_key, pred_intent)
+        self.record_fallback(best_guess, pred_intent)
+        return pred_intent
+
+    async def aexecute(self, text:str, intents:dict, chat_history_str:str) -> str:
+        logger.info(f"candidates intents of NLU: {intents}")
+        cache_key = None
+        if prediction_cache is not None:
+            cache_key = _cache_key("nlu", intents=intents, chat_history=last_turns(chat_history_str, NLU_CACHE_HISTORY_TURNS))
+            pred_intent = prediction_cache.get(cache_key)
+            if pred_intent is not None:
+                logger.info(f"pred_intent from cache is {pred_intent}")
+                return pred_intent
+        pred_intent, best_guess = self.classify(text, intents)
+        if pred_intent is not None:
+            return pred_intent
+        data = {
+            "text": text,
+            "intents": intents,
+            "chat_history_str": chat_history_str,
+            "model":MODEL
+        }
+        if self.url:
+            logger.info(f"Using NLU API to predict the intent")
+            try:
+                results = await remote_client.apost(self.url + "/predict", data)
+                pred_intent = results['intent']
+                logger.info(f"pred_intent is {pred_intent}")
+            except RemoteCallError as e:
+                logger.error(f'Remote Server Error when predicting NLU, use the NLU function instead: {e}')
+                pred_intent = await nlu_api.apredict(**data)
+        else:
+            logger.info(f"Using NLU function to predict the intent")
+            pred_intent = await nlu_api.apredict(**data)
+            logger.info(f"pred_intent is {pred_intent}")
+
+        if cache_key is not None:
+            prediction_cache.set(cache_key, pred_intent)
+        self.record_fallback(best_guess, pred_intent)
         return pred_intent
     
 
@@ -52,44 +234,184 @@ class SlotFilling:
         }
         if self.url:
             logger.info(f"Using Slot Filling API to verify the slot")
-            response = requests.post(self.url + "/verify", json=data)
-            if response.status_code == 200:
-                verification_needed = response.json().get("verification_needed")
-                thought = response.json().get("thought")
+            try:
+                results = remote_client.post(self.url + "/verify", data)
+                verification_needed = results.get("verification_needed")
+                thought = results.get("thought")
                 logger.info(f"verify_needed is {verification_needed}")
-            else:
-                verification_needed = False
-                thought = "No need to verify"
-                logger.error('Remote Server Error when verifying Slot Filling')
-        else:
-            logger.info(f"Using Slot Filling function to verify the slot")
-            verification = slotfilling_api.verify(**data)
-            verification_needed = verification.verification_needed
-            thought = verification.thought
-            logger.info(f"verify_needed is {verification_needed}")
+                return verification_needed, thought
+            except RemoteCallError as e:
+                logger.error(f'Remote Server Error when verifying Slot Filling, use the Slot Filling function instead: {e}')
+        logger.info(f"Using Slot Filling function to verify the slot")
+        verification = slotfilling_api.verify(**data)
+        verification_needed = verification.verification_needed
+        thought = verification.thought
+        logger.info(f"verify_needed is {verification_needed}")
 
         return verification_needed, thought
 
-    def execute(self, slots:list[Slot], context:str, type: str = "chat") -> list[Slot]:
+    async def averify_needed(self, slot: Slot, chat_history_str:str) -> Slot:
+        logger.info(f"verify slot: {slot}")
+        data = {
+            "slot": slot.model_dump(),
+            "chat_history_str": chat_history_str
+        }
+        if self.url:
+            logger.info(f"Using Slot Filling API to verify the slot")
+            try:
+                results = await remote_client.apost(self.url + "/verify", data)
+                verification_needed = results.get("verification_needed")
+                thought = results.get("thought")
+                logger.info(f"verify_needed is {verification_needed}")
+                return verification_needed, thought
+            except RemoteCallError as e:
+                logger.error(f'Remote Server Error when verifying Slot Filling, use the Slot Filling function instead: {e}')
+        logger.info(f"Using Slot Filling function to verify the slot")
+        verification = await slotfilling_api.averify(**data)
+        verification_needed = verification.verification_needed
+        thought = verification.thought
+        logger.info(f"verify_needed is {verification_needed}")
+
+        return verification_needed, thought
+
+    def verify_needed_batch(self, slots: list[Slot], chat_history_str:str) -> list[tuple[bool, str]]:
+        """
+        Verify several slots with one request, returns (verification_needed, thought) per slot.
+        Falls back to verifying the slots concurrently one by one if the batched call fails.
+        """
+        if len(slots) <= 1:
+            return [self.verify_needed(slot, chat_history_str) for slot in slots]
+        logger.info(f"verify slots: {slots}")
+        data = {
+            "slots": [slot.model_dump() for slot in slots],
+            "chat_history_str": chat_history_str
+        }
+        try:
+            if self.url:
+                logger.info(f"Using Slot Filling API to verify the slots")
+                results = remote_client.post(self.url + "/verify_batch", data)
+                verifications = [(item.get("verification_needed"), item.get("thought")) for item in results]
+            else:
+                logger.info(f"Using Slot Filling function to verify the slots")
+                verifications = [(item.verification_needed, item.thought) for item in slotfilling_api.verify_batch(**data)]
+            logger.info(f"verify_needed of the slots are {verifications}")
+            return verifications
+        except Exception as e:
+            logger.error(f"Batch slot verification failed, verify the slots one by one: {e}")
+        with ThreadPoolExecutor(max_workers=len(slots)) as executor:
+            return list(executor.map(lambda slot: self.verify_needed(slot, chat_history_str), slots))
+
+    async def averify_needed_batch(self, slots: list[Slot], chat_history_str:str) -> list[tuple[bool, str]]:
+        if len(slots) <= 1:
+            return [await self.averify_needed(slot, chat_history_str) for slot in slots]
+        logger.info(f"verify slots: {slots}")
+        data = {
+            "slots": [slot.model_dump() for slot in slots],
+            "chat_history_str": chat_history_str
+        }
+        try:
+            if self.url:
+                logger.info(f"Using Slot Filling API to verify the slots")
+                results = await remote_client.apost(self.url + "/verify_batch", data)
+                verifications = [(item.get("verification_needed"), item.get("thought")) for item in results]
+            else:
+                logger.info(f"Using Slot Filling function to verify the slots")
+                verifications = [(item.verification_needed, item.thought) for item in await slotfilling_api.averify_batch(**data)]
+            logger.info(f"verify_needed of the slots are {verifications}")
+            return verifications
+        except Exception as e:
+            logger.error(f"Batch slot verification failed, verify the slots one by one: {e}")
+        return list(await asyncio.gather(*[self.averify_needed(slot, chat_history_str) for slot in slots]))
+
+    def execute(self, slots:list[Slot], context:str, type: str = "chat", incremental: bool = False) -> list[Slot]:
+        """incremental: context only holds the dialogue since the slots were last filled, see Tool._slotfilling_context"""
         logger.info(f"extracted slots: {slots}")
         if not slots: return []
+        # rule based extractors run first, the model only fills the slots they couldn't
+        model_slots = apply_extractors(slots, context) if type == "chat" else slots
+        if not model_slots:
+            logger.info(f"all slots are extracted by rules: {slots}")
+            return slots
+        pred_slots = self._predict(model_slots, context, type, incremental)
+        if len(model_slots) == len(slots):
+            return pred_slots
+        # merge the model predictions back in the original order
+        pred_slots = {slot.name: slot for slot in pred_slots}
+        return [pred_slots.get(slot.name, slot) for slot in slots]
+
+    def _predict(self, slots:list[Slot], context:str, type: str = "chat", incremental: bool = False) -> list[Slot]:
+        cache_key = None
+        if prediction_cache is not None:
+            cache_key = _cache_key("slotfilling", slots=slots, context=context, type=type, incremental=incremental)
+            cached_slots = prediction_cache.get(cache_key)
+            if cached_slots is not None:
+                logger.info(f"pred_slots from cache is {cached_slots}")
+                return [Slot.model_validate(slot) for slot in cached_slots]
         
         data = {
             "slots": slots,
             "input": context,
-            "type": type
+            "type": type,
+            "incremental": incremental
         }
         if self.url:
             logger.info(f"Using Slot Filling API to predict the slots")
-            response = requests.post(self.url + "/predict", json=data)
-            if response.status_code == 200:
-                pred_slots = response.json()
+            try:
+                pred_slots = [Slot.model_validate(slot) for slot in remote_client.post(self.url + "/predict", data)]
                 logger.info(f"pred_slots is {pred_slots}")
-            else:
-                pred_slots = slots
-                logger.error('Remote Server Error when predicting Slot Filling')
+            except RemoteCallError as e:
+                logger.error(f'Remote Server Error when predicting Slot Filling, use the Slot Filling function instead: {e}')
+                pred_slots = slotfilling_api.predict(**data)
         else:
             logger.info(f"Using Slot Filling function to predict the slots")
             pred_slots = slotfilling_api.predict(**data)
             logger.info(f"pred_slots is {pred_slots}")
+        if cache_key is not None:
+            prediction_cache.set(cache_key, [_to_jsonable(slot) if isinstance(slot, BaseModel) else slot for slot in pred_slots])
+        return pred_slots
+
+    async def aexecute(self, slots:list[Slot], context:str, type: str = "chat", incremental: bool = False) -> list[Slot]:
+        logger.info(f"extracted slots: {slots}")
+        if not slots: return []
+        # rule based extractors run first, the model only fills the slots they couldn't
+        model_slots = apply_extractors(slots, context) if type == "chat" else slots
+        if not model_slots:
+            logger.info(f"all slots are extracted by rules: {slots}")
+            return slots
+        pred_slots = await self._apredict(model_slots, context, type, incremental)
+        if len(model_slots) == len(slots):
+            return pred_slots
+        # merge the model predictions back in the original order
+        pred_slots = {slot.name: slot for slot in pred_slots}
+        return [pred_slots.get(slot.name, slot) for slot in slots]
+
+    async def _apredict(self, slots:list[Slot], context:str, type: str = "chat", incremental: bool = False) -> list[Slot]:
+        cache_key = None
+        if prediction_cache is not None:
+            cache_key = _cache_key("slotfilling", slots=slots, context=context, type=type, incremental=incremental)
+            cached_slots = prediction_cache.get(cache_key)
+            if cached_slots is not None:
+                logger.info(f"pred_slots from cache is {cached_slots}")
+                return [Slot.model_validate(slot) for slot in cached_slots]
+        
+        data = {
+            "slots": slots,
+            "input": context,
+            "type": type,
+            "incremental": incremental
+        }
+        if self.url:
+            logger.info(f"Using Slot Filling API to predict the slots")
+            try:
+                pred_slots = [Slot.model_validate(slot) for slot in await remote_client.apost(self.url + "/predict", data)]
+                logger.info(f"pred_slots is {pred_slots}")
+            except RemoteCallError as e:
+                logger.error(f'Remote Server Error when predicting Slot Filling, use the Slot Filling function instead: {e}')
+                pred_slots = await slotfilling_api.apredict(**data)
+        else:
+            logger.info(f"Using Slot Filling function to predict the slots")
+            pred_slots = await slotfilling_api.apredict(**data)
+            logger.info(f"pred_slots is {pred_slots}")
+        if cache_key is not None:
+            prediction_cache.set(cache_key, [_to_jsonable(slot) if isinstance(slot, BaseModel) else slot for slot in pred_slots])
         return pred_slots
@@ -1,8 +1,11 @@
+import os
+import asyncio
 import json
 import time
+import threading
 from typing import Any, Dict
 import logging
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Tuple, Optional
 import copy
 import janus
 from dotenv import load_dotenv
@@ -19,6 +22,7 @@ from arklex.utils.graph_state import (ConvoMessage, NodeInfo, OrchestratorMessag
                                       BotConfig, Params, ResourceRecord,
                                       OrchestratorResp, NodeTypeEnum)
 from arklex.utils.utils import format_chat_history
+from arklex.memory.session_store import BaseSessionStore, Session
 
 
 load_dotenv()
@@ -26,30 +30,67 @@ logger = logging.getLogger(__name__)
 
 INFO_WORKERS = ["planner", "MessageWorker", "RagMsgWorker", "HITLWorkerChatFlag"]
 
+
+class TaskGraphRegistry:
+    """
+    Process-wide cache of parsed taskgraph configs and compiled TaskGraph instances.
+    Entries are keyed by the absolute taskgraph path and reloaded when the file's mtime or size changes.
+    The cached TaskGraph is shared across requests, all per-conversation state lives in Params.
+    """
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, config_path: str) -> Tuple[dict, TaskGraph]:
+        config_path = os.path.abspath(config_path)
+        stat = os.stat(config_path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(config_path)
+            if entry and entry[0] == version:
+                return entry[1], entry[2]
+            logger.info(f"Loading taskgraph from {config_path}")
+            with open(config_path) as f:
+                product_kwargs = json.load(f)
+            task_graph = TaskGraph("taskgraph", product_kwargs)
+            self._entries[config_path] = (version, product_kwargs, task_graph)
+        return product_kwargs, task_graph
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+task_graph_registry = TaskGraphRegistry()
+
+
 class AgentOrg:
-    def __init__(self, config, env: Env, **kwargs):
+    def __init__(self, config, env: Env, session_store: Optional[BaseSessionStore] = None, **kwargs):
         if isinstance(config, dict):
             self.product_kwargs = config
+            self.task_graph = TaskGraph("taskgraph", self.product_kwargs)
         else:
-            self.product_kwargs = json.load(open(config))
+            self.product_kwargs, self.task_graph = task_graph_registry.get(config)
         self.user_prefix = "user"
         self.worker_prefix = "assistant"
         self.environment_prefix = "tool"
         self.__eos_token = "\n"
-        self.task_graph = TaskGraph("taskgraph", self.product_kwargs)
         self.env = env
+        self.session_store = session_store
 
     
     def init_params(self, inputs) -> Tuple[str, str, Params, MessageState]:
         text = inputs["text"]
-        chat_history = inputs["chat_history"]
-        input_params = inputs["parameters"]
+        chat_history = inputs.get("chat_history", [])
+        input_params = inputs.get("parameters")
 
         # Create base params with defaults
         params = Params()
         
-        # Update with any provided values
-        if input_params:
+        # Update with any provided values, params loaded from the session store are used as is
+        if isinstance(input_params, Params):
+            params = input_params
+        elif input_params:
             params = Params.model_validate(input_params)
         
         # Update specific fields
@@ -122,22 +163,16 @@ class AgentOrg:
             # Direct response
             if node_attribute.get("value", "").strip():
                 params = self.post_process_node(node_info, params)
-                return_response = OrchestratorResp(
-                    answer=node_attribute["value"],
-                    parameters=params.model_dump()
-                )
+                return_response = OrchestratorResp(answer=node_attribute["value"])
                 # Multiple choice list
                 if node_info.type == NodeTypeEnum.MULTIPLE_CHOICE.value and node_attribute.get("choice_list", []):
                     return_response.choice_list = node_attribute["choice_list"]
                 return True, return_response, params
         return False, None, params
     
-    def perform_node(self, message_state:MessageState, node_info: NodeInfo, params: Params,
-                     text: str, chat_history_str: str,
-                     stream_type: StreamType, message_queue: janus.SyncQueue):
-        # Tool/Worker
-        node_info, params = self.handle_nested_graph_node(node_info, params)
-
+    def _prepare_message_state(self, message_state:MessageState, node_info: NodeInfo, params: Params,
+                               text: str, chat_history_str: str,
+                               stream_type: StreamType, message_queue: janus.SyncQueue):
         user_message = ConvoMessage(history=chat_history_str, message=text)
         orchestrator_message = OrchestratorMessage(message=node_info.attributes["value"], attribute=node_info.attributes)
     
@@ -163,10 +198,33 @@ class AgentOrg:
         message_state.metadata = params.metadata
         message_state.is_stream = True if stream_type is not None else False
         message_state.message_queue = message_queue
+        return message_state, params
+
+    def perform_node(self, message_state:MessageState, node_info: NodeInfo, params: Params,
+                     text: str, chat_history_str: str,
+                     stream_type: StreamType, message_queue: janus.SyncQueue):
+        # Tool/Worker
+        node_info, params = self.handle_nested_graph_node(node_info, params)
+        message_state, params = self._prepare_message_state(message_state, node_info, params,
+                                                            text, chat_history_str,
+                                                            stream_type, message_queue)
         
         response_state, params = self.env.step(node_info.resource_id, message_state, params)
         params.memory.trajectory = response_state.trajectory
         return node_info, response_state, params
+
+    async def aperform_node(self, message_state:MessageState, node_info: NodeInfo, params: Params,
+                     text: str, chat_history_str: str,
+                     stream_type: StreamType, message_queue: janus.SyncQueue):
+        # Tool/Worker
+        node_info, params = self.handle_nested_graph_node(node_info, params)
+        message_state, params = self._prepare_message_state(message_state, node_info, params,
+                                                            text, chat_history_str,
+                                                            stream_type, message_queue)
+        
+        response_state, params = await self.env.astep(node_info.resource_id, message_state, params)
+        params.memory.trajectory = response_state.trajectory
+        return node_info, response_state, params
     
     def handle_nested_graph_node(self, node_info: NodeInfo, params: Params):
         if node_info.resource_id != NESTED_GRAPH_ID:
@@ -194,10 +252,8 @@ class AgentOrg:
         return node_info, params
         
     
-    def _get_response(self, 
-                     inputs: dict, 
-                     stream_type: StreamType = None, 
-                     message_queue: janus.SyncQueue = None) -> OrchestratorResp:
+    def init_turn(self, inputs: dict) -> Tuple[str, str, Params, MessageState, dict]:
+        """Shared start of _get_response and _aget_response"""
         text, chat_history_str, params, message_state = self.init_params(inputs)
         ##### TaskGraph Chain
         taskgraph_inputs = {
@@ -205,7 +261,68 @@ class AgentOrg:
             "chat_history_str": chat_history_str,
             "parameters": params,
             "allow_global_intent_switch": True,
+            # the TaskGraph is shared across requests, sample the initial flow for this turn
+            "initial_node": self.task_graph.get_initial_flow(),
         }
+        return text, chat_history_str, params, message_state, taskgraph_inputs
+
+    def pre_perform_node(self, node_info: NodeInfo, params: Params, taskgraph_inputs: dict,
+                         taskgraph_start_time: float) -> Tuple[bool, Optional[OrchestratorResp], Params]:
+        """
+        Bookkeeping between the taskgraph and the node execution, returns (skipped, direct response, params)
+        """
+        taskgraph_inputs["allow_global_intent_switch"] = False
+        params.metadata.timing.taskgraph = time.time() - taskgraph_start_time
+        # Check if current node can be skipped
+        can_skip = self.check_skip_node(node_info, params)
+        if can_skip:
+            params = self.post_process_node(node_info, params, {"is_skipped": True})
+            return True, None, params
+        logger.info(f"The current node info is : {node_info}")
+        
+        # handle direct node
+        is_direct_node, direct_response, params = self.handl_direct_node(node_info, params)
+        if is_direct_node:
+            return False, direct_response, params
+        return False, None, params
+
+    def post_perform_node(self, node_info: NodeInfo, params: Params, msg_counter: int) -> Tuple[bool, int, Params]:
+        """
+        Record the performed node and decide whether the turn stops, returns (stop, msg_counter, params)
+        """
+        params = self.post_process_node(node_info, params)
+        
+        # If the current node is not complete, then no need to continue to the next node
+        node_status = params.taskgraph.node_status
+        cur_node_id = params.taskgraph.curr_node
+        status = node_status.get(cur_node_id, StatusEnum.COMPLETE)
+        if status == StatusEnum.INCOMPLETE:
+            return True, msg_counter, params
+        
+        # Check current node attributes
+        if node_info.resource_name in INFO_WORKERS:
+            msg_counter += 1
+        # If the counter of message worker or counter of planner or counter of ragmsg worker == 1, break the loop
+        if msg_counter == 1:
+            return True, msg_counter, params
+        if node_info.is_leaf is True:
+            return True, msg_counter, params
+        return False, msg_counter, params
+
+    def build_response(self, message_state: MessageState, params: Params) -> OrchestratorResp:
+        # TODO: Need to reformat the RAG response from trajectory
+        # params["memory"]["tool_response"] = {}
+        # the parameters are filled by get_response, they are not serialized when the session store keeps them
+        return OrchestratorResp(
+            answer=message_state.response,
+            human_in_the_loop=params.metadata.hitl,
+        )
+
+    def _get_response(self, 
+                     inputs: dict, 
+                     stream_type: StreamType = None, 
+                     message_queue: janus.SyncQueue = None) -> Tuple[OrchestratorResp, Params]:
+        text, chat_history_str, params, message_state, taskgraph_inputs = self.init_turn(inputs)
         taskgraph_chain = RunnableLambda(self.task_graph.get_node) | RunnableLambda(self.task_graph.postprocess_node)
 
         # TODO: when planner is re-implemented, execute/break the loop based on whether the planner should be used (bot config).
@@ -216,19 +333,11 @@ class AgentOrg:
         while n_node_performed < max_n_node_performed:
             taskgraph_start_time = time.time()
             node_info, params = taskgraph_chain.invoke(taskgraph_inputs)
-            taskgraph_inputs["allow_global_intent_switch"] = False
-            params.metadata.timing.taskgraph = time.time() - taskgraph_start_time
-            # Check if current node can be skipped
-            can_skip = self.check_skip_node(node_info, params)
-            if can_skip:
-                params = self.post_process_node(node_info, params, {"is_skipped": True})
+            skipped, direct_response, params = self.pre_perform_node(node_info, params, taskgraph_inputs, taskgraph_start_time)
+            if skipped:
                 continue
-            logger.info(f"The current node info is : {node_info}")
-            
-            # handle direct node
-            is_direct_node, direct_response, params = self.handl_direct_node(node_info, params)
-            if is_direct_node:
-                return direct_response
+            if direct_response is not None:
+                return direct_response, params
             # perform node
 
             node_info, message_state, params = self.perform_node(message_state,
@@ -238,23 +347,9 @@ class AgentOrg:
                                                                     chat_history_str,
                                                                     stream_type,
                                                                     message_queue)
-            params = self.post_process_node(node_info, params)
-            
             n_node_performed += 1
-            # If the current node is not complete, then no need to continue to the next node
-            node_status = params.taskgraph.node_status
-            cur_node_id = params.taskgraph.curr_node
-            status = node_status.get(cur_node_id, StatusEnum.COMPLETE)
-            if status == StatusEnum.INCOMPLETE:
-                break
-            
-            # Check current node attributes
-            if node_info.resource_name in INFO_WORKERS:
-                msg_counter += 1
-            # If the counter of message worker or counter of planner or counter of ragmsg worker == 1, break the loop
-            if msg_counter == 1:
-                break
-            if node_info.is_leaf is True:
+            stop, msg_counter, params = self.post_perform_node(node_info, params, msg_counter)
+            if stop:
                 break
 
         if not message_state.response:
@@ -263,18 +358,95 @@ class AgentOrg:
                 message_state = ToolGenerator.context_generate(message_state)
             else:
                 message_state = ToolGenerator.stream_context_generate(message_state)
+        return self.build_response(message_state, params), params
+    
+    async def _aget_response(self, 
+                     inputs: dict, 
+                     stream_type: StreamType = None, 
+                     message_queue: janus.SyncQueue = None) -> Tuple[OrchestratorResp, Params]:
+        text, chat_history_str, params, message_state, taskgraph_inputs = self.init_turn(inputs)
+        taskgraph_chain = RunnableLambda(self.task_graph.get_node, afunc=self.task_graph.aget_node) | \
+            RunnableLambda(self.task_graph.postprocess_node, afunc=self.task_graph.apostprocess_node)
+
+        msg_counter = 0
         
-        # TODO: Need to reformat the RAG response from trajectory
-        # params["memory"]["tool_response"] = {}
-        return OrchestratorResp(
-            answer=message_state.response,
-            parameters=params.model_dump(),
-            human_in_the_loop=params.metadata.hitl,
-        )
+        n_node_performed = 0
+        max_n_node_performed = 5
+        while n_node_performed < max_n_node_performed:
+            taskgraph_start_time = time.time()
+            node_info, params = await taskgraph_chain.ainvoke(taskgraph_inputs)
+            skipped, direct_response, params = self.pre_perform_node(node_info, params, taskgraph_inputs, taskgraph_start_time)
+            if skipped:
+                continue
+            if direct_response is not None:
+                return direct_response, params
+
+            node_info, message_state, params = await self.aperform_node(message_state,
+                                                                    node_info,
+                                                                    params,
+                                                                    text,
+                                                                    chat_history_str,
+                                                                    stream_type,
+                                                                    message_queue)
+            n_node_performed += 1
+            stop, msg_counter, params = self.post_perform_node(node_info, params, msg_counter)
+            if stop:
+                break
+
+        if not message_state.response:
+            logger.info("No response, do context generation")
+            if not stream_type:
+                message_state = await ToolGenerator.acontext_generate(message_state)
+            else:
+                message_state = await ToolGenerator.astream_context_generate(message_state)
+        return self.build_response(message_state, params), params
     
+    def load_session(self, inputs: dict) -> Tuple[dict, Optional[Session]]:
+        """
+        When a session store is configured and the client sends a chat_id, the chat history and parameters are read from the store,
+        so the client only needs to send the chat_id and the new message.
+        Chat history and parameters sent by the client are only used to seed a new session.
+        """
+        chat_id = inputs.get("chat_id")
+        if self.session_store is None or not chat_id:
+            return inputs, None
+        session = self.session_store.get(chat_id)
+        if session is None:
+            logger.info(f"Creating new session for chat_id {chat_id}")
+            session = Session.new(chat_id)
+            session.chat_history = list(inputs.get("chat_history") or [])
+            if inputs.get("parameters"):
+                session.params = Params.model_validate(inputs["parameters"])
+                session.params.metadata.chat_id = chat_id
+        return {**inputs, "chat_history": session.chat_history, "parameters": session.params}, session
+
+    def save_session(self, session: Session, text: str, orchestrator_response: OrchestratorResp):
+        """Append the turn to the session and persist it, only the metadata is sent back to the client"""
+        session.chat_history.append({"role": self.user_prefix, "content": text})
+        session.chat_history.append({"role": self.worker_prefix, "content": orchestrator_response.answer})
+        self.session_store.save(session)
+        orchestrator_response.parameters = {"metadata": session.params.metadata.model_dump()}
+
     def get_response(self, 
                      inputs: dict, 
                      stream_type: StreamType = None, 
                      message_queue: janus.SyncQueue = None) -> Dict[str, Any]:
-        orchestrator_response = self._get_response(inputs, stream_type, message_queue)
+        inputs, session = self.load_session(inputs)
+        orchestrator_response, params = self._get_response(inputs, stream_type, message_queue)
+        if session is not None:
+            self.save_session(session, inputs["text"], orchestrator_response)
+        else:
+            orchestrator_response.parameters = params.model_dump()
+        return orchestrator_response.model_dump()
+
+    async def aget_response(self, 
+                     inputs: dict, 
+                     stream_type: StreamType = None, 
+                     message_queue: janus.SyncQueue = None) -> Dict[str, Any]:
+        inputs, session = await asyncio.to_thread(self.load_session, inputs)
+        orchestrator_response, params = await self._aget_response(inputs, stream_type, message_queue)
+        if session is not None:
+            await asyncio.to_thread(self.save_session, session, inputs["text"], orchestrator_response)
+        else:
+            orchestrator_response.parameters = params.model_dump()
         return orchestrator_response.model_dump()
@@ -1,17 +1,18 @@
 import copy
 import logging
 import collections
+from types import MappingProxyType
 from typing import Tuple
 
 import networkx as nx
 import numpy as np
-from langchain_openai import ChatOpenAI
 
 from arklex.env.nested_graph.nested_graph import NestedGraph
-from arklex.utils.model_provider_config import PROVIDER_MAP
+from arklex.utils.model_provider_config import get_llm
 from arklex.utils.utils import normalize, str_similarity, format_chat_history
 from arklex.utils.graph_state import NodeInfo, Params, PathNode, StatusEnum
 from arklex.orchestrator.NLU.nlu import NLU, SlotFilling
+from arklex.orchestrator.NLU.intent_classifier import IntentClassifier
 from arklex.utils.model_config import MODEL
 
 logger = logging.getLogger(__name__)
@@ -44,6 +45,47 @@ class TaskGraphBase:
         return None
 
 
+class TaskGraphIndex:
+    """
+    Read-only lookup tables compiled once from the task graph, so the per-turn code doesn't copy edge data or scan the graph.
+    The tables and the edge info they hold are shared by all conversations and must not be mutated.
+    """
+    def __init__(self, graph: nx.DiGraph, global_intents: dict, unsure_intent: dict):
+        successors = {}
+        local_intents = {}
+        none_edges = {}
+        default_node_limit = {}
+        for node, node_data in graph.nodes.data():
+            successors[node] = tuple(graph.successors(node))
+            intents = collections.defaultdict(list)
+            none_targets, none_weights = [], []
+            for u, v, data in graph.out_edges(node, data=True):
+                intent = data.get("intent")
+                if intent == "none":
+                    none_targets.append(v)
+                    none_weights.append(data.get("attribute", {}).get("weight", 1))
+                elif intent:
+                    edge_info = copy.deepcopy(data)
+                    edge_info["source_node"] = u
+                    edge_info["target_node"] = v
+                    intents[intent].append(edge_info)
+            local_intents[node] = MappingProxyType({k: tuple(v) for k, v in intents.items()})
+            none_edges[node] = (tuple(none_targets), tuple(none_weights))
+            if node_data.get("limit") is not None:
+                default_node_limit[node] = node_data["limit"]
+
+        global_intent_table = {k: tuple(v) for k, v in global_intents.items()}
+        if unsure_intent.get("intent") not in global_intent_table:
+            global_intent_table[unsure_intent.get("intent")] = (unsure_intent,)
+
+        self.successors = MappingProxyType(successors)
+        self.leaf_nodes = frozenset(node for node, succ in successors.items() if not succ)
+        self.local_intents = MappingProxyType(local_intents)
+        self.none_edges = MappingProxyType(none_edges)
+        self.global_intents = MappingProxyType(global_intent_table)
+        self.default_node_limit = MappingProxyType(default_node_limit)
+
+
 class TaskGraph(TaskGraphBase):
     def __init__(self, name: str, product_kwargs: dict):
         super().__init__(name, product_kwargs)
@@ -58,11 +100,9 @@ class TaskGraph(TaskGraphBase):
                     "sample_utterances": []
                 }
             }
-        self.initial_node = self.get_initial_flow()
-        self.model = PROVIDER_MAP.get(MODEL['llm_provider'], ChatOpenAI)(
-            model=MODEL["model_type_or_path"], timeout=30000
-        )
-        self.nluapi = NLU(self.product_kwargs.get("nluapi"))
+        self.index = TaskGraphIndex(self.graph, self.intents, self.unsure_intent)
+        self.model = get_llm(timeout=30000)
+        self.nluapi = NLU(self.product_kwargs.get("nluapi"), classifier=self.get_intent_classifier())
         self.slotfillapi = SlotFilling(self.product_kwargs.get("slotfillapi"))
 
     def create_graph(self):
@@ -74,7 +114,24 @@ class TaskGraph(TaskGraphBase):
         self.graph.add_nodes_from(nodes)
         self.graph.add_edges_from(edges)
 
+    def get_intent_classifier(self):
+        """
+        Train the optional local intent classifier from the edges, enabled by the "intent_classifier" field of the taskgraph
+        e.g. "intent_classifier": {"threshold": 0.8, "margin": 0.1}
+        """
+        config = self.product_kwargs.get("intent_classifier")
+        if not config:
+            return None
+        if not isinstance(config, dict):
+            config = {}
+        edges = [data for _, _, data in self.graph.edges.data() if data.get("intent") and data.get("intent") != "none"]
+        logger.info(f"Training intent classifier on {len(edges)} edges")
+        return IntentClassifier(edges, threshold=config.get("threshold", 0.8), margin=config.get("margin", 0.1))
+
     def get_initial_flow(self):
+        """
+        Sample the initial flow from the weighted services nodes, once per turn since the TaskGraph is shared across requests
+        """
         services_nodes = self.product_kwargs.get("services_nodes", None)
         node = None
         if services_nodes:
@@ -83,13 +140,16 @@ class TaskGraph(TaskGraphBase):
             node = np.random.choice(candidates_nodes, p=normalize(candidates_nodes_weights))
         return node
 
-    def jump_to_node(self, pred_intent, intent_idx, curr_node):
+    def jump_to_node(self, pred_intent, intent_idx, curr_node, available_global_intents=None):
         """
         Jump to a node based on the intent
+        intent_idx refers to the position in the available global intents shown to the NLU
         """
         logger.info(f"pred_intent in jump_to_node is {pred_intent}")
+        if available_global_intents is None:
+            available_global_intents = self.intents
         try:
-            candidates_nodes = [self.intents[pred_intent][intent_idx]]
+            candidates_nodes = [available_global_intents[pred_intent][intent_idx]]
             candidates_nodes_weights = [node["attribute"]["weight"] for node in candidates_nodes]
             if candidates_nodes:
                 next_node = np.random.choice([node["target_node"] for node in candidates_nodes], p=normalize(candidates_nodes_weights))
@@ -107,18 +167,10 @@ class TaskGraph(TaskGraphBase):
         """
         Get the output format (NodeInfo, Params) that get_node should return
         """
-        logger.info(f"available_intents in _get_node: {params.taskgraph.available_global_intents}")
         logger.info(f"intent in _get_node: {intent}")
         node_info = self.graph.nodes[sample_node]
         resource_name = node_info["resource"]["name"]
         resource_id = node_info["resource"]["id"]
-        if intent and intent in params.taskgraph.available_global_intents:
-            # delete the corresponding node item from the intent list
-            for item in params.taskgraph.available_global_intents.get(intent, []):
-                if item["target_node"] == sample_node:
-                    params.taskgraph.available_global_intents[intent].remove(item)
-            if not params.taskgraph.available_global_intents[intent]:
-                params.taskgraph.available_global_intents.pop(intent)
         
         params.taskgraph.curr_node = sample_node
         
@@ -128,7 +180,7 @@ class TaskGraph(TaskGraphBase):
             resource_id=resource_id,
             resource_name=resource_name,
             can_skipped=True,
-            is_leaf=len(list(self.graph.successors(sample_node))) == 0,
+            is_leaf=self.is_leaf(sample_node),
             attributes=node_info["attribute"],
             add_flow_stack=False
         )
@@ -151,6 +203,9 @@ class TaskGraph(TaskGraphBase):
                 break
         return found_pred_in_avil, real_intent, idx
 
+    def is_leaf(self, node) -> bool:
+        return node in self.index.leaf_nodes
+
     def get_current_node(self, params: Params):
         """
         Get current node
@@ -167,12 +222,9 @@ class TaskGraph(TaskGraphBase):
     def get_available_global_intents(self, params: Params):
         """
         Get available global intents
+        Global intents stay available for the whole conversation, so they are read from the compiled index instead of params
         """
-        available_global_intents = params.taskgraph.available_global_intents
-        if not available_global_intents:
-            available_global_intents = copy.deepcopy(self.intents)
-            if self.unsure_intent.get("intent") not in available_global_intents.keys():
-                available_global_intents[self.unsure_intent.get("intent")].append(self.unsure_intent)
+        available_global_intents = self.index.global_intents
         logger.info(f"Available global intents: {available_global_intents}")
         return available_global_intents
     
@@ -181,11 +233,10 @@ class TaskGraph(TaskGraphBase):
         Update the node_limit in params which will be used to check if we can skip the node or not
         """
         old_node_limit = params.taskgraph.node_limit
-        node_limit = {}
-        for node in self.graph.nodes.data():
-            limit = old_node_limit.get(node[0], node[1].get("limit")) 
-            if limit is not None:
-                node_limit[node[0]] = limit
+        node_limit = dict(self.index.default_node_limit)
+        for node, limit in old_node_limit.items():
+            if limit is not None and node in self.index.successors:
+                node_limit[node] = limit
         params.taskgraph.node_limit = node_limit
         return params
 
@@ -193,16 +244,9 @@ class TaskGraph(TaskGraphBase):
         """
         Get the local intent of a current node
         """
-        candidates_intents = collections.defaultdict(list)
-        for u, v, data in self.graph.out_edges(curr_node, data=True):
-            intent = data.get("intent")
-            if intent != "none" and data.get("intent"):
-                edge_info = copy.deepcopy(data)
-                edge_info["source_node"] = u
-                edge_info["target_node"] = v
-                candidates_intents[intent].append(edge_info)
+        candidates_intents = self.index.local_intents[curr_node]
         logger.info(f"Current local intent: {candidates_intents}")
-        return dict(candidates_intents)
+        return candidates_intents
 
     def get_last_flow_stack_node(self, params: Params) -> PathNode:
         """
@@ -232,7 +276,7 @@ class TaskGraph(TaskGraphBase):
                 resource_id = resource_id,
                 resource_name = resource_name,
                 can_skipped=False,
-                is_leaf=len(list(self.graph.successors(curr_node))) == 0,
+                is_leaf=self.is_leaf(curr_node),
                 attributes=node_info["attribute"]
             )
             return True, node_info, params
@@ -250,49 +294,67 @@ class TaskGraph(TaskGraphBase):
             return True, node_info, params
         return False, {}, params
     
-    def global_intent_prediction(self, curr_node, params: Params, available_global_intents, excluded_intents) -> Tuple[bool, str, dict, Params]:
+    def get_global_candidate_intents(self, available_global_intents, excluded_intents) -> dict:
         """
-        Do global intent prediction
+        Get the candidate intents for global intent prediction, None if only the unsure intent is available
         """
-        candidate_intents = copy.deepcopy(available_global_intents)
-        candidate_intents = {k: v for k, v in candidate_intents.items() if k not in excluded_intents}
-        pred_intent = None
+        candidate_intents = {k: v for k, v in available_global_intents.items() if k not in excluded_intents}
         # if only unsure_intent is available -> move directly to this intent
         if len(candidate_intents) == 1 and self.unsure_intent.get("intent") in candidate_intents.keys():
-            pred_intent = self.unsure_intent.get("intent")
-        else: # global intent prediction
-            # if match other intent, add flow, jump over
-            candidate_intents[self.unsure_intent.get("intent")] = \
-                candidate_intents.get(self.unsure_intent.get("intent"), [self.unsure_intent])
-            logger.info(f"Available global intents with unsure intent: {candidate_intents}")
-            
-            pred_intent = self.nluapi.execute(self.text, candidate_intents, self.chat_history_str)
-            params.taskgraph.nlu_records.append({"candidate_intents": candidate_intents, 
-                                "pred_intent": pred_intent, "no_intent": False, "global_intent": True})
-            found_pred_in_avil, pred_intent, intent_idx = self._postprocess_intent(pred_intent, available_global_intents)
-            # if found prediction and prediction is not unsure intent and current intent
-            # TODO: how to know if user want to proceed or going back to the initial node of the same global intent
-            if found_pred_in_avil and \
-                pred_intent != self.unsure_intent.get("intent") and \
-                pred_intent != params.taskgraph.curr_global_intent:
-                params.taskgraph.intent = pred_intent
-                next_node, next_intent = self.jump_to_node(pred_intent, intent_idx, curr_node)
-                logger.info(f"curr_node: {next_node}")
-                node_info, params = self._get_node(next_node, params, intent=next_intent)
-                # if current node is not a leaf node and jump to another node, then add it onto stack
-                if next_node != curr_node and list(self.graph.successors(curr_node)):
-                    node_info.add_flow_stack = True
-                params.taskgraph.curr_global_intent = pred_intent
-                return True, pred_intent, node_info, params
+            return None
+        # if match other intent, add flow, jump over
+        candidate_intents[self.unsure_intent.get("intent")] = \
+            candidate_intents.get(self.unsure_intent.get("intent"), [self.unsure_intent])
+        logger.info(f"Available global intents with unsure intent: {candidate_intents}")
+        return candidate_intents
+
+    def handle_global_intent(self, curr_node, params: Params, available_global_intents, candidate_intents, pred_intent) -> Tuple[bool, str, dict, Params]:
+        """
+        Move to the node of the predicted global intent
+        """
+        params.taskgraph.nlu_records.append({"candidate_intents": candidate_intents, 
+                            "pred_intent": pred_intent, "no_intent": False, "global_intent": True})
+        found_pred_in_avil, pred_intent, intent_idx = self._postprocess_intent(pred_intent, available_global_intents)
+        # if found prediction and prediction is not unsure intent and current intent
+        # TODO: how to know if user want to proceed or going back to the initial node of the same global intent
+        if found_pred_in_avil and \
+            pred_intent != self.unsure_intent.get("intent") and \
+            pred_intent != params.taskgraph.curr_global_intent:
+            params.taskgraph.intent = pred_intent
+            next_node, next_intent = self.jump_to_node(pred_intent, intent_idx, curr_node, available_global_intents)
+            logger.info(f"curr_node: {next_node}")
+            node_info, params = self._get_node(next_node, params, intent=next_intent)
+            # if current node is not a leaf node and jump to another node, then add it onto stack
+            if next_node != curr_node and self.index.successors[curr_node]:
+                node_info.add_flow_stack = True
+            params.taskgraph.curr_global_intent = pred_intent
+            return True, pred_intent, node_info, params
         return False, pred_intent, {}, params
+
+    def global_intent_prediction(self, curr_node, params: Params, excluded_intents, text: str, chat_history_str: str) -> Tuple[bool, str, dict, Params]:
+        """
+        Do global intent prediction
+        """
+        available_global_intents = self.get_available_global_intents(params)
+        candidate_intents = self.get_global_candidate_intents(available_global_intents, excluded_intents)
+        if candidate_intents is None:
+            return False, self.unsure_intent.get("intent"), {}, params
+        pred_intent = self.nluapi.execute(text, candidate_intents, chat_history_str)
+        return self.handle_global_intent(curr_node, params, available_global_intents, candidate_intents, pred_intent)
+
+    async def aglobal_intent_prediction(self, curr_node, params: Params, excluded_intents, text: str, chat_history_str: str) -> Tuple[bool, str, dict, Params]:
+        """
+        Do global intent prediction asynchronously
+        """
+        available_global_intents = self.get_available_global_intents(params)
+        candidate_intents = self.get_global_candidate_intents(available_global_intents, excluded_intents)
+        if candidate_intents is None:
+            return False, self.unsure_intent.get("intent"), {}, params
+        pred_intent = await self.nluapi.aexecute(text, candidate_intents, chat_history_str)
+        return self.handle_global_intent(curr_node, params, available_global_intents, candidate_intents, pred_intent)
  
     def handle_random_next_node(self, curr_node, params: Params) -> Tuple[bool, dict, Params]:
-        candidate_samples = []
-        candidates_nodes_weights = []
-        for out_edge in self.graph.out_edges(curr_node, data=True):
-            if out_edge[2]["intent"] == "none":
-                candidate_samples.append(out_edge[1])
-                candidates_nodes_weights.append(out_edge[2]["attribute"]["weight"])
+        candidate_samples, candidates_nodes_weights = self.index.none_edges[curr_node]
         if candidate_samples:
             # randomly choose one sample from candidate samples
             next_node = np.random.choice(candidate_samples, p=normalize(candidates_nodes_weights))
@@ -309,31 +371,49 @@ class TaskGraph(TaskGraphBase):
             return True, node_info, params
         return False, {}, params
     
-    def local_intent_prediction(self, curr_node, params: Params, curr_local_intents) -> Tuple[bool, dict, Params]:
+    def get_local_candidate_intents(self, curr_local_intents) -> dict:
         """
-        Do local intent prediction
+        Get the candidate intents for local intent prediction
         """
-        curr_local_intents_w_unsure = copy.deepcopy(curr_local_intents)
+        curr_local_intents_w_unsure = dict(curr_local_intents)
         curr_local_intents_w_unsure[self.unsure_intent.get("intent")] = \
             curr_local_intents_w_unsure.get(self.unsure_intent.get("intent"), [self.unsure_intent])
         logger.info(f"Check intent under current node: {curr_local_intents_w_unsure}")
-        pred_intent = self.nluapi.execute(self.text, curr_local_intents_w_unsure, self.chat_history_str)
-        params.taskgraph.nlu_records.append({"candidate_intents": curr_local_intents_w_unsure, 
+        return curr_local_intents_w_unsure
+
+    def handle_local_intent(self, curr_node, params: Params, curr_local_intents, candidate_intents, pred_intent) -> Tuple[bool, dict, Params]:
+        """
+        Move to the node of the predicted local intent
+        """
+        params.taskgraph.nlu_records.append({"candidate_intents": candidate_intents, 
                                 "pred_intent": pred_intent, "no_intent": False, "global_intent": False})
         found_pred_in_avil, pred_intent, intent_idx = self._postprocess_intent(pred_intent, curr_local_intents)
         logger.info(f"Local intent predition -> found_pred_in_avil: {found_pred_in_avil}, pred_intent: {pred_intent}")
         if found_pred_in_avil:
             params.taskgraph.intent = pred_intent
-            for edge in self.graph.out_edges(curr_node, data="intent"):
-                if edge[2] == pred_intent:
-                    next_node = edge[1]  # found intent under the current node
-                    break
+            next_node = curr_local_intents[pred_intent][0]["target_node"]  # found intent under the current node
             logger.info(f"curr_node: {next_node}")
             node_info, params = self._get_node(next_node, params, intent=pred_intent)
             if curr_node == self.start_node:
                 params.taskgraph.curr_global_intent = pred_intent
             return True, node_info, params
         return False, {}, params
+
+    def local_intent_prediction(self, curr_node, params: Params, curr_local_intents, text: str, chat_history_str: str) -> Tuple[bool, dict, Params]:
+        """
+        Do local intent prediction
+        """
+        candidate_intents = self.get_local_candidate_intents(curr_local_intents)
+        pred_intent = self.nluapi.execute(text, candidate_intents, chat_history_str)
+        return self.handle_local_intent(curr_node, params, curr_local_intents, candidate_intents, pred_intent)
+
+    async def alocal_intent_prediction(self, curr_node, params: Params, curr_local_intents, text: str, chat_history_str: str) -> Tuple[bool, dict, Params]:
+        """
+        Do local intent prediction asynchronously
+        """
+        candidate_intents = self.get_local_candidate_intents(curr_local_intents)
+        pred_intent = await self.nluapi.aexecute(text, candidate_intents, chat_history_str)
+        return self.handle_local_intent(curr_node, params, curr_local_intents, candidate_intents, pred_intent)
     
     def handle_unknown_intent(self, curr_node, params: Params) -> Tuple[dict, Params]:
         """
@@ -352,18 +432,17 @@ class TaskGraph(TaskGraphBase):
             resource_id = "planner",
             resource_name = "planner",
             can_skipped=False,
-            is_leaf=len(list(self.graph.successors(curr_node))) == 0,
+            is_leaf=self.is_leaf(curr_node),
             attributes = {"value": "", "direct": False}
         )
         return node_info, params
         
-    def handle_leaf_node(self, curr_node, params: Params):
+    def handle_leaf_node(self, curr_node, params: Params, initial_node=None):
         '''
         if leaf node, first check if it's in a nested graph
         if not in nested graph, check if we have flow stack
         '''
-        def is_leaf(node):
-            return len(list(self.graph.successors(node))) == 0
+        is_leaf = self.is_leaf
         
         # if not leaf, return directly current node
         if not is_leaf(curr_node):
@@ -381,20 +460,16 @@ class TaskGraph(TaskGraphBase):
         if last_flow_stack_node:
             curr_node = last_flow_stack_node.node_id
             params.taskgraph.curr_global_intent = last_flow_stack_node.global_intent
-        if self.initial_node:
-            curr_node = self.initial_node
+        if initial_node:
+            curr_node = initial_node
         
         return curr_node, params
 
-    def get_node(self, inputs):
+    def init_node_search(self, inputs) -> Tuple[bool, NodeInfo, Params, str, dict]:
         """
-        Get the next node
+        Shared start of get_node and aget_node, everything before the first intent prediction
         """
-        self.text = inputs["text"]
-        self.chat_history_str = inputs["chat_history_str"]
         params: Params = inputs["parameters"]
-        # boolean to check if we allow global intent switch or not.
-        allow_global_intent_switch = inputs["allow_global_intent_switch"]
         params.taskgraph.nlu_records = []
 
         curr_node, params = self.get_current_node(params)
@@ -403,64 +478,43 @@ class TaskGraph(TaskGraphBase):
         # For the multi-step nodes, directly stay at that node instead of moving to other nodes
         is_multi_step_node, node_output, params = self.handle_multi_step_node(curr_node, params)
         if is_multi_step_node:
-            return node_output, params
+            return True, node_output, params, curr_node, {}
         
-        curr_node, params = self.handle_leaf_node(curr_node, params)
+        curr_node, params = self.handle_leaf_node(curr_node, params, inputs.get("initial_node"))
         
         
         # store current node
         params.taskgraph.curr_node = curr_node
         logger.info(f"curr_node: {curr_node}")
 
-        # available global intents
-        available_global_intents = self.get_available_global_intents(params)
-        
         # update limit
         params = self.update_node_limit(params)
 
         # Get local intents of the curr_node
         curr_local_intents = self.get_local_intent(curr_node, params)
+        return False, NodeInfo(), params, curr_node, curr_local_intents
 
-        if not curr_local_intents and allow_global_intent_switch:  # no local intent under the current node
-            logger.info(f"no local intent under the current node")
-            is_global_intent_found, _, node_output, params = \
-                self.global_intent_prediction(
-                    curr_node,
-                    params,
-                    available_global_intents,
-                    {}
-                )
-            if is_global_intent_found:
-                return node_output, params
-
+    def handle_node_without_intent(self, curr_node, params: Params, curr_local_intents) -> Tuple[bool, dict, Params]:
+        """
+        Stay at an incomplete node, or follow the edges without intent when the node has no local intents
+        """
         # if current node is incompleted -> return current node
         is_incomplete_node, node_output, params = self.handle_incomplete_node(curr_node, params)
         if is_incomplete_node:
-            return node_output, params
+            return True, node_output, params
         
         # if completed and no local intents -> randomly choose one of the next connected nodes (edges with intent = None)
         if not curr_local_intents:
             logger.info(f"no local or global intent found, move to the next connected node(s)")
             has_random_next_node, node_output, params = self.handle_random_next_node(curr_node, params)
             if has_random_next_node:
-                return node_output, params
+                return True, node_output, params
+        return False, {}, params
 
-        logger.info("Finish global condition, start local intent prediction")
-        is_local_intent_found, node_output, params = self.local_intent_prediction(curr_node, params, curr_local_intents)
-        if is_local_intent_found:
-            return node_output, params
-        
-        pred_intent = None
-        if allow_global_intent_switch:
-            is_global_intent_found, pred_intent, node_output, params = \
-                    self.global_intent_prediction(
-                        curr_node,
-                        params,
-                        available_global_intents,
-                        {**curr_local_intents, **{"none": None}}
-                    )
-            if is_global_intent_found: 
-                return node_output, params
+    def handle_unmatched_intent(self, curr_node, params: Params, pred_intent) -> Tuple[NodeInfo, Params]:
+        """
+        Neither a local nor a global intent moved the conversation
+        """
         if pred_intent and pred_intent != self.unsure_intent.get("intent"): # if not unsure intent
             # If user didn't indicate all the intent of children nodes under the current node, 
             # then we could randomly choose one of Nones to continue the dialog flow
@@ -472,7 +526,80 @@ class TaskGraph(TaskGraphBase):
         # transfer to the planner to let it decide for the next step
         node_output, params = self.handle_unknown_intent(curr_node, params)
         return node_output, params
+
+    def get_node(self, inputs):
+        """
+        Get the next node
+        """
+        # text and chat history are per-request inputs, keep them off the instance so the graph can be shared
+        text = inputs["text"]
+        chat_history_str = inputs["chat_history_str"]
+        # boolean to check if we allow global intent switch or not.
+        allow_global_intent_switch = inputs["allow_global_intent_switch"]
+
+        is_node_found, node_output, params, curr_node, curr_local_intents = self.init_node_search(inputs)
+        if is_node_found:
+            return node_output, params
+
+        if not curr_local_intents and allow_global_intent_switch:  # no local intent under the current node
+            logger.info(f"no local intent under the current node")
+            is_global_intent_found, _, node_output, params = \
+                self.global_intent_prediction(curr_node, params, {}, text, chat_history_str)
+            if is_global_intent_found:
+                return node_output, params
+
+        is_node_found, node_output, params = self.handle_node_without_intent(curr_node, params, curr_local_intents)
+        if is_node_found:
+            return node_output, params
+
+        logger.info("Finish global condition, start local intent prediction")
+        is_local_intent_found, node_output, params = self.local_intent_prediction(curr_node, params, curr_local_intents, text, chat_history_str)
+        if is_local_intent_found:
+            return node_output, params
+        
+        pred_intent = None
+        if allow_global_intent_switch:
+            is_global_intent_found, pred_intent, node_output, params = \
+                    self.global_intent_prediction(curr_node, params, {**curr_local_intents, **{"none": None}}, text, chat_history_str)
+            if is_global_intent_found: 
+                return node_output, params
+        return self.handle_unmatched_intent(curr_node, params, pred_intent)
+
+    async def aget_node(self, inputs):
+        """
+        Get the next node asynchronously, same flow as get_node with the intent predictions awaited
+        """
+        text = inputs["text"]
+        chat_history_str = inputs["chat_history_str"]
+        allow_global_intent_switch = inputs["allow_global_intent_switch"]
+
+        is_node_found, node_output, params, curr_node, curr_local_intents = self.init_node_search(inputs)
+        if is_node_found:
+            return node_output, params
+
+        if not curr_local_intents and allow_global_intent_switch:
+            logger.info(f"no local intent under the current node")
+            is_global_intent_found, _, node_output, params = \
+                await self.aglobal_intent_prediction(curr_node, params, {}, text, chat_history_str)
+            if is_global_intent_found:
+                return node_output, params
+
+        is_node_found, node_output, params = self.handle_node_without_intent(curr_node, params, curr_local_intents)
+        if is_node_found:
+            return node_output, params
+
+        logger.info("Finish global condition, start local intent prediction")
+        is_local_intent_found, node_output, params = await self.alocal_intent_prediction(curr_node, params, curr_local_intents, text, chat_history_str)
+        if is_local_intent_found:
+            return node_output, params
         
+        pred_intent = None
+        if allow_global_intent_switch:
+            is_global_intent_found, pred_intent, node_output, params = \
+                    await self.aglobal_intent_prediction(curr_node, params, {**curr_local_intents, **{"none": None}}, text, chat_history_str)
+            if is_global_intent_found: 
+                return node_output, params
+        return self.handle_unmatched_intent(curr_node, params, pred_intent)
 
     def postprocess_node(self, node) -> Tuple[NodeInfo, Params]:
         node_info: NodeInfo = node[0]
@@ -486,4 +613,18 @@ class TaskGraph(TaskGraphBase):
             )
         params.taskgraph.dialog_states = dialog_states
 
-        return node_info, params
\ No newline at end of file
+        return node_info, params
+
+    async def apostprocess_node(self, node) -> Tuple[NodeInfo, Params]:
+        node_info: NodeInfo = node[0]
+        params: Params = node[1]
+        dialog_states = params.taskgraph.dialog_states
+        # update the dialog states
+        if dialog_states.get(node_info.resource_id):
+            dialog_states = await self.slotfillapi.aexecute(
+                dialog_states.get(node_info.resource_id),
+                format_chat_history(params.memory.function_calling_trajectory)
+            )
+        params.taskgraph.dialog_states = dialog_states
+
+        return node_info, params
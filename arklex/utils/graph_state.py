@@ -89,7 +89,6 @@ class Taskgraph(BaseModel):
     node_limit: Dict[str, int] = Field(default_factory=dict)
     nlu_records: List = Field(default_factory=list)
     node_status: Dict[str, StatusEnum] = Field(default_factory=dict)
-    available_global_intents: List = Field(default_factory=list)
 
 
 class Memory(BaseModel):
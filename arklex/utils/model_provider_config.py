@@ -1,3 +1,6 @@
+import json
+import threading
+
 from langchain_openai import ChatOpenAI
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_anthropic import ChatAnthropic
@@ -6,6 +9,8 @@ from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_huggingface.embeddings import HuggingFaceEmbeddings
 from langchain_huggingface import HuggingFaceEndpoint,ChatHuggingFace
 
+from arklex.utils.model_config import MODEL
+
 
 def get_huggingface_llm(model, **kwargs):
     llm = HuggingFaceEndpoint(
@@ -35,4 +40,31 @@ PROVIDER_EMBEDDING_MODELS = {
     "gemini": "models/embedding-001",
     "openai": "text-embedding-ada-002",
     "huggingface": "sentence-transformers/all-mpnet-base-v2",
-}
\ No newline at end of file
+}
+
+
+_llm_cache = {}
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm(model: str = None, llm_provider: str = None, **kwargs):
+    """
+    Return a shared chat model client for the given provider, model and settings (e.g. temperature, timeout).
+    Clients are memoized per process so their HTTP connection pools are reused across calls and threads.
+    Provider and model default to the values in MODEL at call time.
+    Settings that are not plain JSON values (e.g. callbacks) get a new client on every call.
+    """
+    llm_provider = llm_provider or MODEL["llm_provider"]
+    model = model or MODEL["model_type_or_path"]
+    try:
+        key = (llm_provider, model, json.dumps(kwargs, sort_keys=True))
+    except (TypeError, ValueError):
+        return PROVIDER_MAP.get(llm_provider, ChatOpenAI)(model=model, **kwargs)
+    llm = _llm_cache.get(key)
+    if llm is None:
+        with _llm_cache_lock:
+            llm = _llm_cache.get(key)
+            if llm is None:
+                llm = PROVIDER_MAP.get(llm_provider, ChatOpenAI)(model=model, **kwargs)
+                _llm_cache[key] = llm
+    return llm
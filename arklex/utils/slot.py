@@ -1,5 +1,6 @@
 from pydantic import BaseModel, create_model, Field
-from typing import Union, List, Dict, Type, Optional
+from typing import Any, Union, List, Dict, Type, Optional, Tuple
+from functools import lru_cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -32,6 +33,10 @@ class Slot(BaseModel):
     prompt: str = Field(default="")
     required: bool = Field(default=False)
     verified: bool = Field(default=False)
+    # length of the function calling trajectory when the slot was last filled
+    filled_offset: int = Field(default=0)
+    # optional rule based extractor, e.g. "email" or {"type": "regex", "pattern": "#W\\d{7}"}, see slot_extractors.py
+    extractor: Union[str, Dict[str, Any], None] = Field(default=None)
 
 
 class SlotInput(BaseModel):
@@ -50,6 +55,23 @@ class Verification(BaseModel):
     verification_needed: bool
 
 
+class SlotVerification(Verification):
+    name: str
+
+
+class VerificationList(BaseModel):
+    verification_list: list[SlotVerification]
+
+
+# the output models only depend on the slot names and types, cache them so pydantic doesn't rebuild the schema every call
+@lru_cache(maxsize=256)
+def slot_output_model(signature: Tuple[Tuple[str, str], ...]) -> Type[BaseModel]:
+    return create_model(
+        "DynamicSlotOutputs",
+        **{name: Optional[TypeMapping.string_to_type(type)] for name, type in signature}
+    )
+
+
 # format slots for slotfilling input and output
 def structured_input_output(slots: list[Slot]) -> tuple[SlotInputList, Type]:
     input_slots = [SlotInput(
@@ -59,17 +81,21 @@ def structured_input_output(slots: list[Slot]) -> tuple[SlotInputList, Type]:
         description=slot.description
     ) for slot in slots]
 
-    output_format = create_model(
-        "DynamicSlotOutputs",
-        **{slot.name: Optional[TypeMapping.string_to_type(slot.type)] for slot in slots}
-    )
+    output_format = slot_output_model(tuple((slot.name, slot.type) for slot in slots))
     return SlotInputList(slot_input_list=input_slots), output_format
 
 
 # format slots after slotfilling
-def format_slotfilling_output(slots: list[Slot], response) -> list[Slot]:
+def format_slotfilling_output(slots: list[Slot], response, incremental: bool = False) -> list[Slot]:
+    """incremental: the model only saw the dialogue since the last fill, no prediction keeps the value filled before"""
     logger.info(f"filled_slots: {response}")
     filled_slots = response.model_dump()
     for slot in slots:
-        slot.value = filled_slots[slot.name]
+        value = filled_slots.get(slot.name)
+        if value is None and slot.value and incremental:
+            continue
+        if value != slot.value:
+            # a changed or cleared value has to be verified again
+            slot.value = value
+            slot.verified = False
     return slots
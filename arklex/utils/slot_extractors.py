@@ -0,0 +1,146 @@
+import re
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import phonenumbers
+
+from arklex.utils.slot import Slot, TypeMapping
+from arklex.utils.utils import str_similarity
+
+logger = logging.getLogger(__name__)
+
+# name -> function(slot, text, **kwargs) returning (value, exact) or None
+SLOT_EXTRACTORS: Dict[str, Callable[..., Optional[Tuple[Any, bool]]]] = {}
+
+
+def register_extractor(name):
+    def inner(func):
+        SLOT_EXTRACTORS[name] = func
+        return func
+    return inner
+
+
+@register_extractor("regex")
+def regex_extractor(slot: Slot, text: str, pattern: str, group: int = 0, ignore_case: bool = False):
+    match = re.search(pattern, text, re.IGNORECASE if ignore_case else 0)
+    if match:
+        return match.group(group), True
+    return None
+
+
+@register_extractor("email")
+def email_extractor(slot: Slot, text: str):
+    return regex_extractor(slot, text, r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+
+
+@register_extractor("phone")
+def phone_extractor(slot: Slot, text: str, region: str = "US"):
+    for match in phonenumbers.PhoneNumberMatcher(text, region):
+        return phonenumbers.format_number(match.number, phonenumbers.PhoneNumberFormat.E164), True
+    return None
+
+
+@register_extractor("enum")
+def enum_extractor(slot: Slot, text: str, fuzzy: bool = True, threshold: float = 0.9):
+    """Exact when exactly one enum value is mentioned, otherwise an optional fuzzy match over the words of the text"""
+    if not slot.enum:
+        return None
+    lowered = text.lower()
+    mentioned = [value for value in slot.enum if value is not None and re.search(rf"\b{re.escape(str(value).lower())}\b", lowered)]
+    if len(mentioned) == 1:
+        return mentioned[0], True
+    if mentioned or not fuzzy:
+        return None
+    words = re.findall(r"\w+", lowered)
+    best_value, best_score = None, threshold
+    for value in slot.enum:
+        if value is None:
+            continue
+        size = len(str(value).split())
+        for i in range(len(words) - size + 1):
+            score = str_similarity(" ".join(words[i:i + size]), str(value).lower())
+            if score >= best_score:
+                best_value, best_score = value, score
+    if best_value is not None:
+        return best_value, False
+    return None
+
+
+DATE_FORMATS = [
+    ("%Y-%m-%d", r"\d{4}-\d{1,2}-\d{1,2}", True),
+    ("%B %d, %Y", r"[A-Za-z]+ \d{1,2}, \d{4}", True),
+    ("%b %d, %Y", r"[A-Za-z]+ \d{1,2}, \d{4}", True),
+    ("%d %B %Y", r"\d{1,2} [A-Za-z]+ \d{4}", True),
+    # day and month may be swapped in numeric dates, leave them unverified
+    ("%m/%d/%Y", r"\d{1,2}/\d{1,2}/\d{4}", False),
+]
+
+
+@register_extractor("date")
+def date_extractor(slot: Slot, text: str, output_format: str = "%Y-%m-%d"):
+    for date_format, pattern, exact in DATE_FORMATS:
+        for match in re.finditer(pattern, text):
+            try:
+                date = datetime.strptime(match.group(0), date_format)
+            except ValueError:
+                continue
+            return date.strftime(output_format), exact
+    return None
+
+
+def split_user_turns(context: str) -> list[str]:
+    """User utterances of a chat history formatted by format_chat_history, most recent first"""
+    turns = re.split(r"\n(?=(?:user|assistant|tool|system): )", context)
+    return [turn[len("user: "):] for turn in reversed(turns) if turn.startswith("user: ")]
+
+
+def _coerce(value, type_string: str):
+    slot_type = TypeMapping.string_to_type(type_string)
+    if slot_type in (int, float):
+        try:
+            return slot_type(value)
+        except (TypeError, ValueError):
+            return None
+    if slot_type is not None and getattr(slot_type, "__origin__", None) is list and not isinstance(value, list):
+        return [value]
+    return value
+
+
+def extract_slot(slot: Slot, context: str) -> Optional[Tuple[Any, bool]]:
+    """Run the extractor configured on the slot over the user turns, the most recent mention wins"""
+    config = slot.extractor
+    if not config:
+        return None
+    if isinstance(config, str):
+        config = {"type": config}
+    kwargs = {k: v for k, v in config.items() if k != "type"}
+    extractor = SLOT_EXTRACTORS.get(config.get("type"))
+    if extractor is None:
+        logger.warning(f"Unknown slot extractor {config.get('type')} for slot {slot.name}")
+        return None
+    for text in split_user_turns(context):
+        result = extractor(slot, text, **kwargs)
+        if result is not None:
+            value = _coerce(result[0], slot.type)
+            if value is not None:
+                return value, result[1]
+    return None
+
+
+def apply_extractors(slots: list[Slot], context: str) -> list[Slot]:
+    """Fill the slots the rules can extract, exact rules mark the value verified. Return the slots still left for the model"""
+    remaining = []
+    for slot in slots:
+        result = extract_slot(slot, context)
+        if result is None:
+            remaining.append(slot)
+            continue
+        value, exact = result
+        logger.info(f"Slot {slot.name} extracted by rule: {value}, exact: {exact}")
+        if value != slot.value:
+            slot.value = value
+            slot.verified = exact
+        elif exact:
+            slot.verified = True
+    return remaining
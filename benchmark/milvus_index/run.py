@@ -0,0 +1,170 @@
+"""
+Recall / latency benchmark of the Milvus ANN index types against exact FLAT search.
+
+Every index is built in its own temporary collection from the same vectors, the results of FLAT are the ground truth
+for recall@k, and the search latency is measured one query at a time like the retriever does per turn.
+
+    python benchmark/milvus_index/run.py --num-vectors 100000 --index-types HNSW IVF_FLAT IVF_PQ
+    python benchmark/milvus_index/run.py --vectors exported.npy --config '{"HNSW": {"index_type": "HNSW", "search_params": {"ef": 128}}}'
+"""
+import os
+import sys
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.append(root_dir)
+import json
+import time
+import argparse
+import logging
+
+import numpy as np
+from pymilvus import DataType, MilvusClient
+
+from arklex.env.tools.RAG.retrievers.milvus_index import IndexConfig
+
+logger = logging.getLogger(__name__)
+
+INSERT_BATCH_SIZE = 1000
+INDEX_POLL_INTERVAL = 0.5
+
+
+def synthetic_vectors(num_vectors: int, num_queries: int, dim: int, num_clusters: int, seed: int):
+    """Clustered unit vectors, closer to text embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(num_clusters, dim)).astype(np.float32)
+    def sample(n):
+        vectors = centers[rng.integers(num_clusters, size=n)] + 0.5 * rng.normal(size=(n, dim)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return sample(num_vectors), sample(num_queries)
+
+
+def load_vectors(path: str, num_queries: int, seed: int):
+    """Exported embeddings (.npy of shape (n, dim)), a random sample of them is held out as queries"""
+    vectors = np.load(path).astype(np.float32)
+    rng = np.random.default_rng(seed)
+    idx = rng.permutation(len(vectors))
+    return vectors[idx[num_queries:]], vectors[idx[:num_queries]]
+
+
+def wait_for_index(client: MilvusClient, collection_name: str, num_rows: int, timeout: float):
+    """Block until every inserted row is in the index, milvus builds it asynchronously after the flush"""
+    deadline = time.perf_counter() + timeout
+    while True:
+        index = client.describe_index(collection_name=collection_name, index_name="embedding")
+        if index.get("indexed_rows", 0) >= num_rows and index.get("pending_index_rows", 0) == 0:
+            return
+        if index.get("state") == "Failed":
+            raise RuntimeError(f"Index build of {collection_name} failed: {index.get('index_state_fail_reason')}")
+        if time.perf_counter() > deadline:
+            raise TimeoutError(f"Index of {collection_name} not built after {timeout}s: {index}")
+        time.sleep(INDEX_POLL_INTERVAL)
+
+
+def build_collection(client: MilvusClient, collection_name: str, vectors: np.ndarray, index_config: IndexConfig, index_timeout: float) -> float:
+    """Seconds from the collection creation until the index covers every vector and the collection is loaded"""
+    if client.has_collection(collection_name):
+        client.drop_collection(collection_name)
+    schema = MilvusClient.create_schema(auto_id=False)
+    schema.add_field(field_name="id", datatype=DataType.INT64, is_primary=True)
+    schema.add_field(field_name="embedding", datatype=DataType.FLOAT_VECTOR, dim=vectors.shape[1])
+    index_params = client.prepare_index_params()
+    index_params.add_index(
+        field_name="embedding",
+        index_name="embedding",
+        index_type=index_config.index_type,
+        metric_type=index_config.metric_type,
+        params=index_config.get_params(),
+    )
+    start = time.perf_counter()
+    client.create_collection(collection_name=collection_name, schema=schema, index_params=index_params)
+    for i in range(0, len(vectors), INSERT_BATCH_SIZE):
+        client.insert(
+            collection_name=collection_name,
+            data=[{"id": i + j, "embedding": vector.tolist()} for j, vector in enumerate(vectors[i:i + INSERT_BATCH_SIZE])],
+        )
+    client.flush(collection_name)
+    # searching before the build finishes would brute force the unindexed segments
+    wait_for_index(client, collection_name, len(vectors), index_timeout)
+    client.load_collection(collection_name)
+    return time.perf_counter() - start
+
+
+def search(client: MilvusClient, collection_name: str, queries: np.ndarray, top_k: int, index_config: IndexConfig):
+    search_params = {"metric_type": index_config.metric_type, "params": index_config.get_search_params()}
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        res = client.search(collection_name=collection_name, data=[query.tolist()], limit=top_k, search_params=search_params)
+        latencies.append(time.perf_counter() - start)
+        results.append([hit["id"] for hit in res[0]])
+    return results, np.array(latencies) * 1000
+
+
+def recall_at_k(ground_truth, results, top_k: int) -> float:
+    return float(np.mean([len(set(truth[:top_k]) & set(res[:top_k])) / top_k for truth, res in zip(ground_truth, results)]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uri", type=str, default=os.getenv("MILVUS_URI", "http://localhost:19530"))
+    parser.add_argument("--token", type=str, default=os.getenv("MILVUS_TOKEN", ""))
+    parser.add_argument("--vectors", type=str, default="", help="exported embeddings as .npy, synthetic vectors otherwise")
+    parser.add_argument("--num-vectors", type=int, default=50000)
+    parser.add_argument("--num-queries", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--num-clusters", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument("--index-types", type=str, nargs="+", default=["HNSW", "IVF_FLAT", "IVF_PQ"])
+    parser.add_argument("--config", type=str, default="", help="json of label -> IndexConfig fields, overrides --index-types")
+    parser.add_argument("--index-timeout", type=float, default=3600, help="seconds to wait for each index build")
+    parser.add_argument("--output", type=str, default="", help="write the results as json")
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark collections")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.vectors:
+        vectors, queries = load_vectors(args.vectors, args.num_queries, args.seed)
+    else:
+        vectors, queries = synthetic_vectors(args.num_vectors, args.num_queries, args.dim, args.num_clusters, args.seed)
+    if args.config:
+        configs = {label: IndexConfig.model_validate(value) for label, value in json.loads(args.config).items()}
+    else:
+        configs = {index_type: IndexConfig(index_type=index_type) for index_type in args.index_types}
+    configs = {"FLAT": IndexConfig(), **{label: config for label, config in configs.items() if label != "FLAT"}}
+    logger.info(f"Benchmarking {list(configs)} on {len(vectors)} vectors of dim {vectors.shape[1]} with {len(queries)} queries")
+
+    client = MilvusClient(uri=args.uri, token=args.token)
+    rows = []
+    ground_truth = None
+    try:
+        for label, index_config in configs.items():
+            collection_name = f"index_benchmark_{label.lower()}"
+            build_time = build_collection(client, collection_name, vectors, index_config, args.index_timeout)
+            results, latencies = search(client, collection_name, queries, args.top_k, index_config)
+            if ground_truth is None:
+                ground_truth = results
+            rows.append({
+                "index": label,
+                "params": index_config.get_params(),
+                "search_params": index_config.get_search_params(),
+                "build_s": round(build_time, 2),
+                f"recall@{args.top_k}": round(recall_at_k(ground_truth, results, args.top_k), 4),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+            })
+            logger.info(rows[-1])
+            if not args.keep:
+                client.drop_collection(collection_name)
+    finally:
+        client.close()
+
+    print(f"{'index':<12}{'build_s':>10}{f'recall@{args.top_k}':>12}{'p50_ms':>10}{'p99_ms':>10}  params / search params")
+    for row in rows:
+        print(f"{row['index']:<12}{row['build_s']:>10}{row[f'recall@{args.top_k}']:>12}{row['p50_ms']:>10}{row['p99_ms']:>10}  {row['params']} / {row['search_params']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
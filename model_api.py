@@ -12,36 +12,52 @@ from fastapi import FastAPI, Response
 from arklex.utils.utils import init_logger
 from arklex.env.env import Env
 from arklex.orchestrator.orchestrator import AgentOrg
+from arklex.memory.session_store import InMemorySessionStore, SQLiteSessionStore
+from arklex.orchestrator.NLU.http_client import remote_client
 from arklex.utils.model_config import MODEL
 from arklex.utils.model_provider_config import LLM_PROVIDERS
 
 
 logger = logging.getLogger(__name__)
 app = FastAPI()
+session_store = InMemorySessionStore()
 
 
-def get_api_bot_response(args, history, user_text, parameters, env):
+async def get_api_bot_response(args, history, user_text, parameters, env, chat_id=None):
     data = {"text": user_text, 'chat_history': history, 'parameters': parameters}
-    orchestrator = AgentOrg(config=os.path.join(args.input_dir, "taskgraph.json"), env=env)
-    result = orchestrator.get_response(data)
+    if chat_id:
+        data["chat_id"] = chat_id
+    orchestrator = AgentOrg(config=os.path.join(args.input_dir, "taskgraph.json"), env=env, session_store=session_store)
+    result = await orchestrator.aget_response(data)
 
     return result['answer'], result['parameters']
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    await remote_client.aclose()
+
+
 @app.post("/eval/chat")
-def predict(data: Dict):
-    history = data['history']
-    params = data['parameters']
+async def predict(data: Dict):
+    # clients with a chat_id only need to send the new message, the history and parameters are kept server side
+    chat_id = data.get('chat_id')
+    history = data.get('history', [])
+    params = data.get('parameters')
     workers = data['workers']
     tools = data['tools']
-    user_text = history[-1]['content']
+    if 'text' in data:
+        user_text = data['text']
+    else:
+        user_text = history[-1]['content']
+        history = history[:-1]
 
     env = Env(
         tools = tools,
         workers = workers,
         slotsfillapi = ""
     )
-    answer, params = get_api_bot_response(args, history[:-1], user_text, params, env)
+    answer, params = await get_api_bot_response(args, history, user_text, params, env, chat_id)
     return {"answer": answer, "parameters": params}
 
 
@@ -50,6 +66,7 @@ if __name__ == "__main__":
     parser.add_argument('--input-dir', type=str, default="./examples/test")
     parser.add_argument('--model', type=str, default=MODEL["model_type_or_path"])
     parser.add_argument( '--llm-provider',type=str,default=MODEL["llm_provider"],choices=LLM_PROVIDERS)
+    parser.add_argument('--session-db', type=str, default=None, help="Path of the sqlite session store, sessions are kept in memory if not set")
     parser.add_argument('--port', type=int, default=8000, help="Port to run the FastAPI app")
     parser.add_argument('--log-level', type=str, default="WARNING", choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
     
@@ -61,5 +78,8 @@ if __name__ == "__main__":
     log_level = getattr(logging, args.log_level.upper(), logging.WARNING)
     logger = init_logger(log_level=log_level, filename=os.path.join(os.path.dirname(__file__), "logs", "arklex.log"))
 
+    if args.session_db:
+        session_store = SQLiteSessionStore(args.session_db)
+
     #run server
     uvicorn.run(app, host="0.0.0.0", port=args.port)
\ No newline at end of file
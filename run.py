@@ -2,6 +2,7 @@ import os
 import json
 import argparse
 import time
+import uuid
 import logging
 from dotenv import load_dotenv
 from pprint import pprint
@@ -11,6 +12,7 @@ from arklex.orchestrator.orchestrator import AgentOrg
 from arklex.utils.model_config import MODEL
 from arklex.utils.model_provider_config import LLM_PROVIDERS
 from arklex.env.env import Env
+from arklex.memory.session_store import InMemorySessionStore
 
 load_dotenv()
 
@@ -20,9 +22,10 @@ def pprint_with_color(data, color_code="\033[34m"):  # Default to blue
     print("\033[0m", end="")  
 
 
-def get_api_bot_response(args, history, user_text, parameters, env):
-    data = {"text": user_text, 'chat_history': history, 'parameters': parameters}
-    orchestrator = AgentOrg(config=os.path.join(args.input_dir, "taskgraph.json"), env=env)
+def get_api_bot_response(args, chat_id, history, user_text, env, session_store):
+    # history is only used to seed the session on the first turn, afterwards it is kept in the session store
+    data = {"text": user_text, 'chat_id': chat_id, 'chat_history': history}
+    orchestrator = AgentOrg(config=os.path.join(args.input_dir, "taskgraph.json"), env=env, session_store=session_store)
     result = orchestrator.get_response(data)
 
     return result['answer'], result['parameters'], result['human_in_the_loop']
@@ -49,8 +52,9 @@ if __name__ == "__main__":
         slotsfillapi = config["slotfillapi"]
     )
         
+    session_store = InMemorySessionStore()
+    chat_id = str(uuid.uuid4())
     history = []
-    params = {}
     user_prefix = "user"
     worker_prefix = "assistant"
     for node in config['nodes']:
@@ -65,7 +69,7 @@ if __name__ == "__main__":
         if user_text.lower() == "quit":
             break
         start_time = time.time()
-        output, params, hitl = get_api_bot_response(args, history, user_text, params, env)
+        output, params, hitl = get_api_bot_response(args, chat_id, history, user_text, env, session_store)
         history.append({"role": user_prefix, "content": user_text})
         history.append({"role": worker_prefix, "content": output})
         print(f"getAPIBotResponse Time: {time.time() - start_time}")
@@ -0,0 +1,156 @@
+import asyncio
+
+import httpx
+import pytest
+import requests
+
+from arklex.orchestrator.NLU import http_client, nlu
+from arklex.orchestrator.NLU.http_client import CircuitBreaker, CircuitOpenError, RemoteCallError, RemoteClient
+from arklex.orchestrator.NLU.nlu import NLU
+
+
+URL = "http://nlu.test/predict"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(http_client.time, "monotonic", clock)
+    return clock
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+def make_client(monkeypatch, responses):
+    """RemoteClient whose requests return (or raise) the given responses in order"""
+    client = RemoteClient(max_retries=2, backoff=0)
+    calls = []
+    def post(url, **kwargs):
+        calls.append(url)
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+    monkeypatch.setattr(client.session, "post", post)
+    return client, calls
+
+
+def test_retry_on_5xx_and_connection_errors(monkeypatch):
+    client, calls = make_client(monkeypatch, [
+        FakeResponse(503),
+        requests.ConnectionError("connection refused"),
+        FakeResponse(200, {"intent": "greet"}),
+    ])
+    assert client.post(URL, {}) == {"intent": "greet"}
+    assert len(calls) == 3
+    assert client._breaker(URL).failures == 0
+
+
+def test_retries_exhausted(monkeypatch):
+    client, calls = make_client(monkeypatch, [FakeResponse(500)] * 3)
+    with pytest.raises(RemoteCallError):
+        client.post(URL, {})
+    assert len(calls) == 3
+    assert client._breaker(URL).failures == 1
+
+
+def test_4xx_raises_without_retry_or_tripping_the_breaker(monkeypatch):
+    client, calls = make_client(monkeypatch, [FakeResponse(500)] * 3 + [FakeResponse(422)])
+    breaker = client._breaker(URL)
+    breaker.threshold = 2
+    with pytest.raises(RemoteCallError):
+        client.post(URL, {})
+    assert breaker.failures == 1
+    with pytest.raises(RemoteCallError) as e:
+        client.post(URL, {})
+    assert not isinstance(e.value, CircuitOpenError)
+    assert len(calls) == 4
+    assert breaker.failures == 0
+    assert breaker.allow()
+
+
+def test_breaker_open_half_open_closed(clock):
+    breaker = CircuitBreaker(threshold=2, cooldown=30)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    clock.now += 31
+    # half open, a single probe goes through
+    assert breaker.allow()
+    assert not breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.allow()
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_the_circuit(clock):
+    breaker = CircuitBreaker(threshold=1, cooldown=30)
+    breaker.record_failure()
+    clock.now += 31
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+    clock.now += 31
+    assert breaker.allow()
+
+
+def test_open_circuit_fails_fast(monkeypatch, clock):
+    client, calls = make_client(monkeypatch, [FakeResponse(500)] * 3 + [FakeResponse(200, {"intent": "greet"})])
+    client._breaker(URL).threshold = 1
+    with pytest.raises(RemoteCallError):
+        client.post(URL, {})
+    with pytest.raises(CircuitOpenError):
+        client.post(URL, {})
+    assert len(calls) == 3
+
+    clock.now += client._breaker(URL).cooldown
+    assert client.post(URL, {}) == {"intent": "greet"}
+    assert client._breaker(URL).allow()
+
+
+def test_async_retry_and_aclose():
+    responses = [httpx.Response(502), httpx.Response(200, json={"intent": "greet"})]
+    async def run():
+        client = RemoteClient(max_retries=1, backoff=0)
+        loop = asyncio.get_running_loop()
+        client._async_clients[loop] = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: responses.pop(0)))
+        async_client = client._async_client()
+        assert await client.apost(URL, {}) == {"intent": "greet"}
+        await client.aclose()
+        assert async_client.is_closed
+        assert loop not in client._async_clients
+    asyncio.run(run())
+    assert responses == []
+
+
+def test_nlu_falls_back_to_the_local_model(monkeypatch):
+    def post(url, data):
+        raise RemoteCallError("connection refused")
+    predictions = []
+    def predict(**data):
+        predictions.append(data["text"])
+        return "greet"
+    monkeypatch.setattr(nlu.remote_client, "post", post)
+    monkeypatch.setattr(nlu.nlu_api, "predict", predict)
+    monkeypatch.setattr(nlu, "prediction_cache", None)
+    assert NLU("http://nlu.test").execute("hello", {"greet": []}, "user: hello") == "greet"
+    assert predictions == ["hello"]
@@ -0,0 +1,36 @@
+import pytest
+
+from arklex.utils import model_provider_config
+from arklex.utils.model_provider_config import get_llm
+
+
+class FakeChat:
+    def __init__(self, model, **kwargs):
+        self.model = model
+        self.kwargs = kwargs
+
+
+@pytest.fixture(autouse=True)
+def fake_provider(monkeypatch):
+    monkeypatch.setitem(model_provider_config.PROVIDER_MAP, "fake", FakeChat)
+    monkeypatch.setattr(model_provider_config, "_llm_cache", {})
+
+
+def test_same_settings_share_a_client():
+    llm = get_llm(model="m", llm_provider="fake", temperature=0.1, timeout=30)
+    assert get_llm(model="m", llm_provider="fake", timeout=30, temperature=0.1) is llm
+    assert get_llm(model="m", llm_provider="fake", temperature=0.2, timeout=30) is not llm
+
+
+def test_nested_json_settings_are_memoized():
+    llm = get_llm(model="m", llm_provider="fake", model_kwargs={"top_p": 0.9, "stop": ["\n"]})
+    assert llm.kwargs == {"model_kwargs": {"top_p": 0.9, "stop": ["\n"]}}
+    assert get_llm(model="m", llm_provider="fake", model_kwargs={"stop": ["\n"], "top_p": 0.9}) is llm
+
+
+def test_non_json_settings_are_not_memoized():
+    callbacks = [object()]
+    llm = get_llm(model="m", llm_provider="fake", callbacks=callbacks)
+    assert llm.kwargs["callbacks"] is callbacks
+    assert get_llm(model="m", llm_provider="fake", callbacks=callbacks) is not llm
+    assert model_provider_config._llm_cache == {}
@@ -0,0 +1,67 @@
+import pytest
+
+from arklex.orchestrator.NLU import nlu
+from arklex.orchestrator.NLU.nlu import PredictionCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(nlu.time, "time", clock)
+    return clock
+
+
+def count_rows(cache):
+    return cache._conn.execute("SELECT COUNT(*) FROM prediction").fetchone()[0]
+
+
+def test_lru_eviction(clock):
+    cache = PredictionCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_expiry(clock):
+    cache = PredictionCache(max_size=2, ttl=60)
+    cache.set("a", {"intent": "greet"})
+    clock.now += 61
+    assert cache.get("a") is None
+
+
+def test_db_read_through_is_bounded(clock, tmp_path):
+    db_path = str(tmp_path / "prediction.db")
+    writer = PredictionCache(max_size=10, ttl=60, db_path=db_path)
+    for i in range(5):
+        writer.set(str(i), i)
+
+    reader = PredictionCache(max_size=2, ttl=60, db_path=db_path)
+    assert [reader.get(str(i)) for i in range(5)] == list(range(5))
+    assert len(reader._entries) == 2
+
+
+def test_expired_rows_are_pruned(clock, tmp_path):
+    db_path = str(tmp_path / "prediction.db")
+    cache = PredictionCache(max_size=10, ttl=60, db_path=db_path)
+    cache.set("old", 1)
+    clock.now += 30
+    cache.set("new", 2)
+    clock.now += 40
+    # the first set after a ttl prunes the rows older than the ttl
+    cache.set("newer", 3)
+    assert count_rows(cache) == 2
+
+    clock.now += 61
+    assert count_rows(PredictionCache(max_size=10, ttl=60, db_path=db_path)) == 0
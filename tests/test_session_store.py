@@ -0,0 +1,101 @@
+import json
+import os
+
+import pytest
+
+from arklex.memory.session_store import InMemorySessionStore, Session, SQLiteSessionStore
+from arklex.orchestrator.orchestrator import AgentOrg
+from arklex.utils.graph_state import OrchestratorResp, Params
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        yield InMemorySessionStore()
+    else:
+        store = SQLiteSessionStore(str(tmp_path / "sessions" / "session.db"))
+        yield store
+        store.close()
+
+
+def test_round_trip(store):
+    assert store.get("c1") is None
+    session = Session.new("c1")
+    session.chat_history.append({"role": "user", "content": "hi"})
+    session.params.metadata.turn_id = 3
+    session.params.taskgraph.curr_node = "1"
+    store.save(session)
+
+    loaded = store.get("c1")
+    assert loaded == session
+    assert loaded.params.metadata.chat_id == "c1"
+
+    store.delete("c1")
+    assert store.get("c1") is None
+
+
+def test_get_returns_a_copy(store):
+    store.save(Session.new("c1"))
+    session = store.get("c1")
+    session.chat_history.append({"role": "user", "content": "hi"})
+    session.params.metadata.turn_id += 1
+    session.params.memory.trajectory.append([])
+
+    stored = store.get("c1")
+    assert stored.chat_history == []
+    assert stored.params.metadata.turn_id == 0
+    assert stored.params.memory.trajectory == []
+
+
+def test_in_memory_lru_eviction():
+    store = InMemorySessionStore(max_size=2)
+    store.save(Session.new("a"))
+    store.save(Session.new("b"))
+    # a is now the most recently used session
+    store.get("a")
+    store.save(Session.new("c"))
+    assert store.get("b") is None
+    assert store.get("a") is not None
+    assert store.get("c") is not None
+
+
+@pytest.fixture
+def orchestrator(monkeypatch):
+    with open(os.path.join(os.path.dirname(__file__), "data", "message_worker_taskgraph.json")) as f:
+        config = json.load(f)
+    orchestrator = AgentOrg(config=config, env=None, session_store=InMemorySessionStore())
+
+    def _get_response(inputs, stream_type=None, message_queue=None):
+        params = inputs.get("parameters")
+        params = params if isinstance(params, Params) else Params.model_validate(params or {})
+        params.metadata.turn_id += 1
+        params.memory.trajectory.append([])
+        return OrchestratorResp(answer=f"echo {inputs['text']}"), params
+
+    monkeypatch.setattr(orchestrator, "_get_response", _get_response)
+    return orchestrator
+
+
+def test_chat_id_returns_only_metadata(orchestrator):
+    response = orchestrator.get_response({"text": "hi", "chat_id": "c1"})
+    assert response["answer"] == "echo hi"
+    assert list(response["parameters"]) == ["metadata"]
+    assert response["parameters"]["metadata"]["chat_id"] == "c1"
+    assert response["parameters"]["metadata"]["turn_id"] == 1
+
+    # the history and parameters come from the store, the client only sends the chat_id
+    response = orchestrator.get_response({"text": "again", "chat_id": "c1"})
+    assert response["parameters"]["metadata"]["turn_id"] == 2
+    session = orchestrator.session_store.get("c1")
+    assert [message["content"] for message in session.chat_history] == ["hi", "echo hi", "again", "echo again"]
+    assert len(session.params.memory.trajectory) == 2
+
+
+def test_without_chat_id_returns_full_params(orchestrator):
+    response = orchestrator.get_response({"text": "hi", "chat_history": [], "parameters": None})
+    assert set(response["parameters"]) == set(Params.model_fields)
+    assert response["parameters"]["metadata"]["turn_id"] == 1
+
+    response = orchestrator.get_response({"text": "again", "chat_history": [], "parameters": response["parameters"]})
+    assert response["parameters"]["metadata"]["turn_id"] == 2
+    assert len(response["parameters"]["memory"]["trajectory"]) == 2
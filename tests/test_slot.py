@@ -0,0 +1,21 @@
+from arklex.utils.slot import Slot, format_slotfilling_output, slot_output_model
+
+
+def fill(slots, incremental, **values):
+    response = slot_output_model(tuple((slot.name, slot.type) for slot in slots))(**values)
+    return {slot.name: (slot.value, slot.verified) for slot in format_slotfilling_output(slots, response, incremental)}
+
+
+def test_incremental_fill_keeps_previous_values():
+    slots = [Slot(name="order_id", value="#W1", verified=True), Slot(name="email")]
+    assert fill(slots, True, order_id=None, email="a@b.com") == {"order_id": ("#W1", True), "email": ("a@b.com", False)}
+
+
+def test_full_fill_clears_missing_values():
+    slots = [Slot(name="order_id", value="#W1", verified=True)]
+    assert fill(slots, False, order_id=None) == {"order_id": (None, False)}
+
+
+def test_changed_value_is_verified_again():
+    slots = [Slot(name="order_id", value="#W1", verified=True), Slot(name="email", value="a@b.com", verified=True)]
+    assert fill(slots, True, order_id="#W2", email="a@b.com") == {"order_id": ("#W2", False), "email": ("a@b.com", True)}
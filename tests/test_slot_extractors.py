@@ -0,0 +1,78 @@
+from arklex.utils.slot import Slot
+from arklex.utils.slot_extractors import _coerce, apply_extractors, extract_slot, split_user_turns
+
+
+CONTEXT = "assistant: How can I help?\nuser: my order is #W1111111\nassistant: Anything else?\nuser: sorry, it is #W2222222"
+
+
+def test_split_user_turns_most_recent_first():
+    assert split_user_turns(CONTEXT) == ["sorry, it is #W2222222", "my order is #W1111111"]
+
+
+def test_most_recent_user_turn_wins():
+    slot = Slot(name="order_id", extractor={"type": "regex", "pattern": r"#W\d{7}"})
+    assert extract_slot(slot, CONTEXT) == ("#W2222222", True)
+
+
+def test_assistant_turns_are_ignored():
+    slot = Slot(name="email", extractor="email")
+    assert extract_slot(slot, "assistant: write to help@example.com\nuser: ok") is None
+
+
+def test_coerce_int():
+    assert _coerce("3", "int") == 3
+    assert _coerce("three", "int") is None
+
+
+def test_coerce_list():
+    assert _coerce("a", "list[str]") == ["a"]
+    assert _coerce(["a", "b"], "list[str]") == ["a", "b"]
+
+
+def test_coerce_failure_falls_through_to_older_turns():
+    slot = Slot(name="quantity", type="int", extractor={"type": "regex", "pattern": r"\d+|many"})
+    assert extract_slot(slot, "user: 2 please\nassistant: ok\nuser: many") == (2, True)
+
+
+def test_enum_exact_match_is_verified():
+    slot = Slot(name="size", enum=["small", "large"], extractor="enum")
+    remaining = apply_extractors([slot], "user: the large one")
+    assert remaining == []
+    assert slot.value == "large"
+    assert slot.verified
+
+
+def test_enum_fuzzy_match_is_not_verified():
+    slot = Slot(name="size", enum=["small", "medium"], extractor={"type": "enum", "threshold": 0.8})
+    apply_extractors([slot], "user: the mediun one")
+    assert slot.value == "medium"
+    assert not slot.verified
+
+
+def test_enum_ambiguous_mention_is_left_to_the_model():
+    slot = Slot(name="size", enum=["small", "large"], extractor="enum")
+    assert apply_extractors([slot], "user: small or large, not sure") == [slot]
+    assert slot.value is None
+
+
+def test_enum_without_values():
+    slot = Slot(name="size", enum=[], extractor="enum")
+    assert extract_slot(slot, "user: large") is None
+
+
+def test_iso_date_is_verified():
+    slot = Slot(name="date", extractor="date")
+    assert extract_slot(slot, "user: on 2025-03-04") == ("2025-03-04", True)
+
+
+def test_numeric_date_is_not_verified():
+    slot = Slot(name="date", extractor="date")
+    apply_extractors([slot], "user: on 03/04/2025")
+    assert slot.value == "2025-03-04"
+    assert not slot.verified
+
+
+def test_unknown_extractor_type():
+    slot = Slot(name="order_id", extractor={"type": "barcode"})
+    assert extract_slot(slot, CONTEXT) is None
+    assert apply_extractors([slot], CONTEXT) == [slot]
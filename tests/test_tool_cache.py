@@ -0,0 +1,145 @@
+import pytest
+
+from arklex.env.tools import tools as tools_module
+from arklex.env.tools import tool_cache as tool_cache_module
+from arklex.env.tools.tool_cache import CachePolicy, ToolResultCache
+from arklex.env.tools.tools import Tool
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(tool_cache_module.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = ToolResultCache()
+    monkeypatch.setattr(tools_module, "tool_cache", cache)
+    monkeypatch.setattr(tools_module, "TOOL_CACHE_ENABLED", True)
+    return cache
+
+
+def make_tool(func, name="get_order", cache=None, invalidates=None):
+    slots = [{"name": "order_id", "type": "str", "description": "order id", "prompt": "", "required": True}]
+    return Tool(func, name, "", slots, [], False, cache, invalidates)
+
+
+def test_ttl_expiry(clock):
+    cache = ToolResultCache()
+    policy = CachePolicy(ttl=10)
+    cache.set("tool", "key", "response", policy, {})
+    clock.now += 9
+    assert cache.get("tool", "key") == (True, "response")
+    clock.now += 2
+    assert cache.get("tool", "key") == (False, None)
+    assert cache.stats()["tool"]["size"] == 0
+
+
+def test_lru_eviction_at_max_entries(clock):
+    cache = ToolResultCache()
+    policy = CachePolicy(max_entries=2)
+    cache.set("tool", "a", 1, policy, {})
+    cache.set("tool", "b", 2, policy, {})
+    # a is now the most recently used entry
+    assert cache.get("tool", "a") == (True, 1)
+    cache.set("tool", "c", 3, policy, {})
+    assert cache.get("tool", "b") == (False, None)
+    assert cache.get("tool", "a") == (True, 1)
+    assert cache.get("tool", "c") == (True, 3)
+
+
+def test_conversation_scope_keys_on_chat_id():
+    policy = CachePolicy(scope="conversation")
+    kwargs = {"order_id": "1"}
+    assert ToolResultCache.make_key("tool", policy, kwargs, {}, None) is None
+    assert ToolResultCache.make_key("tool", policy, kwargs, {}, "chat-1") != ToolResultCache.make_key("tool", policy, kwargs, {}, "chat-2")
+
+
+def test_global_scope_ignores_chat_id():
+    policy = CachePolicy(scope="global")
+    kwargs = {"order_id": "1"}
+    key = ToolResultCache.make_key("tool", policy, kwargs, {}, None)
+    assert key is not None
+    assert key == ToolResultCache.make_key("tool", policy, kwargs, {}, "chat-1")
+
+
+def test_fixed_args_are_part_of_the_key():
+    policy = CachePolicy(scope="global")
+    kwargs = {"order_id": "1"}
+    assert ToolResultCache.make_key("tool", policy, kwargs, {"shop": "a"}, None) != ToolResultCache.make_key("tool", policy, kwargs, {"shop": "b"}, None)
+
+
+def test_key_fields_restrict_the_key():
+    policy = CachePolicy(scope="global", key_fields=["order_id"])
+    assert ToolResultCache.make_key("tool", policy, {"order_id": "1", "note": "a"}, {}, None) == ToolResultCache.make_key("tool", policy, {"order_id": "1", "note": "b"}, {}, None)
+
+
+def test_invalidate_drops_matching_entity_tags():
+    cache = ToolResultCache()
+    policy = CachePolicy(entities={"order": "order_ids"})
+    cache.set("tool", "a", "A", policy, {"order_ids": ["1", "2"]})
+    cache.set("tool", "b", "B", policy, {"order_ids": ["3"]})
+    cache.invalidate({"order": "order_id"}, {"order_id": "2"})
+    assert cache.get("tool", "a") == (False, None)
+    assert cache.get("tool", "b") == (True, "B")
+
+
+def test_invalidate_entity_type_drops_every_entry():
+    cache = ToolResultCache()
+    cache.set("user_tool", "a", "A", CachePolicy(entities={"user": "user_id"}), {"user_id": "1"})
+    cache.set("user_tool", "b", "B", CachePolicy(entities={"user": "user_id"}), {"user_id": "2"})
+    cache.set("order_tool", "c", "C", CachePolicy(entities={"order": "order_id"}), {"order_id": "1"})
+    cache.invalidate({"user": None}, {})
+    assert cache.get("user_tool", "a") == (False, None)
+    assert cache.get("user_tool", "b") == (False, None)
+    assert cache.get("order_tool", "c") == (True, "C")
+
+
+def test_call_func_reuses_cached_response(cache):
+    calls = []
+    def get_order(order_id):
+        calls.append(order_id)
+        return f"order {order_id}"
+    tool = make_tool(get_order, cache={"scope": "conversation"})
+    assert tool._call_func({"order_id": "1"}, "chat-1") == ({"order_id": "1"}, "order 1", True)
+    assert tool._call_func({"order_id": "1"}, "chat-1") == ({"order_id": "1"}, "order 1", True)
+    assert calls == ["1"]
+    # another conversation misses
+    tool._call_func({"order_id": "1"}, "chat-2")
+    assert calls == ["1", "1"]
+
+
+def test_call_func_does_not_cache_failures(cache):
+    calls = []
+    def get_order(order_id):
+        calls.append(order_id)
+        raise ValueError("shop is down")
+    tool = make_tool(get_order, cache={"scope": "global"})
+    assert tool._call_func({"order_id": "1"}, None) == ({"order_id": "1"}, "shop is down", False)
+    tool._call_func({"order_id": "1"}, None)
+    assert calls == ["1", "1"]
+    assert cache.stats()["get_order"]["size"] == 0
+
+
+def test_successful_mutation_invalidates(cache):
+    get_tool = make_tool(lambda order_id: f"order {order_id}", cache={"scope": "global", "entities": {"order": "order_id"}})
+    get_tool._call_func({"order_id": "1"}, None)
+    assert cache.stats()["get_order"]["size"] == 1
+
+    def cancel_order(order_id):
+        raise ValueError("not cancellable")
+    make_tool(cancel_order, name="cancel_order", invalidates={"order": "order_id"})._call_func({"order_id": "1"}, None)
+    assert cache.stats()["get_order"]["size"] == 1
+
+    make_tool(lambda order_id: "cancelled", name="cancel_order", invalidates={"order": "order_id"})._call_func({"order_id": "1"}, None)
+    assert cache.stats()["get_order"]["size"] == 0